@@ -0,0 +1,43 @@
+# gunicorn.conf.py
+# gunicorn lo lee desde el directorio de trabajo: `gunicorn` (sin argumentos).
+#
+# Los workers comparten estado solo a través de settings.CACHES (throttling
+# por plan, versiones de cache e HTML del catálogo): tabla de BD
+# (`python manage.py createcachetable` en cada deploy) o Redis con
+# REDIS_URL. El arranque falla si el cache es local a cada proceso o falta
+# la tabla.
+#
+# El canal SSE (/api/branches/<id>/stream/) no se sirve desde aquí: va al
+# proceso ASGI de gunicorn_stream.conf.py (ver su cabecera para Nginx). Si
+# llega a estos workers, cada conexión ocupa un worker y se corta tras
+# STREAM_WSGI_MAX_SECONDS.
+
+import os
+
+wsgi_app = 'temucosoft_drf.wsgi:application'
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+
+# Django se carga una vez en el master: TemucosoftAppConfig.ready() compila
+# plantillas, URLs y serializers y los workers lo heredan al hacer fork.
+os.environ.setdefault('TEMUCOSOFT_WARMUP', '1')
+preload_app = True
+
+
+def on_starting(server):
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'temucosoft_drf.settings')
+    django.setup()
+    from temucosoft_app.cache_backends import check_shared_cache
+    from temucosoft_app.realtime import check_multiprocess_backend
+    check_shared_cache()
+    if workers > 1:
+        # Una venta en un worker debe llegar a los suscriptores de los demás.
+        check_multiprocess_backend()
+
+
+def post_fork(server, worker):
+    # Por worker: conexiones propias y caches en memoria (ver temucosoft_app/warmup.py).
+    from temucosoft_app.warmup import PROCESS_STAGES, warm_up
+    timings = warm_up(PROCESS_STAGES)
+    server.log.info(f"Worker {worker.pid} precalentado: "
+                    + ', '.join(f"{stage} {ms:.0f} ms" for stage, (_, ms) in timings.items()))
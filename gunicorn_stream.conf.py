@@ -0,0 +1,34 @@
+# gunicorn_stream.conf.py
+# Proceso ASGI para el canal SSE (/api/branches/<id>/stream/):
+#   gunicorn -c gunicorn_stream.conf.py
+# Requiere `pip install uvicorn uvicorn-worker`. Un worker asíncrono sostiene
+# miles de suscriptores inactivos; el resto de la app sigue en los workers
+# WSGI de gunicorn.conf.py. En Nginx, antes del location general:
+#
+#   location ~ ^/api/branches/\d+/stream/$ {
+#       proxy_pass http://127.0.0.1:8001;
+#       proxy_http_version 1.1;
+#       proxy_buffering off;
+#       proxy_read_timeout 1h;
+#   }
+#
+# Los eventos se publican en otros procesos (ventas y compras en los workers
+# WSGI, trabajos en run_workers): REALTIME_BACKEND debe ser
+# PostgresNotifyBackend, y el arranque falla si no lo es.
+
+import os
+
+wsgi_app = 'temucosoft_drf.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+bind = os.environ.get('GUNICORN_STREAM_BIND', '127.0.0.1:8001')
+workers = int(os.environ.get('GUNICORN_STREAM_WORKERS', 1))
+# Las conexiones SSE son largas: el timeout solo vigila que el worker responda.
+graceful_timeout = 5
+
+
+def on_starting(server):
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'temucosoft_drf.settings')
+    django.setup()
+    from temucosoft_app.realtime import check_multiprocess_backend
+    check_multiprocess_backend()
@@ -1,3 +1,377 @@
+"""
+Admin de Django preparado para tablas grandes.
+
+- EstimatedCountPaginator: en PostgreSQL usa pg_class.reltuples (sin
+  filtros) o la estimación del planner (con filtros) en vez de COUNT(*),
+  salvo que la tabla sea pequeña.
+- list_select_related cubre los FK que usan los __str__ (p. ej.
+  Branch -> Company, Inventory -> Product/Branch).
+- FK con autocomplete o raw_id: nunca se cargan todas las opciones.
+- Los usuarios staff que no son superusuarios solo ven su compañía, sus
+  FK solo ofrecen filas de ella y no pueden guardar objetos ajenos.
+"""
+import json
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import (
+    Subscription, Company, CustomUser, TenantUsage, Product, ProductPriceHistory, Branch, BranchSequence, Supplier, Inventory,
+    Purchase, PurchaseItem, StockTransfer, StockTransferItem, Sale, Order, CartItem,
+    InventoryValuationSnapshot, OutboxEvent, Job, SlowQuery
+)
+from .pricing import price_change_context
+from .tenancy import TENANT_SCOPES, tenant_filter
+
+# Bajo este tamaño estimado se usa el COUNT(*) exacto.
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimated_count(queryset):
+    """Cantidad estimada de filas en PostgreSQL, o None si no hay estimación disponible."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            # Una tabla particionada no tiene filas propias (reltuples = -1):
+            # se suman las particiones hoja. Si alguna nunca se analizó, no hay estimación.
+            cursor.execute(
+                """
+                WITH RECURSIVE tree(oid) AS (
+                    SELECT %s::regclass::oid
+                    UNION ALL
+                    SELECT i.inhrelid FROM pg_inherits i JOIN tree t ON i.inhparent = t.oid
+                )
+                SELECT SUM(c.reltuples)::bigint, COUNT(*) FILTER (WHERE c.reltuples < 0)
+                FROM pg_class c JOIN tree t ON c.oid = t.oid
+                WHERE c.relkind <> 'p'
+                """,
+                [queryset.model._meta.db_table],
+            )
+            total, unanalyzed = cursor.fetchone()
+            return total if total is not None and not unanalyzed else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_THRESHOLD:
+            return self.object_list.count()
+        return estimate
+
+
+def tenant_choices(model, company_id, using=None):
+    """Filas de `model` que pertenecen a la compañía; None si `model` no es de un tenant (p. ej. Subscription)."""
+    manager = model._default_manager.db_manager(using)
+    if company_id is None:
+        return manager.none()
+    if model is Company:
+        return manager.filter(pk=company_id)
+    scopes = dict(TENANT_SCOPES)
+    if model is CustomUser or model._meta.model_name in scopes:
+        return manager.filter(tenant_filter(scopes.get(model._meta.model_name, 'company'), company_id))
+    return None
+
+
+def owner_company_ids(obj, scope):
+    """Compañías a las que apunta `obj` siguiendo la ruta (o rutas) de `scope`."""
+    owners = set()
+    for path in scope if isinstance(scope, tuple) else (scope,):
+        *relations, last = path.split('__')
+        target = obj
+        for name in relations:
+            target = getattr(target, name, None)
+            if target is None:
+                break
+        else:
+            owners.add(getattr(target, f"{last}_id"))
+    owners.discard(None)
+    return owners
+
+
+class TenantChoicesMixin:
+    """
+    Para staff no superusuario, los FK solo ofrecen y aceptan filas de su
+    compañía. Vale también para raw_id y autocomplete: el form valida el id
+    enviado contra este queryset (la búsqueda del autocomplete ya usa el
+    get_queryset filtrado del admin del modelo destino).
+    """
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if not request.user.is_superuser and 'queryset' not in kwargs:
+            queryset = tenant_choices(db_field.remote_field.model, getattr(request.user, 'company_id', None),
+                                      kwargs.get('using'))
+            if queryset is not None:
+                kwargs['queryset'] = queryset
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class TenantScopedInline(TenantChoicesMixin, admin.TabularInline):
+    pass
+
+
+class TenantScopedAdmin(TenantChoicesMixin, admin.ModelAdmin):
+    """Base: paginación estimada y filtro por compañía para staff no superusuario."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # Ruta hacia la compañía; por defecto la de tenancy.TENANT_SCOPES.
+    tenant_scope = None
+
+    def get_tenant_scope(self):
+        if self.tenant_scope is not None:
+            return self.tenant_scope
+        return dict(TENANT_SCOPES).get(self.model._meta.model_name, 'company')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        company_id = getattr(request.user, 'company_id', None)
+        if company_id is None:
+            return queryset.none()
+        return queryset.filter(tenant_filter(self.get_tenant_scope(), company_id))
+
+    def is_owned(self, obj, company_id):
+        owners = owner_company_ids(obj, self.get_tenant_scope())
+        return company_id is not None and owners == {company_id}
+
+    def save_model(self, request, obj, form, change):
+        # Última barrera si un campo hacia la compañía no pasa por un FK filtrado.
+        if not request.user.is_superuser and not self.is_owned(obj, getattr(request.user, 'company_id', None)):
+            raise PermissionDenied("El objeto no pertenece a su compañía.")
+        super().save_model(request, obj, form, change)
+
+
+# ====================================================================
+# CUENTAS Y SUSCRIPCIONES
+# ====================================================================
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'max_users', 'price')
+
+
+@admin.register(Company)
+class CompanyAdmin(TenantScopedAdmin):
+    list_display = ('name', 'rut', 'plan', 'shard', 'is_active', 'created_at')
+    list_select_related = ('plan',)
+    list_filter = ('is_active', 'plan', 'shard')
+    search_fields = ('name', 'rut')
+
+    def get_queryset(self, request):
+        queryset = admin.ModelAdmin.get_queryset(self, request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(pk=getattr(request.user, 'company_id', None))
+
+    def is_owned(self, obj, company_id):
+        return company_id is not None and obj.pk == company_id
+
+    def has_delete_permission(self, request, obj=None):
+        # El CASCADE completo bloquea la BD: usar POST /api/companies/{id}/purge/ o `manage.py purge_tenant`.
+        return False
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(TenantScopedAdmin):
+    list_display = ('username', 'email', 'role', 'company', 'is_active')
+    list_select_related = ('company',)
+    list_filter = ('role', 'is_active')
+    search_fields = ('username', 'email', 'rut')
+    autocomplete_fields = ('company',)
+    readonly_fields = ('password', 'last_login', 'created_at')
+    exclude = ('groups', 'user_permissions')
+    tenant_scope = 'company'
+
+
+@admin.register(TenantUsage)
+class TenantUsageAdmin(TenantScopedAdmin):
+    list_display = ('company', 'users', 'products', 'branches', 'reconciled_at')
+    list_select_related = ('company',)
+    readonly_fields = ('company', 'users', 'products', 'branches', 'reconciled_at')
+    tenant_scope = 'company'
+
+
+# ====================================================================
+# INVENTARIO Y PROVEEDORES
+# ====================================================================
+
+@admin.register(Product)
+class ProductAdmin(TenantScopedAdmin):
+    list_display = ('sku', 'name', 'category', 'price', 'cost', 'company')
+    list_select_related = ('company',)
+    search_fields = ('sku', 'name')
+    autocomplete_fields = ('company',)
+
+    def save_model(self, request, obj, form, change):
+        with price_change_context(request.user, source='admin'):
+            super().save_model(request, obj, form, change)
+
+
+@admin.register(ProductPriceHistory)
+class ProductPriceHistoryAdmin(TenantScopedAdmin):
+    list_display = ('product', 'price', 'cost', 'valid_from', 'source')
+    list_select_related = ('product',)
+    list_filter = ('source',)
+    raw_id_fields = ('company', 'product', 'changed_by')
+
+
+@admin.register(Branch)
+class BranchAdmin(TenantScopedAdmin):
+    list_display = ('name', 'company', 'address', 'phone')
+    list_select_related = ('company',)
+    search_fields = ('name', 'company__name')
+    autocomplete_fields = ('company',)
+
+
+@admin.register(BranchSequence)
+class BranchSequenceAdmin(TenantScopedAdmin):
+    list_display = ('branch', 'next_value', 'updated_at')
+    list_select_related = ('branch__company',)
+    raw_id_fields = ('branch',)
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(Supplier)
+class SupplierAdmin(TenantScopedAdmin):
+    list_display = ('name', 'rut', 'contact', 'company')
+    list_select_related = ('company',)
+    search_fields = ('name', 'rut')
+    autocomplete_fields = ('company',)
+
+
+@admin.register(Inventory)
+class InventoryAdmin(TenantScopedAdmin):
+    list_display = ('product', 'branch', 'stock', 'reorder_point', 'version')
+    list_select_related = ('product', 'branch__company')
+    search_fields = ('product__sku', 'product__name')
+    autocomplete_fields = ('branch', 'product')
+    readonly_fields = ('version',)
+
+
+@admin.register(InventoryValuationSnapshot)
+class InventoryValuationSnapshotAdmin(TenantScopedAdmin):
+    list_display = ('date', 'branch', 'category', 'products', 'units', 'value', 'retail_value', 'potential_margin')
+    list_select_related = ('branch',)
+    list_filter = ('category',)
+    date_hierarchy = 'date'
+    raw_id_fields = ('company', 'branch')
+
+
+# ====================================================================
+# TRANSACCIONES Y ÓRDENES
+# ====================================================================
+
+class PurchaseItemInline(TenantScopedInline):
+    model = PurchaseItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Purchase)
+class PurchaseAdmin(TenantScopedAdmin):
+    list_display = ('id', 'supplier', 'branch', 'date', 'total')
+    list_select_related = ('supplier', 'branch__company')
+    date_hierarchy = 'date'
+    autocomplete_fields = ('supplier', 'branch')
+    raw_id_fields = ('user', 'company')
+    inlines = [PurchaseItemInline]
+
+
+@admin.register(PurchaseItem)
+class PurchaseItemAdmin(TenantScopedAdmin):
+    list_display = ('id', 'purchase', 'product', 'quantity', 'unit_cost')
+    list_select_related = ('purchase__supplier', 'product')
+    raw_id_fields = ('purchase', 'product')
+
+
+class StockTransferItemInline(TenantScopedInline):
+    model = StockTransferItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(StockTransfer)
+class StockTransferAdmin(TenantScopedAdmin):
+    list_display = ('id', 'from_branch', 'to_branch', 'total_units', 'created_at')
+    list_select_related = ('from_branch__company', 'to_branch__company')
+    autocomplete_fields = ('from_branch', 'to_branch')
+    raw_id_fields = ('user', 'company')
+    inlines = [StockTransferItemInline]
+
+
+@admin.register(StockTransferItem)
+class StockTransferItemAdmin(TenantScopedAdmin):
+    list_display = ('id', 'transfer', 'product', 'quantity')
+    list_select_related = ('transfer', 'product')
+    raw_id_fields = ('transfer', 'product')
+
+
+@admin.register(Sale)
+class SaleAdmin(TenantScopedAdmin):
+    list_display = ('id', 'branch', 'receipt_number', 'user', 'total', 'payment_method', 'created_at')
+    list_select_related = ('branch__company', 'user')
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('branch',)
+    raw_id_fields = ('user', 'company')
+
+
+@admin.register(Order)
+class OrderAdmin(TenantScopedAdmin):
+    list_display = ('id', 'client_name', 'client_email', 'status', 'total', 'created_at')
+    list_filter = ('status',)
+    date_hierarchy = 'created_at'
+    search_fields = ('client_email',)
+    raw_id_fields = ('user', 'company')
+
+
+@admin.register(CartItem)
+class CartItemAdmin(TenantScopedAdmin):
+    list_display = ('id', 'sale', 'order', 'product', 'quantity', 'price', 'created_at')
+    list_select_related = ('sale', 'order', 'product')
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('sale', 'order', 'product')
+
+
+# ====================================================================
+# OUTBOX, TRABAJOS Y DIAGNÓSTICO
+# ====================================================================
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(TenantScopedAdmin):
+    list_display = ('id', 'feed_seq', 'event_type', 'aggregate_id', 'company', 'created_at', 'delivered_at', 'attempts')
+    list_select_related = ('company',)
+    list_filter = ('event_type',)
+    raw_id_fields = ('company',)
+
+
+@admin.register(Job)
+class JobAdmin(TenantScopedAdmin):
+    list_display = ('id', 'name', 'status', 'progress', 'company', 'attempts', 'created_at', 'finished_at')
+    list_select_related = ('company',)
+    list_filter = ('status', 'name')
+    raw_id_fields = ('company', 'user')
+    tenant_scope = 'company'
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('fingerprint', 'view', 'count', 'max_ms', 'last_seen')
+    search_fields = ('fingerprint', 'view')
+    readonly_fields = [f.name for f in SlowQuery._meta.fields]
 
-# Register your models here.
+    def has_module_permission(self, request):
+        return request.user.is_superuser
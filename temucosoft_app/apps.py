@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TemucosoftAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'temucosoft_app'
+
+    def ready(self):
+        # Registra los handlers de trabajos en segundo plano y las señales.
+        from . import tasks, signals  # noqa: F401
+        from .slowqueries import install
+        install()
+        if getattr(settings, 'WARMUP_ON_STARTUP', False):
+            # Solo etapas sin BD; conexiones y caches van en post_fork (ver warmup.py).
+            from .warmup import CODE_STAGES, warm_up
+            warm_up(CODE_STAGES)
@@ -0,0 +1,77 @@
+"""
+Backend de cache compartido en la BD de control (settings.CACHES sin REDIS_URL).
+
+El DatabaseCache de Django implementa incr()/decr() como get + set: dos
+procesos que incrementan a la vez pierden uno de los incrementos, y el
+set() reinicia el vencimiento con el timeout por defecto. Los contadores del
+throttling (ventanas de consumo y reportes en curso) y las versiones de
+cache_versions.py dependen de incr(), así que aquí se lee la fila bloqueada
+(SELECT ... FOR UPDATE) y se actualiza solo el valor, conservando `expires`.
+"""
+import base64
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache as BaseDatabaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class DatabaseCache(BaseDatabaseCache):
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db = router.db_for_write(self.cache_model_class)
+        connection = connections[db]
+        table = connection.ops.quote_name(self._table)
+        lock = ' FOR UPDATE' if connection.features.has_select_for_update else ''
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            cursor.execute(f"SELECT value, expires FROM {table} WHERE cache_key = %s{lock}", [key])
+            row = cursor.fetchone()
+            if row is None or self._converted_expires(connection, row[1]) < timezone.now():
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(base64.b64decode(connection.ops.process_clob(row[0]).encode())) + delta
+            encoded = base64.b64encode(pickle.dumps(value, self.pickle_protocol)).decode('latin1')
+            cursor.execute(f"UPDATE {table} SET value = %s WHERE cache_key = %s", [encoded, key])
+        return value
+
+    @staticmethod
+    def _converted_expires(connection, expires):
+        expression = models.Expression(output_field=models.DateTimeField())
+        for converter in connection.ops.get_db_converters(expression) + expression.get_db_converters(connection):
+            expires = converter(expires, expression, connection)
+        return expires
+
+
+def check_shared_cache(alias='default'):
+    """
+    Para los hooks de arranque de gunicorn: el throttling, las versiones de
+    cache_versions.py y el HTML del catálogo suponen un cache común a todos
+    los workers, y DatabaseCache necesita su tabla.
+    """
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend in PROCESS_LOCAL_BACKENDS:
+        raise ImproperlyConfigured(
+            f"CACHES['{alias}'] ({backend}) es propio de cada proceso; con varios workers use "
+            "temucosoft_app.cache_backends.DatabaseCache o Redis (REDIS_URL)."
+        )
+    cache = caches[alias]
+    if isinstance(cache, BaseDatabaseCache):
+        db = router.db_for_read(cache.cache_model_class)
+        try:
+            exists = cache._table in connections[db].introspection.table_names()
+        finally:
+            # Llamado en el master antes del fork: los workers no deben heredar la conexión.
+            connections[db].close()
+        if not exists:
+            raise ImproperlyConfigured(
+                f"No existe la tabla de cache '{cache._table}' en '{db}': "
+                "ejecute `python manage.py createcachetable`."
+            )
@@ -0,0 +1,54 @@
+"""
+Versiones por tenant para invalidar caches sin borrar claves.
+
+Cada cache derivado incluye en su clave la versión vigente del espacio
+(`inventory`, `catalog`, ...) de la compañía; al cambiar los datos se
+incrementa la versión y las claves viejas simplemente expiran.
+
+Las versiones viven en el cache por defecto (settings.CACHES: Redis o
+cache_backends.DatabaseCache), el mismo para todos los workers, así que un
+bump_version() en un proceso invalida las claves de los demás en la
+siguiente lectura. incr() es atómico en ambos backends; con LocMemCache
+cada proceso tendría sus propias versiones y serviría datos viejos.
+"""
+from django.core.cache import cache
+
+VERSION_TTL = None  # Las versiones no expiran.
+
+# Espacios con datos del tenant (ver signals.py).
+TENANT_NAMESPACES = ('catalog', 'inventory', 'purchases')
+
+
+def _key(namespace, company_id):
+    return f"version:{namespace}:{company_id}"
+
+
+def get_version(namespace, company_id):
+    key = _key(namespace, company_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, VERSION_TTL)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(namespace, company_id):
+    key = _key(namespace, company_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # La clave no existía (cache reiniciado): cualquier valor nuevo invalida.
+        cache.add(key, 2, VERSION_TTL)
+        return cache.get(key, 2)
+
+
+def bump_tenant_versions(company_id):
+    """Invalida todos los caches del tenant; para escrituras masivas que no emiten señales."""
+    for namespace in TENANT_NAMESPACES:
+        bump_version(namespace, company_id)
+
+
+def versioned_key(namespace, company_id, *parts):
+    """Clave de cache que cambia cada vez que se incrementa la versión del espacio."""
+    suffix = ':'.join(str(p) for p in parts)
+    return f"{namespace}:{company_id}:v{get_version(namespace, company_id)}:{suffix}"
@@ -0,0 +1,88 @@
+"""
+Catálogo público (shop/products/) renderizado en el servidor.
+
+- Paginación por keyset: los productos se ordenan por (name, id) y cada
+  página trae los `page_size` siguientes al cursor `after` (nombre e id del
+  último producto de la página anterior), con el índice
+  product_catalog_idx. El costo no crece con el número de página, a
+  diferencia de OFFSET.
+- Cache: el HTML completo de cada página para visitantes anónimos y las
+  tarjetas/fichas de producto como fragmentos ({% cache %}), con claves que
+  incluyen la compañía y la versión 'catalog' (cache_versions). Un cambio de
+  producto o de la compañía incrementa la versión, así que con el cache
+  tibio una página anónima solo lee el cache (versión y HTML), sin tocar
+  las tablas del catálogo. La clave se arma con el cursor decodificado y
+  una categoría existente: parámetros inválidos o variantes del mismo
+  cursor no crean entradas nuevas.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .cache_versions import get_version, versioned_key
+from .models import Product
+
+CATALOG_PAGE_SIZE = getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+CATALOG_CACHE_TTL = getattr(settings, 'CATALOG_CACHE_TTL', 15 * 60)
+CATALOG_FIELDS = ('id', 'sku', 'name', 'price', 'category')
+
+
+def encode_cursor(product):
+    raw = json.dumps([product.name, product.pk], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(name, id) del cursor, o None si falta o no es válido (primera página)."""
+    if not token:
+        return None
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return str(name), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def catalog_page(company_id, category=None, cursor=None, page_size=CATALOG_PAGE_SIZE):
+    """
+    Una página del catálogo a partir de `cursor` (ya decodificado con
+    decode_cursor). Devuelve {'products', 'next_cursor'}; el siguiente
+    cursor es None en la última página.
+    """
+    queryset = Product.objects.filter(company_id=company_id).only(*CATALOG_FIELDS)
+    if category:
+        queryset = queryset.filter(category=category)
+    if cursor:
+        name, pk = cursor
+        queryset = queryset.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+    # Una fila extra indica si hay página siguiente.
+    products = list(queryset.order_by('name', 'pk')[:page_size + 1])
+    next_cursor = encode_cursor(products[page_size - 1]) if len(products) > page_size else None
+    return {'products': products[:page_size], 'next_cursor': next_cursor}
+
+
+def catalog_categories(company_id):
+    """Categorías de la compañía (cacheadas con la versión del catálogo)."""
+    key = versioned_key('catalog', company_id, 'categories')
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(
+            Product.objects.filter(company_id=company_id).exclude(category='')
+            .order_by('category').values_list('category', flat=True).distinct()
+        )
+        cache.set(key, categories, CATALOG_CACHE_TTL)
+    return categories
+
+
+def catalog_version(company_id):
+    return get_version('catalog', company_id)
+
+
+def page_cache_key(company_id, *parts):
+    """Clave del HTML de una página anónima; los parámetros van hasheados (claves acotadas)."""
+    digest = hashlib.md5(json.dumps(parts).encode()).hexdigest()
+    return versioned_key('catalog', company_id, 'html', digest)
@@ -0,0 +1,185 @@
+"""
+Cálculo de Inventory.reorder_point a partir del historial de ventas.
+
+Por compañía:
+1. Se agrupan las filas de inventario en bloques de hasta PAIR_BLOCK pares
+   sucursal x producto (memoria acotada).
+2. La demanda diaria de cada bloque se agrega en SQL (CartItem de ventas
+   POS por día) y se lee en streaming a una matriz NumPy pares x días.
+3. Pronóstico (media móvil o suavizado exponencial) y stock de seguridad
+   se calculan vectorizados sobre todas las filas a la vez.
+4. Los puntos de reorden que cambian se escriben con bulk_update.
+
+recompute_companies() reparte las compañías en un pool de procesos.
+NumPy es una dependencia opcional: solo se importa al usarse.
+"""
+import math
+from dataclasses import dataclass, asdict
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .jobs import process_pool
+from .models import Branch, CartItem, Inventory
+from .tenancy import tenant_db, use_tenant_shard
+
+PAIR_BLOCK = 200000
+READ_CHUNK = 5000
+WRITE_BATCH = 1000
+
+
+class ForecastError(Exception):
+    pass
+
+
+@dataclass
+class ForecastOptions:
+    history_days: int = 90
+    method: str = 'ma'          # 'ma' (media móvil) o 'ses' (suavizado exponencial)
+    window: int = 28            # días de la media móvil
+    alpha: float = 0.3          # factor de suavizado de 'ses'
+    lead_time: int = 7          # días de reposición
+    service_level: float = 0.95
+    min_reorder_point: int = 0
+    dry_run: bool = False
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ForecastError("recompute_reorder_points requiere numpy instalado (pip install numpy).")
+    return numpy
+
+
+# --------------------------------------------------------------------
+# Carga de demanda
+# --------------------------------------------------------------------
+
+def _pair_blocks(company_id):
+    """Bloques de filas de inventario (id, branch_id, product_id, reorder_point), cortados por sucursal."""
+    branch_ids = list(Branch.objects.filter(company_id=company_id).order_by('pk').values_list('pk', flat=True))
+    block, size = [], 0
+    for branch_id in branch_ids:
+        rows = list(
+            Inventory.objects.filter(branch_id=branch_id)
+            .order_by('product_id')
+            .values_list('id', 'branch_id', 'product_id', 'reorder_point')
+        )
+        if block and size + len(rows) > PAIR_BLOCK:
+            yield block
+            block, size = [], 0
+        block.extend(rows)
+        size += len(rows)
+    if block:
+        yield block
+
+
+def load_demand(np, pairs, start, days):
+    """Matriz (len(pairs) x days) con las unidades vendidas por día."""
+    index = {(branch_id, product_id): i for i, (_, branch_id, product_id, _) in enumerate(pairs)}
+    branch_ids = sorted({p[1] for p in pairs})
+    demand = np.zeros((len(pairs), days), dtype=np.float32)
+
+    rows = (
+        CartItem.objects
+        .filter(sale__branch_id__in=branch_ids, created_at__gte=start)
+        .annotate(day=TruncDate('created_at'))
+        .values_list('sale__branch_id', 'product_id', 'day')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+        .iterator(chunk_size=READ_CHUNK)
+    )
+    start_day = start.date()
+    chunk_rows, chunk_cols, chunk_qty = [], [], []
+    for branch_id, product_id, day, quantity in rows:
+        i = index.get((branch_id, product_id))
+        col = (day - start_day).days
+        if i is None or not 0 <= col < days:
+            continue
+        chunk_rows.append(i)
+        chunk_cols.append(col)
+        chunk_qty.append(quantity)
+        if len(chunk_rows) >= READ_CHUNK:
+            np.add.at(demand, (chunk_rows, chunk_cols), chunk_qty)
+            chunk_rows, chunk_cols, chunk_qty = [], [], []
+    if chunk_rows:
+        np.add.at(demand, (chunk_rows, chunk_cols), chunk_qty)
+    return demand
+
+
+# --------------------------------------------------------------------
+# Pronóstico vectorizado
+# --------------------------------------------------------------------
+
+def forecast_daily(np, demand, options):
+    """Demanda diaria esperada por fila."""
+    if options.method == 'ma':
+        window = min(options.window, demand.shape[1])
+        return demand[:, -window:].mean(axis=1)
+    if options.method == 'ses':
+        level = demand[:, 0].copy()
+        for t in range(1, demand.shape[1]):
+            level += options.alpha * (demand[:, t] - level)
+        return level
+    raise ForecastError(f"Método de pronóstico desconocido: {options.method}")
+
+
+def reorder_points(np, demand, options):
+    """ROP = demanda diaria x lead time + z x sigma diaria x sqrt(lead time)."""
+    z = NormalDist().inv_cdf(options.service_level)
+    daily = forecast_daily(np, demand, options)
+    sigma = demand.std(axis=1)
+    rop = daily * options.lead_time + z * sigma * math.sqrt(options.lead_time)
+    return np.maximum(np.ceil(rop), options.min_reorder_point).astype(np.int64)
+
+
+# --------------------------------------------------------------------
+# Ejecución
+# --------------------------------------------------------------------
+
+def recompute_company(company_id, options=None):
+    """Recalcula los puntos de reorden de una compañía. Devuelve {'pairs': n, 'updated': n}."""
+    np = _numpy()
+    options = options or ForecastOptions()
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today - timedelta(days=options.history_days), time.min))
+    stats = {'company': company_id, 'pairs': 0, 'updated': 0}
+
+    for pairs in _pair_blocks(company_id):
+        demand = load_demand(np, pairs, start, options.history_days + 1)
+        new_points = reorder_points(np, demand, options)
+        current = np.fromiter((p[3] for p in pairs), dtype=np.int64, count=len(pairs))
+        changed = np.nonzero(new_points != current)[0]
+
+        stats['pairs'] += len(pairs)
+        stats['updated'] += len(changed)
+        if options.dry_run or not len(changed):
+            continue
+        updates = [Inventory(pk=pairs[i][0], reorder_point=int(new_points[i])) for i in changed]
+        with transaction.atomic(using=tenant_db()):
+            Inventory.objects.bulk_update(updates, ['reorder_point'], batch_size=WRITE_BATCH)
+    return stats
+
+
+def _recompute_in_process(company_id, options):
+    with use_tenant_shard(company_id):
+        return recompute_company(company_id, ForecastOptions(**options))
+
+
+def recompute_companies(company_ids, options=None, processes=1):
+    """Recalcula varias compañías; con processes > 1 las reparte en un pool de procesos."""
+    _numpy()
+    options = asdict(options or ForecastOptions())
+    if processes <= 1:
+        for company_id in company_ids:
+            yield _recompute_in_process(company_id, options)
+        return
+
+    # Cada proceso hijo abre sus propias conexiones a la BD (ver jobs.process_pool).
+    with process_pool(processes) as pool:
+        yield from pool.map(_recompute_in_process, company_ids, [options] * len(company_ids))
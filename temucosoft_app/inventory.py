@@ -0,0 +1,364 @@
+"""
+Operaciones de stock compartidas por las vistas y los trabajos en segundo plano.
+
+Todo cambio de Inventory.stock pasa por UPDATE con F() o por compare-and-swap
+sobre Inventory.version, nunca por save() de una fila leída antes: así no se
+pierden decrementos concurrentes del POS.
+"""
+from decimal import Decimal
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+
+from .models import Product, PurchaseItem, Inventory, StockTransferItem
+from .cache_versions import bump_version
+from .realtime import publish_stock_change
+
+CAS_MAX_RETRIES = 5
+CAS_CHUNK_SIZE = 1000
+
+
+class StockConflict(Exception):
+    """La fila cambió (versión distinta) y no se pudo aplicar el ajuste."""
+
+    def __init__(self, message, current=None):
+        super().__init__(message)
+        self.current = current
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def _stock_changed(company_id, branch_id, product_ids, using, event, event_data):
+    bump_version('inventory', company_id)
+    publish_stock_change(branch_id, product_ids, using, event, event_data)
+
+
+def notify_stock_on_commit(using, company_id, branch_id, product_ids, event=None, event_data=None):
+    """
+    Al confirmar la transacción de `using`: invalida los caches derivados del
+    inventario de la compañía y publica el nuevo stock en el canal push.
+    """
+    transaction.on_commit(
+        partial(_stock_changed, company_id, branch_id, list(product_ids), using, event, event_data),
+        using=using,
+    )
+
+
+def apply_stock_delta(inventory_id, delta, using=None):
+    """
+    Suma `delta` al stock en un solo UPDATE atómico (sin leer la fila antes).
+    Devuelve False si el resultado quedaría negativo.
+    """
+    queryset = Inventory.objects.using(using) if using else Inventory.objects
+    queryset = queryset.filter(pk=inventory_id)
+    if delta < 0:
+        queryset = queryset.filter(stock__gte=-delta)
+    return queryset.update(stock=F('stock') + delta, version=F('version') + 1) == 1
+
+
+def receive_purchase_items(purchase, items_data):
+    """Registra las líneas de una compra, suma el stock de la sucursal y fija el total."""
+    total = 0
+
+    for item in items_data:
+        product = get_object_or_404(Product, id=item['product'])
+        unit_cost = Decimal(str(item['unit_cost']))
+
+        PurchaseItem.objects.create(
+            purchase=purchase,
+            product=product,
+            quantity=item['quantity'],
+            unit_cost=unit_cost
+        )
+
+        total += item['quantity'] * unit_cost
+
+        inventory, created = Inventory.objects.get_or_create(
+            branch=purchase.branch, product=product, defaults={'stock': 0}
+        )
+        apply_stock_delta(inventory.pk, item['quantity'], using=inventory._state.db)
+
+    purchase.total = total
+    purchase.save()
+
+    notify_stock_on_commit(
+        purchase._state.db, purchase.company_id, purchase.branch_id, {item['product'] for item in items_data},
+        'purchase', {'id': purchase.pk, 'branch': purchase.branch_id, 'total': purchase.total},
+    )
+    return purchase
+
+
+# --------------------------------------------------------------------
+# Ajustes manuales y conteos cíclicos (compare-and-swap)
+# --------------------------------------------------------------------
+
+def adjust_stock(inventory, delta=None, stock=None, expected_version=None,
+                 max_retries=CAS_MAX_RETRIES, using=None):
+    """
+    Ajusta una fila con `UPDATE ... WHERE version = n`.
+
+    - delta: suma relativa; se reintenta automáticamente ante conflictos.
+    - stock: valor absoluto.
+    - expected_version: versión que vio el cliente; si no coincide se lanza
+      StockConflict sin reintentar (el cliente decidió sobre datos viejos).
+
+    Devuelve (stock, version) resultantes.
+    """
+    using = using or inventory._state.db
+    queryset = Inventory.objects.using(using)
+    current_stock, current_version = inventory.stock, inventory.version
+
+    for _ in range(max_retries):
+        if expected_version is not None and current_version != expected_version:
+            raise StockConflict(
+                "El inventario cambió desde que fue leído.",
+                current={'stock': current_stock, 'version': current_version},
+            )
+
+        new_stock = current_stock + delta if delta is not None else stock
+        if new_stock < 0:
+            raise InsufficientStock(f"Stock insuficiente ({current_stock}).")
+
+        updated = queryset.filter(pk=inventory.pk, version=current_version) \
+            .update(stock=new_stock, version=current_version + 1)
+        if updated:
+            inventory.stock, inventory.version = new_stock, current_version + 1
+            return inventory.stock, inventory.version
+
+        current_stock, current_version = queryset.filter(pk=inventory.pk) \
+            .values_list('stock', 'version').get()
+
+    raise StockConflict(
+        "No se pudo aplicar el ajuste por alta contención; intente nuevamente.",
+        current={'stock': current_stock, 'version': current_version},
+    )
+
+
+def _cas_bulk_update(rows, using):
+    """
+    Aplica [(id, stock, expected_version)] en una sentencia por lote:
+    UPDATE ... FROM (VALUES ...) WHERE id = v.id AND version = v.version
+    RETURNING id. Devuelve el conjunto de ids actualizados.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(Inventory._meta.db_table)
+    updated = set()
+
+    for start in range(0, len(rows), CAS_CHUNK_SIZE):
+        chunk = rows[start:start + CAS_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+        params = [value for row in chunk for value in row]
+        sql = (
+            f"WITH v(id, stock, version) AS (VALUES {values}) "
+            f"UPDATE {table} SET stock = v.stock, version = {table}.version + 1 "
+            f"FROM v WHERE {table}.id = v.id AND {table}.version = v.version "
+            f"RETURNING {table}.id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated.update(row[0] for row in cursor.fetchall())
+    return updated
+
+
+def _insert_missing(branch_id, stocks, using):
+    """
+    Inserta [(product_id, stock)] con INSERT ... ON CONFLICT DO NOTHING
+    RETURNING product_id. bulk_create(ignore_conflicts=True) devuelve todos
+    los objetos aunque se hayan omitido; aquí solo vuelven los insertados.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(Inventory._meta.db_table)
+    reorder_point = Inventory._meta.get_field('reorder_point').get_default()
+    inserted = set()
+
+    for start in range(0, len(stocks), CAS_CHUNK_SIZE):
+        chunk = stocks[start:start + CAS_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s, %s, %s, 0)'] * len(chunk))
+        params = [value for pid, stock in chunk for value in (branch_id, pid, stock, reorder_point)]
+        sql = (
+            f"INSERT INTO {table} (branch_id, product_id, stock, reorder_point, version) "
+            f"VALUES {values} ON CONFLICT (branch_id, product_id) DO NOTHING "
+            f"RETURNING product_id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            inserted.update(row[0] for row in cursor.fetchall())
+    return inserted
+
+
+def reconcile_cycle_count(branch, counts, max_retries=CAS_MAX_RETRIES, using=None):
+    """
+    Fija el stock contado de muchos productos de una sucursal en pocas
+    sentencias: una lectura, un UPDATE por lote de CAS_CHUNK_SIZE filas y un
+    INSERT para productos sin fila de inventario. Si otro proceso crea una de
+    esas filas antes, se relee y sigue el camino del UPDATE.
+
+    `counts` es una lista de dicts {product, stock, version?}. Si el conteo
+    trae la versión observada, un cambio posterior se reporta como conflicto;
+    si no, el conteo se aplica y las carreras se reintentan.
+
+    Devuelve {'updated': n, 'created': n, 'unchanged': n, 'conflicts': [...]}.
+    """
+    using = using or branch._state.db
+    queryset = Inventory.objects.using(using).filter(branch=branch)
+    wanted = {c['product']: c for c in counts}
+    result = {'updated': 0, 'created': 0, 'unchanged': 0, 'conflicts': []}
+
+    def read(product_ids):
+        return {
+            row['product_id']: row
+            for row in queryset.filter(product_id__in=product_ids).values('id', 'product_id', 'stock', 'version')
+        }
+
+    existing = read(wanted)
+
+    missing = [pid for pid in wanted if pid not in existing]
+    if missing:
+        inserted = _insert_missing(branch.pk, [(pid, wanted[pid]['stock']) for pid in missing], using)
+        result['created'] = len(inserted)
+        # Filas creadas por otro proceso entre la lectura y el INSERT.
+        existing.update(read([pid for pid in missing if pid not in inserted]))
+
+    pending = {}
+    for pid, row in existing.items():
+        count = wanted[pid]
+        expected = count.get('version')
+        if expected is not None and expected != row['version']:
+            result['conflicts'].append({'product': pid, 'stock': row['stock'], 'version': row['version']})
+        elif count['stock'] == row['stock']:
+            result['unchanged'] += 1
+        else:
+            pending[row['id']] = (pid, count['stock'], row['version'], expected is not None)
+
+    for _ in range(max_retries):
+        if not pending:
+            break
+        done = _cas_bulk_update([(i, s, v) for i, (_, s, v, _) in pending.items()], using)
+        result['updated'] += len(done)
+        pending = {i: p for i, p in pending.items() if i not in done}
+        if not pending:
+            break
+
+        fresh = dict(
+            (row[0], row[1:]) for row in
+            Inventory.objects.using(using).filter(pk__in=pending).values_list('id', 'stock', 'version')
+        )
+        retry = {}
+        for inventory_id, (pid, stock, _, strict) in pending.items():
+            current_stock, current_version = fresh[inventory_id]
+            if strict:
+                result['conflicts'].append({'product': pid, 'stock': current_stock, 'version': current_version})
+            else:
+                retry[inventory_id] = (pid, stock, current_version, False)
+        pending = retry
+
+    for inventory_id, (pid, *_rest) in pending.items():
+        result['conflicts'].append({'product': pid})
+
+    if result['updated'] or result['created']:
+        notify_stock_on_commit(
+            using, branch.company_id, branch.pk, wanted.keys(), 'cycle_count', {'branch': branch.pk},
+        )
+    return result
+
+
+# --------------------------------------------------------------------
+# Traspasos entre sucursales
+# --------------------------------------------------------------------
+
+def _bulk_add_stock(deltas, using):
+    """
+    Suma [(inventory_id, delta)] con un UPDATE ... FROM (VALUES ...) por lote.
+    La condición stock + delta >= 0 es una red de seguridad: las filas ya
+    están bloqueadas y validadas. Devuelve la cantidad de filas actualizadas.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(Inventory._meta.db_table)
+    updated = 0
+
+    for start in range(0, len(deltas), CAS_CHUNK_SIZE):
+        chunk = deltas[start:start + CAS_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s)'] * len(chunk))
+        params = [value for row in chunk for value in row]
+        sql = (
+            f"WITH v(id, delta) AS (VALUES {values}) "
+            f"UPDATE {table} SET stock = {table}.stock + v.delta, version = {table}.version + 1 "
+            f"FROM v WHERE {table}.id = v.id AND {table}.stock + v.delta >= 0 "
+            f"RETURNING {table}.id"
+        )
+        with connection.cursor() as cursor:
+            # rowcount no es confiable con WITH en sqlite3; se cuentan las filas devueltas.
+            cursor.execute(sql, params)
+            updated += len(cursor.fetchall())
+    return updated
+
+
+def transfer_stock(transfer, lines):
+    """
+    Mueve `lines` ({product: quantity}) de transfer.from_branch a
+    transfer.to_branch. Debe llamarse dentro de transaction.atomic().
+
+    Las filas de ambas sucursales se bloquean en una sola consulta ordenada
+    por id, así dos traspasos cruzados (A->B y B->A) esperan en el mismo
+    orden y no se bloquean mutuamente. Luego hay un UPDATE por lote para
+    ambas sucursales y un bulk_create para el detalle.
+    """
+    using = transfer._state.db
+    inventories = Inventory.objects.using(using)
+    product_ids = sorted(lines)
+    branch_ids = (transfer.from_branch_id, transfer.to_branch_id)
+
+    # Filas de destino que aún no existen (se crean antes de bloquear).
+    existing = set(
+        inventories.filter(branch_id=transfer.to_branch_id, product_id__in=product_ids)
+        .values_list('product_id', flat=True)
+    )
+    missing = [pid for pid in product_ids if pid not in existing]
+    if missing:
+        inventories.bulk_create(
+            [Inventory(branch_id=transfer.to_branch_id, product_id=pid, stock=0) for pid in missing],
+            ignore_conflicts=True,
+        )
+
+    rows = {
+        (branch_id, product_id): (inventory_id, stock)
+        for inventory_id, branch_id, product_id, stock in
+        inventories.select_for_update()
+        .filter(branch_id__in=branch_ids, product_id__in=product_ids)
+        .order_by('id')
+        .values_list('id', 'branch_id', 'product_id', 'stock')
+    }
+
+    shortages = []
+    deltas = []
+    for pid in product_ids:
+        qty = lines[pid]
+        source = rows.get((transfer.from_branch_id, pid))
+        if source is None or source[1] < qty:
+            shortages.append({'product': pid, 'stock': source[1] if source else 0, 'requested': qty})
+            continue
+        deltas.append((source[0], -qty))
+        deltas.append((rows[(transfer.to_branch_id, pid)][0], qty))
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    if _bulk_add_stock(deltas, using) != len(deltas):
+        raise StockConflict("El stock de origen cambió durante el traspaso.")
+
+    StockTransferItem.objects.using(using).bulk_create(
+        [StockTransferItem(transfer=transfer, product_id=pid, quantity=lines[pid]) for pid in product_ids],
+        batch_size=CAS_CHUNK_SIZE,
+    )
+    transfer.total_units = sum(lines.values())
+    transfer.save(update_fields=['total_units'])
+
+    for branch_id in branch_ids:
+        notify_stock_on_commit(
+            using, transfer.company_id, branch_id, product_ids, 'transfer',
+            {'id': transfer.pk, 'from': branch_ids[0], 'to': branch_ids[1]},
+        )
+    return transfer
@@ -0,0 +1,229 @@
+"""
+Cola de trabajos en segundo plano respaldada por la tabla Job.
+
+Los handlers se registran con @register_job('nombre') (ver tasks.py) y se
+ejecutan con `manage.py run_workers`. No requiere broker externo: los
+workers reclaman trabajos con un UPDATE condicional sobre la BD.
+
+Cada reclamo cuenta como un intento. Mientras el handler corre, un hilo
+de latido (y cada set_progress) renueva locked_at; un trabajo sin latido
+por LOCK_TIMEOUT segundos es de un worker muerto y requeue_stale() lo
+devuelve a la cola, o lo marca fallido si ya agotó max_attempts (así un
+trabajo con max_attempts=1 nunca se repite).
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .tenancy import use_tenant_shard
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+# Segundos sin latido tras los cuales un trabajo 'en_proceso' se considera abandonado.
+LOCK_TIMEOUT = getattr(settings, 'JOBS_LOCK_TIMEOUT', 5 * 60)
+HEARTBEAT_INTERVAL = getattr(settings, 'JOBS_HEARTBEAT_INTERVAL', 30)
+RESULT_DIR = Path(getattr(settings, 'JOBS_RESULT_DIR', settings.BASE_DIR / 'var' / 'jobs'))
+
+
+def register_job(name):
+    """Decorador que registra un handler `fn(ctx, **payload)` bajo `name`."""
+    def decorator(fn):
+        JOB_HANDLERS[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, *, user=None, company=None, priority=0, max_attempts=3):
+    """Encola un trabajo registrado y devuelve la instancia Job."""
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"Trabajo no registrado: {name}")
+    if company is None and user is not None:
+        company = user.company
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        user=user,
+        company=company,
+        priority=priority,
+        max_attempts=max_attempts,
+    )
+
+
+class JobContext:
+    """Acceso del handler a su Job: progreso y archivo de resultado."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def set_progress(self, progress, message=''):
+        progress = max(0, min(100, int(progress)))
+        Job.objects.filter(pk=self.job.pk).update(
+            progress=progress, progress_message=message[:255], locked_at=timezone.now(),
+        )
+        self.job.progress, self.job.progress_message = progress, message
+
+    def result_path(self, filename):
+        """Ruta donde el handler debe escribir su archivo de resultado."""
+        directory = RESULT_DIR / str(self.job.pk)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / filename
+        self.job.result_file = str(path)
+        return path
+
+
+def claim_next(worker_id):
+    """Reclama el siguiente trabajo pendiente (mayor prioridad primero)."""
+    now = timezone.now()
+    candidates = Job.objects.filter(status='pendiente', run_after__lte=now) \
+        .order_by('-priority', 'run_after', 'id') \
+        .values_list('id', flat=True)[:10]
+
+    for job_id in candidates:
+        # UPDATE ... WHERE status='pendiente': solo un worker gana la carrera.
+        claimed = Job.objects.filter(pk=job_id, status='pendiente').update(
+            status='en_proceso', locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale():
+    """
+    Trabajos cuyo worker murió (sin latido por LOCK_TIMEOUT): vuelven a la
+    cola si les quedan intentos y si no quedan fallidos. Devuelve
+    (devueltos, fallidos).
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='en_proceso', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='fallido', error="El worker terminó sin completar el trabajo.",
+        locked_by='', locked_at=None, finished_at=now,
+    )
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='pendiente', locked_by='', locked_at=None, run_after=now,
+    )
+    return requeued, failed
+
+
+class Heartbeat(threading.Thread):
+    """Renueva locked_at del trabajo cada HEARTBEAT_INTERVAL segundos mientras corre."""
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        super().__init__(name=f"job-heartbeat-{job.pk}", daemon=True)
+        self.job_id, self.worker_id, self.interval = job.pk, job.locked_by, interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job_id, locked_by=self.worker_id) \
+                        .update(locked_at=timezone.now())
+                except Exception as e:
+                    logger.warning(f"Latido del trabajo {self.job_id} falló: {e}")
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """Ejecuta un Job ya reclamado (claim_next ya contó el intento) y registra su resultado o error."""
+    handler = JOB_HANDLERS.get(job.name)
+    ctx = JobContext(job)
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+
+    try:
+        if handler is None:
+            raise ValueError(f"Trabajo no registrado: {job.name}")
+        with use_tenant_shard(job.company_id):
+            job.result = handler(ctx, **job.payload)
+    except Exception as e:
+        logger.error(f"Error en trabajo {job.pk} ({job.name}): {str(e)}", exc_info=True)
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            # Backoff exponencial: 10s, 20s, 40s...
+            job.status = 'pendiente'
+            job.run_after = timezone.now() + timedelta(seconds=10 * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'fallido'
+            job.finished_at = timezone.now()
+    else:
+        job.status = 'completado'
+        job.progress = 100
+        job.error = ''
+        job.finished_at = timezone.now()
+    finally:
+        heartbeat.stop()
+
+    job.locked_by, job.locked_at = '', None
+    job.save(update_fields=[
+        'status', 'attempts', 'result', 'result_file', 'error', 'progress',
+        'run_after', 'locked_by', 'locked_at', 'finished_at',
+    ])
+    return job
+
+
+def worker_loop(stop_event, poll_interval=1.0, once=False):
+    """Bucle de un hilo worker: reclama y ejecuta trabajos hasta `stop_event`."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    while not stop_event.is_set():
+        close_old_connections()
+        job = claim_next(worker_id)
+        if job is None:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job)
+    close_old_connections()
+
+
+def run_threads(threads, poll_interval=1.0, once=False, stop_event=None):
+    """Ejecuta `threads` hilos worker en el proceso actual hasta que terminen."""
+    stop_event = stop_event or threading.Event()
+    pool = [
+        threading.Thread(target=worker_loop, args=(stop_event, poll_interval, once), daemon=True)
+        for _ in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    try:
+        while any(t.is_alive() for t in pool):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in pool:
+        thread.join()
+
+
+def process_pool(max_workers):
+    """
+    ProcessPoolExecutor para trabajo de CPU dentro de un handler. Los handlers
+    corren en hilos (run_threads) y un fork copiaría locks tomados por otros
+    hilos (logging, conexiones): los hijos parten con forkserver (spawn donde
+    no existe), sin conexiones heredadas, y hacen django.setup().
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    # El initializer no puede vivir en un módulo que importe modelos: se carga antes del setup.
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=django.setup)
@@ -0,0 +1,85 @@
+# temucosoft_app/management/commands/bench_renderers.py
+
+import gzip
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from temucosoft_app.models import Branch, Company, Inventory, Product
+from temucosoft_app.renderers import (
+    ColumnarJSONParser, ColumnarJSONRenderer, MessagePackParser, MessagePackRenderer
+)
+from temucosoft_app.serializers import InventorySerializer, ProductSerializer
+from temucosoft_app.tenancy import use_tenant_shard
+
+
+class Command(BaseCommand):
+    help = ('Compara tamaño (plano y gzip) y tiempos de codificación/decodificación de '
+            'JSON, JSON columnar y MessagePack sobre /api/products/ y el inventario de una sucursal.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Compañía (por defecto, la primera activa).')
+        parser.add_argument('--branch', type=int, help='Sucursal para el inventario.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        company = self._company(options['company'])
+        with use_tenant_shard(company.pk):
+            branches = Branch.objects.filter(company=company)
+            branch = branches.filter(pk=options['branch']).first() if options['branch'] else branches.first()
+            payloads = [('products', ProductSerializer(Product.objects.filter(company=company), many=True).data)]
+            if branch is not None:
+                inventory = Inventory.objects.filter(branch=branch)
+                payloads.append((f'inventory:{branch.pk}', InventorySerializer(inventory, many=True).data))
+        if not payloads[0][1]:
+            raise CommandError(f"{company.name} no tiene productos; ejecute seed_tenants primero.")
+
+        formats = [
+            ('json', JSONRenderer(), lambda raw: json.loads(raw)),
+            ('columnar', ColumnarJSONRenderer(), lambda raw: ColumnarJSONParser().parse(io.BytesIO(raw))),
+        ]
+        if MessagePackRenderer.available():
+            formats.append(('msgpack', MessagePackRenderer(), lambda raw: MessagePackParser().parse(io.BytesIO(raw))))
+        else:
+            self.stdout.write(self.style.WARNING("msgpack no está instalado: se omite (pip install msgpack)."))
+
+        self.stdout.write(self.style.SUCCESS(f"--- {company.name}: {options['repeat']} repeticiones ---"))
+        for name, data in payloads:
+            self.stdout.write(f"\n{name} ({len(data)} filas)")
+            self.stdout.write(f"   {'formato':<10} {'bytes':>10} {'gzip':>10} {'% json':>7} "
+                              f"{'codificar ms':>13} {'decodificar ms':>15}")
+            baseline = None
+            for fmt, renderer, decode in formats:
+                raw = renderer.render(data)
+                encode_ms = self._median_ms(lambda: renderer.render(data), options['repeat'])
+                decode_ms = self._median_ms(lambda: decode(raw), options['repeat'])
+                baseline = baseline or len(raw)
+                self.stdout.write(
+                    f"   {fmt:<10} {len(raw):>10} {len(gzip.compress(raw)):>10} {len(raw) * 100 / baseline:>6.0f}% "
+                    f"{encode_ms:>13.2f} {decode_ms:>15.2f}"
+                )
+        self.stdout.write(self.style.SUCCESS("\n🎉 Benchmark terminado."))
+
+    def _company(self, company_id):
+        if company_id:
+            company = Company.objects.filter(pk=company_id).first()
+            if company is None:
+                raise CommandError(f"No existe la compañía {company_id}.")
+            return company
+        company = Company.objects.filter(is_active=True).order_by('pk').first()
+        if company is None:
+            raise CommandError("No hay compañías activas.")
+        return company
+
+    @staticmethod
+    def _median_ms(fn, repeat):
+        times = []
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times)
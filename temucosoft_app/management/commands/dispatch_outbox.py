@@ -0,0 +1,51 @@
+# temucosoft_app/management/commands/dispatch_outbox.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from temucosoft_app.outbox import Dispatcher, load_sinks
+
+
+class Command(BaseCommand):
+    help = ('Numera los eventos del outbox para /api/events/ y despacha los pendientes '
+            'a los sinks de settings.OUTBOX_SINKS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true',
+                            help='Drena lo pendiente y termina.')
+        parser.add_argument('--purge-days', type=int,
+                            help='Elimina eventos entregados (sin sinks: numerados) hace más de N días y termina.')
+
+    def handle(self, *args, **options):
+        sinks = load_sinks()
+        dispatcher = Dispatcher(sinks, batch_size=options['batch_size'])
+
+        if options['purge_days'] is not None:
+            deleted = dispatcher.purge(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f"✅ {deleted} eventos antiguos eliminados."))
+            return
+
+        if not sinks:
+            self.stdout.write(self.style.WARNING(
+                "No hay sinks en settings.OUTBOX_SINKS: solo se numeran eventos para /api/events/ "
+                "(purgarlos con --purge-days)."
+            ))
+
+        self.stdout.write(self.style.SUCCESS(f"--- Dispatcher de outbox iniciado ({len(sinks)} sinks) ---"))
+        try:
+            while True:
+                close_old_connections()
+                sequenced, delivered = dispatcher.run_once()
+                if sequenced or delivered:
+                    self.stdout.write(f"   -> ✅ {sequenced} eventos numerados, {delivered} entregados")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("🎉 Dispatcher detenido."))
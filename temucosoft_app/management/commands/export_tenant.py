@@ -0,0 +1,26 @@
+# temucosoft_app/management/commands/export_tenant.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.tenant_archive import COMPRESSIONS, TenantArchiveError, archive_filename, export_tenant
+
+
+class Command(BaseCommand):
+    help = 'Exporta todos los datos de un tenant a un tar comprimido de NDJSON (ver tenant_archive.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--output', help='Ruta del archivo. Por defecto tenant-<id>-<fecha>.tar.<ext>.')
+        parser.add_argument('--compression', choices=sorted(COMPRESSIONS), default='gz')
+
+    def handle(self, *args, **options):
+        company_id, compression = options['company_id'], options['compression']
+        path = options['output'] or archive_filename(company_id, compression)
+
+        self.stdout.write(self.style.SUCCESS(f"--- Exportando compañía {company_id} a {path} ---"))
+        try:
+            rows = export_tenant(company_id, path, compression,
+                                 progress=lambda done, total, message: self.stdout.write(f"   -> ✅ {message}"))
+        except TenantArchiveError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"🎉 {sum(rows.values())} filas exportadas."))
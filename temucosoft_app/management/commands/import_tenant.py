@@ -0,0 +1,24 @@
+# temucosoft_app/management/commands/import_tenant.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.tenant_archive import TenantArchiveError, import_tenant
+
+
+class Command(BaseCommand):
+    help = ('Importa un respaldo de export_tenant conservando las PK. '
+            'La compañía debe existir y no tener esos datos cargados.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--company', type=int,
+                            help='Compañía destino. Por defecto, la del respaldo.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"--- Importando {options['path']} ---"))
+        try:
+            rows = import_tenant(options['path'], options['company'],
+                                 progress=lambda done, total, message: self.stdout.write(f"   -> ✅ {message}"))
+        except (TenantArchiveError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"🎉 {sum(rows.values())} filas importadas."))
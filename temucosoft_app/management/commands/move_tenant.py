@@ -0,0 +1,100 @@
+# temucosoft_app/management/commands/move_tenant.py
+
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from temucosoft_app.models import Company
+from temucosoft_app.usage import reconcile_company
+from temucosoft_app.tenancy import (
+    control_database, tenant_shards, tenant_models, tenant_filter,
+    mirror_control_rows, forget_company_shard
+)
+
+
+class Command(BaseCommand):
+    help = ('Mueve todos los datos de un tenant (Company) a otro shard. '
+            'Pausar las escrituras del tenant mientras se ejecuta.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('target', help='Alias de BD destino (debe estar en TENANT_SHARDS).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-source', action='store_true',
+                            help='No borrar los datos del shard de origen.')
+
+    def handle(self, *args, **options):
+        company_id, target, batch_size = options['company_id'], options['target'], options['batch_size']
+
+        if target not in tenant_shards():
+            raise CommandError(f"'{target}' no está en TENANT_SHARDS.")
+        try:
+            company = Company.objects.using(control_database()).get(pk=company_id)
+        except Company.DoesNotExist:
+            raise CommandError(f"No existe la compañía {company_id}.")
+        source = company.shard
+        if source == target:
+            raise CommandError(f"La compañía ya está en '{target}'.")
+
+        self.stdout.write(self.style.SUCCESS(f"--- Moviendo {company.name}: {source} -> {target} ---"))
+        models = tenant_models()
+
+        # 1. Las PK se conservan: abortar si alguna ya existe en el destino.
+        for model, scope in models:
+            ids = model.objects.using(source).filter(tenant_filter(scope, company_id)) \
+                .values_list('pk', flat=True).iterator(chunk_size=batch_size)
+            chunk = []
+            for pk in ids:
+                chunk.append(pk)
+                if len(chunk) >= batch_size:
+                    self._check_collisions(model, target, chunk)
+                    chunk = []
+            self._check_collisions(model, target, chunk)
+
+        # 2. Copiar en orden padre -> hijo dentro de una transacción del destino.
+        mirror_control_rows(target, company_id)
+        with transaction.atomic(using=target):
+            for model, scope in models:
+                copied = self._copy(model, scope, company_id, source, target, batch_size)
+                self.stdout.write(f"   -> {model.__name__}: {copied} filas")
+
+            with connections[target].cursor() as cursor:
+                for sql in connections[target].ops.sequence_reset_sql(no_style(), [m for m, _ in models]):
+                    cursor.execute(sql)
+
+        # 3. Reasignar el shard en la BD de control.
+        Company.objects.using(control_database()).filter(pk=company_id).update(shard=target)
+        forget_company_shard(company_id)
+
+        # 4. Limpiar el origen en orden hijo -> padre.
+        if not options['keep_source']:
+            with transaction.atomic(using=source):
+                for model, scope in reversed(models):
+                    model.objects.using(source).filter(tenant_filter(scope, company_id)).delete()
+                # El borrado descuenta el uso (post_delete, al confirmar) y la copia no lo sumó:
+                # recontar después de esos descuentos.
+                transaction.on_commit(partial(reconcile_company, company_id), using=source)
+
+        self.stdout.write(self.style.SUCCESS(f"🎉 {company.name} ahora vive en '{target}'."))
+
+    def _check_collisions(self, model, target, ids):
+        if ids and model.objects.using(target).filter(pk__in=ids).exists():
+            raise CommandError(
+                f"Conflicto de PK en {model.__name__} en el destino; "
+                "los shards deben usar rangos de secuencia disjuntos."
+            )
+
+    def _copy(self, model, scope, company_id, source, target, batch_size):
+        queryset = model.objects.using(source).filter(tenant_filter(scope, company_id)).order_by('pk')
+        copied, batch = 0, []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.using(target).bulk_create(batch)
+                copied, batch = copied + len(batch), []
+        if batch:
+            model.objects.using(target).bulk_create(batch)
+            copied += len(batch)
+        return copied
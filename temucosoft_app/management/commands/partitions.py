@@ -0,0 +1,81 @@
+# temucosoft_app/management/commands/partitions.py
+
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.partitions import PartitionManager, PartitionError, PARTITIONED_MODELS
+from temucosoft_app.tenancy import tenant_shards
+
+
+class Command(BaseCommand):
+    help = ('Administra las particiones mensuales de Sale, Order y CartItem (PostgreSQL) '
+            'en cada shard de tenants: convert | ensure | archive | list.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('operation', choices=['convert', 'ensure', 'archive', 'list'])
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Limita a un modelo (sale, order, cartitem). Repetible.')
+        parser.add_argument('--months-ahead', type=int,
+                            default=getattr(settings, 'PARTITION_MONTHS_AHEAD', 3))
+        parser.add_argument('--keep-months', type=int,
+                            default=getattr(settings, 'PARTITION_RETENTION_MONTHS', 24),
+                            help='archive: meses que se mantienen en la BD.')
+        parser.add_argument('--month', help='archive: archiva solo este mes (YYYY-MM).')
+        parser.add_argument('--format', choices=['ndjson', 'parquet'], default='ndjson')
+        parser.add_argument('--database', action='append', dest='databases',
+                            help='Limita a un alias de BD (por defecto todos los de TENANT_SHARDS). Repetible.')
+
+    def handle(self, *args, **options):
+        models = PARTITIONED_MODELS
+        if options['models']:
+            wanted = {m.lower() for m in options['models']}
+            models = [m for m in PARTITIONED_MODELS if m._meta.model_name in wanted]
+
+        databases = tenant_shards()
+        if options['databases']:
+            unknown = set(options['databases']) - set(databases)
+            if unknown:
+                raise CommandError(f"No están en TENANT_SHARDS: {', '.join(sorted(unknown))}.")
+            databases = options['databases']
+
+        try:
+            for db in databases:
+                self.stdout.write(self.style.SUCCESS(f"--- {db} ---"))
+                for model in models:
+                    manager = PartitionManager(model, using=db)
+                    getattr(self, f"do_{options['operation']}")(manager, options)
+        except PartitionError as e:
+            raise CommandError(str(e))
+
+    def do_convert(self, manager, options):
+        legacy = manager.convert(months_ahead=options['months_ahead'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {manager.table} particionada. Tabla original conservada como {legacy}."
+        ))
+
+    def do_ensure(self, manager, options):
+        created = manager.ensure_future(months_ahead=options['months_ahead'])
+        for month in created:
+            self.stdout.write(self.style.SUCCESS(f"   -> ✅ Creada {manager.partition_name(month)}"))
+        if not created:
+            self.stdout.write(f"   -> ℹ️ {manager.table}: particiones al día.")
+
+    def do_archive(self, manager, options):
+        if options['month']:
+            year, month = options['month'].split('-')
+            paths = [manager.archive(date(int(year), int(month), 1), fmt=options['format'])]
+        else:
+            paths = manager.archive_older_than(options['keep_months'], fmt=options['format'])
+        for path in paths:
+            self.stdout.write(self.style.SUCCESS(f"   -> ✅ Archivada en {path}"))
+        if not paths:
+            self.stdout.write(f"   -> ℹ️ {manager.table}: nada que archivar.")
+
+    def do_list(self, manager, options):
+        if not manager.is_partitioned():
+            self.stdout.write(f"{manager.table}: sin particionar.")
+            return
+        months = ', '.join(m.strftime('%Y-%m') for m in manager.partitions())
+        self.stdout.write(f"{manager.table}: {months}")
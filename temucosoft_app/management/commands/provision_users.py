@@ -0,0 +1,51 @@
+# temucosoft_app/management/commands/provision_users.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.models import CustomUser
+from temucosoft_app.provisioning import ProvisioningError, provision_users, read_csv, validate_rows
+from temucosoft_app.tenancy import control_database
+
+
+class Command(BaseCommand):
+    help = ('Crea usuarios desde un CSV (username, email, password, role, rut, company) '
+            'con las reglas de rol de --creator. Las contraseñas se hashean en paralelo.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--creator', required=True,
+                            help='Usuario super_admin o admin_cliente que realiza el alta.')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Procesos para el hashing (por defecto, uno por CPU).')
+        parser.add_argument('--dry-run', action='store_true', help='Solo validar el archivo.')
+
+    def handle(self, *args, **options):
+        creator = CustomUser.objects.using(control_database()).select_related('company') \
+            .filter(username=options['creator']).first()
+        if creator is None:
+            raise CommandError(f"No existe el usuario {options['creator']}.")
+
+        self.stdout.write(self.style.SUCCESS(f"--- Alta masiva desde {options['csv_path']} ---"))
+        try:
+            with open(options['csv_path'], encoding='utf-8-sig', newline='') as fh:
+                rows = read_csv(fh)
+            if options['dry_run']:
+                validate_rows(creator, rows)
+                self.stdout.write(self.style.SUCCESS(f"🎉 {len(rows)} filas válidas (sin cambios)."))
+                return
+            start = time.perf_counter()
+            result = provision_users(
+                creator, rows, options['processes'],
+                progress=lambda progress, message: self.stdout.write(f"   -> ✅ [{progress}%] {message}"),
+            )
+        except ProvisioningError as e:
+            for error in e.errors:
+                self.stderr.write(f"   fila {error['row']}: {error['errors']}")
+            raise CommandError(f"{len(e.errors)} filas con errores; no se creó ningún usuario.")
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"🎉 {result['created']} usuarios creados en {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,38 @@
+# temucosoft_app/management/commands/purge_tenant.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.models import Company
+from temucosoft_app.tenancy import control_database
+from temucosoft_app.tenant_purge import PURGE_BATCH_SIZE, PURGE_PAUSE, purge_tenant
+
+
+class Command(BaseCommand):
+    help = ('Elimina por lotes todos los datos de un tenant y la compañía. '
+            'Si se interrumpe, volver a ejecutarlo continúa donde quedó.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('company_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=PURGE_PAUSE,
+                            help='Segundos de espera entre lotes.')
+        parser.add_argument('--keep-company', action='store_true',
+                            help='Conservar la Company (desactivada) y sus usuarios.')
+        parser.add_argument('--yes', action='store_true', help='No pedir confirmación.')
+
+    def handle(self, *args, **options):
+        company_id = options['company_id']
+        company = Company.objects.using(control_database()).filter(pk=company_id).first()
+        if company is None:
+            raise CommandError(f"No existe la compañía {company_id}.")
+        if not options['yes']:
+            answer = input(f"Se eliminarán todos los datos de '{company.name}' ({company.rut}). Escriba el RUT para confirmar: ")
+            if answer.strip() != company.rut:
+                raise CommandError("Purga cancelada.")
+
+        self.stdout.write(self.style.SUCCESS(f"--- Purgando {company.name} ---"))
+        deleted = purge_tenant(
+            company_id, options['batch_size'], options['pause'], keep_company=options['keep_company'],
+            progress=lambda done, total, message: self.stdout.write(f"   -> ✅ [{done}/{total}] {message}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"🎉 {sum(deleted.values())} filas eliminadas."))
@@ -0,0 +1,60 @@
+# temucosoft_app/management/commands/recompute_reorder_points.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.forecasting import ForecastError, ForecastOptions, recompute_companies
+from temucosoft_app.models import Company
+
+
+class Command(BaseCommand):
+    help = 'Recalcula Inventory.reorder_point con el pronóstico de demanda de las ventas (requiere numpy).'
+
+    def add_arguments(self, parser):
+        defaults = ForecastOptions()
+        parser.add_argument('--company', type=int, action='append',
+                            help='Solo estas compañías (repetible). Por defecto, todas las activas.')
+        parser.add_argument('--days', type=int, default=defaults.history_days,
+                            help='Días de historial de ventas.')
+        parser.add_argument('--method', choices=['ma', 'ses'], default=defaults.method,
+                            help='ma: media móvil; ses: suavizado exponencial.')
+        parser.add_argument('--window', type=int, default=defaults.window)
+        parser.add_argument('--alpha', type=float, default=defaults.alpha)
+        parser.add_argument('--lead-time', type=int, default=defaults.lead_time,
+                            help='Días de reposición.')
+        parser.add_argument('--service-level', type=float, default=defaults.service_level)
+        parser.add_argument('--min', type=int, default=defaults.min_reorder_point,
+                            help='Punto de reorden mínimo.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Procesos en paralelo (una compañía por tarea).')
+        parser.add_argument('--dry-run', action='store_true', help='Calcula sin guardar.')
+
+    def handle(self, *args, **options):
+        if not 0 < options['service_level'] < 1:
+            raise CommandError("--service-level debe estar entre 0 y 1.")
+
+        forecast = ForecastOptions(
+            history_days=options['days'], method=options['method'], window=options['window'],
+            alpha=options['alpha'], lead_time=options['lead_time'],
+            service_level=options['service_level'], min_reorder_point=options['min'],
+            dry_run=options['dry_run'],
+        )
+        companies = Company.objects.filter(is_active=True)
+        if options['company']:
+            companies = Company.objects.filter(pk__in=options['company'])
+        names = dict(companies.values_list('pk', 'name'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"--- Recalculando puntos de reorden ({len(names)} compañías, {options['processes']} procesos) ---"
+        ))
+        total = 0
+        try:
+            for stats in recompute_companies(list(names), forecast, options['processes']):
+                total += stats['updated']
+                self.stdout.write(
+                    f"   -> ✅ {names[stats['company']]}: {stats['pairs']} pares, {stats['updated']} cambios"
+                )
+        except ForecastError as e:
+            raise CommandError(str(e))
+
+        verb = 'se actualizarían' if forecast.dry_run else 'actualizados'
+        self.stdout.write(self.style.SUCCESS(f"🎉 {total} puntos de reorden {verb}."))
@@ -0,0 +1,29 @@
+# temucosoft_app/management/commands/reconcile_usage.py
+
+from django.core.management.base import BaseCommand
+
+from temucosoft_app.usage import reconcile_all, reconcile_company
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los contadores de TenantUsage con un conteo real y corrige las diferencias '
+            '(programar periódicamente, p. ej. cada noche).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append',
+                            help='Solo estas compañías (repetible). Por defecto, todas.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Reconciliando contadores de uso ---'))
+        if options['company']:
+            for company_id in options['company']:
+                usage = reconcile_company(company_id)
+                self.stdout.write(f"   -> ✅ {company_id}: {usage.users} usuarios, "
+                                  f"{usage.products} productos, {usage.branches} sucursales")
+            self.stdout.write(self.style.SUCCESS("🎉 Listo."))
+            return
+
+        drift = reconcile_all()
+        for company_id, before, after in drift:
+            self.stdout.write(f"   -> ✅ {company_id}: {before or 'sin fila'} -> {after}")
+        self.stdout.write(self.style.SUCCESS(f"🎉 {len(drift)} compañías corregidas."))
@@ -0,0 +1,66 @@
+# temucosoft_app/management/commands/run_workers.py
+
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from temucosoft_app import jobs
+
+
+def _process_main(threads, poll_interval, once):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    jobs.run_threads(threads, poll_interval=poll_interval, once=once, stop_event=stop_event)
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los workers de trabajos en segundo plano (cola en BD, sin broker externo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=getattr(settings, 'JOBS_WORKER_PROCESSES', 1))
+        parser.add_argument('--threads', type=int,
+                            default=getattr(settings, 'JOBS_WORKER_THREADS', 2))
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true',
+                            help='Procesa la cola pendiente y termina.')
+
+    def handle(self, *args, **options):
+        processes, threads = options['processes'], options['threads']
+        poll_interval, once = options['poll_interval'], options['once']
+
+        requeued, failed = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"ℹ️ {requeued} trabajos abandonados devueltos a la cola."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"ℹ️ {failed} trabajos abandonados sin intentos restantes marcados como fallidos."))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"--- Workers iniciados: {processes} procesos x {threads} hilos ---"
+        ))
+
+        if processes <= 1:
+            jobs.run_threads(threads, poll_interval=poll_interval, once=once)
+            return
+
+        # Cada proceso hijo debe abrir sus propias conexiones a la BD.
+        connections.close_all()
+        pool = [
+            multiprocessing.Process(target=_process_main, args=(threads, poll_interval, once))
+            for _ in range(processes)
+        ]
+        for process in pool:
+            process.start()
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            for process in pool:
+                process.terminate()
+                process.join()
+
+        self.stdout.write(self.style.SUCCESS("🎉 Workers detenidos."))
@@ -0,0 +1,48 @@
+# temucosoft_app/management/commands/slow_queries.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.models import SlowQuery
+from temucosoft_app.slowqueries import summarize, top_slow_queries
+from temucosoft_app.tenancy import control_database
+
+
+class Command(BaseCommand):
+    help = 'Muestra las consultas lentas capturadas, agregadas por huella de SQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', choices=['total', 'count', 'max', 'recent'], default='total')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--fingerprint', help='Muestra el detalle y el peor plan de una huella.')
+        parser.add_argument('--reset', action='store_true', help='Elimina los agregados y termina.')
+
+    def handle(self, *args, **options):
+        queryset = SlowQuery.objects.using(control_database())
+
+        if options['reset']:
+            deleted = queryset.all().delete()[0]
+            self.stdout.write(self.style.SUCCESS(f"✅ {deleted} huellas eliminadas."))
+            return
+
+        if options['fingerprint']:
+            entry = queryset.filter(fingerprint__startswith=options['fingerprint']).first()
+            if entry is None:
+                raise CommandError("Huella no encontrada.")
+            data = summarize(entry, include_plan=True)
+            self.stdout.write(self.style.SUCCESS(f"--- {data['fingerprint']} ({data['view'] or 'sin vista'}) ---"))
+            self.stdout.write(f"   {data['count']} ejecuciones, p50 {data['p50_ms']} ms, "
+                              f"p95 {data['p95_ms']} ms, máx {data['max_ms']} ms")
+            self.stdout.write(f"\n{data['worst_sql']}\n")
+            self.stdout.write(data['worst_plan'] or '(sin plan)')
+            return
+
+        entries = [summarize(e) for e in top_slow_queries(options['order'], options['limit'])]
+        if not entries:
+            self.stdout.write("No hay consultas lentas registradas.")
+            return
+        for data in entries:
+            self.stdout.write(
+                f"{data['fingerprint'][:12]}  {data['count']:>6}x  p50 {data['p50_ms']:>9.1f}  "
+                f"p95 {data['p95_ms']:>9.1f}  máx {data['max_ms']:>9.1f} ms  {data['view']}"
+            )
+            self.stdout.write(f"    {data['sql'][:160]}")
@@ -0,0 +1,35 @@
+# temucosoft_app/management/commands/snapshot_valuation.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from temucosoft_app.models import Company
+from temucosoft_app.reports import snapshot_valuation
+from temucosoft_app.tenancy import use_tenant_shard
+
+
+class Command(BaseCommand):
+    help = 'Guarda la foto diaria de valorización de inventario (programar una vez al día).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append',
+                            help='Solo estas compañías (repetible). Por defecto, todas las activas.')
+        parser.add_argument('--date', help='Fecha de la foto (YYYY-MM-DD). Por defecto, hoy.')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError("Formato de fecha esperado: YYYY-MM-DD.")
+
+        companies = Company.objects.filter(is_active=True)
+        if options['company']:
+            companies = Company.objects.filter(pk__in=options['company'])
+
+        self.stdout.write(self.style.SUCCESS('--- Fotos de valorización de inventario ---'))
+        for company in companies:
+            with use_tenant_shard(company.pk):
+                rows = snapshot_valuation(company, day)
+            self.stdout.write(f"   -> ✅ {company.name}: {rows} filas")
+        self.stdout.write(self.style.SUCCESS("🎉 Listo."))
@@ -0,0 +1,108 @@
+# temucosoft_app/management/commands/warmup.py
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from temucosoft_app.warmup import STAGES, WARMUP_TENANTS, warm_up
+
+# Proceso nuevo para el benchmark: mide django.setup() y las primeras peticiones.
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup_ms = (time.perf_counter() - start) * 1000
+warmup_ms = 0
+if sys.argv[1] == 'warm':
+    from temucosoft_app.warmup import warm_up
+    start = time.perf_counter()
+    warm_up(tenants=int(sys.argv[2]))
+    warmup_ms = (time.perf_counter() - start) * 1000
+from temucosoft_app.management.commands.warmup import probe_requests
+print(json.dumps({'setup_ms': setup_ms, 'warmup_ms': warmup_ms, 'requests': probe_requests()}))
+"""
+
+
+def probe_requests():
+    """Primera y segunda petición a URLs representativas, en ms."""
+    from django.test import Client
+    from rest_framework.test import APIClient
+
+    from temucosoft_app.models import CustomUser, TenantUsage
+
+    usage = TenantUsage.objects.filter(company__is_active=True).order_by('-products').first()
+    if usage is None:
+        return []
+    targets = [(f"/shop/products/?company={usage.company_id}", Client(HTTP_HOST='localhost'))]
+    user = CustomUser.objects.filter(company_id=usage.company_id, role__in=['admin_cliente', 'gerente']).first()
+    if user is not None:
+        api = APIClient(HTTP_HOST='localhost')
+        api.force_authenticate(user)
+        targets += [('/api/products/', api), ('/api/branches/', api)]
+
+    results = []
+    for url, client in targets:
+        times = []
+        for _ in range(2):
+            start = time.perf_counter()
+            status = client.get(url).status_code
+            times.append((time.perf_counter() - start) * 1000)
+        results.append({'url': url, 'status': status, 'first_ms': times[0], 'second_ms': times[1]})
+    return results
+
+
+class Command(BaseCommand):
+    help = ('Precalienta el proceso (URLs, plantillas, serializers, conexiones y caches de los '
+            'tenants más grandes). Con --bench compara un proceso frío con uno precalentado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stages', default=','.join(STAGES),
+                            help=f"Etapas separadas por coma ({', '.join(STAGES)}).")
+        parser.add_argument('--tenants', type=int, default=WARMUP_TENANTS,
+                            help='Compañías (las de más productos) cuyo catálogo se precarga.')
+        parser.add_argument('--bench', action='store_true',
+                            help='Mide arranque y primeras peticiones sin y con warm-up.')
+
+    def handle(self, *args, **options):
+        if options['bench']:
+            return self._bench(options['tenants'])
+
+        stages = [s.strip() for s in options['stages'].split(',') if s.strip()]
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            raise CommandError(f"Etapas desconocidas: {', '.join(unknown)}")
+
+        self.stdout.write(self.style.SUCCESS("--- Warm-up ---"))
+        for stage, (result, ms) in warm_up(stages, options['tenants']).items():
+            self.stdout.write(f"   -> ✅ {stage}: {result} en {ms:.1f} ms")
+        self.stdout.write(self.style.SUCCESS("🎉 Proceso precalentado."))
+
+    def _probe(self, mode, tenants):
+        env = dict(os.environ, TEMUCOSOFT_WARMUP='0')
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        proc = subprocess.run([sys.executable, '-c', PROBE, mode, str(tenants)], env=env,
+                              cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise CommandError(f"Falló el proceso de medición ({mode}):\n{proc.stderr[-2000:]}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    def _bench(self, tenants):
+        self.stdout.write(self.style.SUCCESS("--- Benchmark de arranque (procesos nuevos) ---"))
+        cold, warm = self._probe('cold', tenants), self._probe('warm', tenants)
+        self.stdout.write(f"   django.setup(): frío {cold['setup_ms']:.0f} ms, precalentado {warm['setup_ms']:.0f} ms "
+                          f"(+ warm-up {warm['warmup_ms']:.0f} ms, antes de recibir tráfico)")
+        self.stdout.write(f"   {'URL':<34} {'1ª frío':>9} {'1ª warm':>9} {'2ª frío':>9} {'2ª warm':>9}")
+        warm_by_url = {r['url']: r for r in warm['requests']}
+        for row in cold['requests']:
+            other = warm_by_url.get(row['url'], {})
+            self.stdout.write(
+                f"   {row['url']:<34} {row['first_ms']:>9.1f} {other.get('first_ms', 0):>9.1f} "
+                f"{row['second_ms']:>9.1f} {other.get('second_ms', 0):>9.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS("🎉 Benchmark terminado (tiempos en ms)."))
@@ -0,0 +1,31 @@
+from django.middleware.gzip import GZipMiddleware
+
+from .tenancy import use_tenant_shard
+
+
+class TenantShardMiddleware:
+    """Fija el shard del tenant del usuario de sesión durante la petición."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        company_id = getattr(user, 'company_id', None) if user and user.is_authenticated else None
+        if company_id is None:
+            return self.get_response(request)
+        with use_tenant_shard(company_id):
+            return self.get_response(request)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZip de las respuestas con cuerpo completo. Las respuestas en streaming
+    (SSE de stock, descargas de trabajos) pasan sin comprimir: gzip retendría
+    los eventos en su buffer y los archivos ya vienen comprimidos.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        return super().process_response(request, response)
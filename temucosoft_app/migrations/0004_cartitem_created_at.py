@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_created_at(apps, schema_editor):
+    """Copia la fecha de la Sale/Order a sus líneas existentes."""
+    CartItem = apps.get_model('temucosoft_app', 'CartItem')
+    Sale = apps.get_model('temucosoft_app', 'Sale')
+    Order = apps.get_model('temucosoft_app', 'Order')
+
+    CartItem.objects.filter(sale__isnull=False).update(
+        created_at=models.Subquery(Sale.objects.filter(pk=models.OuterRef('sale_id')).values('created_at')[:1])
+    )
+    CartItem.objects.filter(sale__isnull=True, order__isnull=False).update(
+        created_at=models.Subquery(Order.objects.filter(pk=models.OuterRef('order_id')).values('created_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0004_cartitem_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='shard',
+            field=models.CharField(default='default', max_length=50),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0005_company_shard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=50)),
+                ('aggregate_id', models.BigIntegerField()),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='temucosoft_app.company')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'id'], name='outbox_feed_idx'), models.Index(fields=['delivered_at', 'next_attempt_at'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
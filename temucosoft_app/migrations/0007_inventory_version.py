@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0006_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0010_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryValuationSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(max_length=50)),
+                ('products', models.IntegerField(default=0)),
+                ('units', models.BigIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('retail_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('potential_margin', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='temucosoft_app.branch')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='temucosoft_app.company')),
+            ],
+            options={
+                'unique_together': {('company', 'date', 'branch', 'category')},
+            },
+        ),
+    ]
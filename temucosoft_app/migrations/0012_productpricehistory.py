@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0011_inventoryvaluationsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('valid_from', models.DateTimeField(default=django.utils.timezone.now)),
+                ('source', models.CharField(default='api', max_length=20)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='temucosoft_app.customuser')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='temucosoft_app.company')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='temucosoft_app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'valid_from'], name='price_history_asof_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+import datetime
+
+from django.db import migrations
+
+BATCH = 1000
+
+
+def backfill_price_history(apps, schema_editor):
+    """
+    Una fila inicial por producto sin historial. Antes de esta tabla el
+    único valor conocido es el actual, así que rige desde el 2000-01-01.
+    """
+    Product = apps.get_model('temucosoft_app', 'Product')
+    ProductPriceHistory = apps.get_model('temucosoft_app', 'ProductPriceHistory')
+    db = schema_editor.connection.alias
+    since = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+    rows = Product.objects.using(db).filter(price_history__isnull=True) \
+        .values_list('id', 'company_id', 'price', 'cost').iterator(chunk_size=BATCH)
+    batch = []
+    for product_id, company_id, price, cost in rows:
+        batch.append(ProductPriceHistory(
+            product_id=product_id, company_id=company_id, price=price, cost=cost,
+            valid_from=since, source='initial',
+        ))
+        if len(batch) >= BATCH:
+            ProductPriceHistory.objects.using(db).bulk_create(batch)
+            batch = []
+    if batch:
+        ProductPriceHistory.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0012_productpricehistory'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_price_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+RECEIPT_CONSTRAINT = models.UniqueConstraint(fields=('branch', 'receipt_number'), name='sale_branch_receipt_uniq')
+# Sale ya particionada (partitions.py): un UNIQUE sin created_at no es posible en
+# PostgreSQL, así que queda un índice simple, como en PartitionManager.convert();
+# la unicidad la garantiza receipts.py.
+RECEIPT_INDEX = models.Index(fields=('branch', 'receipt_number'), name='sale_branch_receipt_idx')
+
+
+def sale_is_partitioned(schema_editor, model):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s", [model._meta.db_table]
+        )
+        return cursor.fetchone() is not None
+
+
+def add_receipt_constraint(apps, schema_editor):
+    Sale = apps.get_model('temucosoft_app', 'Sale')
+    if sale_is_partitioned(schema_editor, Sale):
+        schema_editor.add_index(Sale, RECEIPT_INDEX)
+    else:
+        schema_editor.add_constraint(Sale, RECEIPT_CONSTRAINT)
+
+
+def remove_receipt_constraint(apps, schema_editor):
+    Sale = apps.get_model('temucosoft_app', 'Sale')
+    if sale_is_partitioned(schema_editor, Sale):
+        schema_editor.remove_index(Sale, RECEIPT_INDEX)
+    else:
+        schema_editor.remove_constraint(Sale, RECEIPT_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0013_backfill_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='receipt_number',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(model_name='sale', constraint=RECEIPT_CONSTRAINT),
+            ],
+            database_operations=[
+                migrations.RunPython(add_receipt_constraint, remove_receipt_constraint),
+            ],
+        ),
+        migrations.AddField(
+            model_name='branchsequence',
+            name='branch',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_sequence', to='temucosoft_app.branch'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0016_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['company', 'supplier', 'date'], name='purchase_supplier_date_idx'),
+        ),
+    ]
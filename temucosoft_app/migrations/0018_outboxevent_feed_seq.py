@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0017_purchase_supplier_date_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxevent',
+            name='outbox_feed_idx',
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='feed_seq',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='outboxevent',
+            index=models.Index(fields=['company', 'feed_seq'], name='outbox_feed_idx'),
+        ),
+    ]
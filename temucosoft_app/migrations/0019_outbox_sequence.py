@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_sequences(apps, schema_editor):
+    """
+    Hasta aquí feed_seq era único en toda la tabla: partir cada compañía del
+    máximo del shard deja todos los cursores ya entregados por debajo.
+    """
+    db = schema_editor.connection.alias
+    Company = apps.get_model('temucosoft_app', 'Company')
+    OutboxEvent = apps.get_model('temucosoft_app', 'OutboxEvent')
+    OutboxSequence = apps.get_model('temucosoft_app', 'OutboxSequence')
+    last = OutboxEvent.objects.using(db).aggregate(last=Max('feed_seq'))['last'] or 0
+    OutboxSequence.objects.using(db).bulk_create([
+        OutboxSequence(company_id=pk, last_value=last)
+        for pk in Company.objects.using(db).values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('temucosoft_app', '0018_outboxevent_feed_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxSequence',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='outbox_sequence', serialize=False, to='temucosoft_app.company')),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='outboxevent',
+            name='outbox_feed_idx',
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='feed_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='outboxevent',
+            constraint=models.UniqueConstraint(fields=('company', 'feed_seq'), name='outbox_company_feed_seq_uniq'),
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -23,6 +23,13 @@ ORDER_STATUS_CHOICES = (
     ('entregado', 'Entregado'),
 )
 
+JOB_STATUS_CHOICES = (
+    ('pendiente', 'Pendiente'),
+    ('en_proceso', 'En proceso'),
+    ('completado', 'Completado'),
+    ('fallido', 'Fallido'),
+)
+
 PLAN_CHOICES = (
     ('basico', 'Básico'),
     ('estandar', 'Estándar'),
@@ -62,6 +69,9 @@ class Company(models.Model):
     
     subscription_status = models.CharField(max_length=50, default='activo') 
 
+    # Alias de settings.DATABASES donde viven los datos de este tenant (ver routers.py).
+    shard = models.CharField(max_length=50, default='default')
+
     def __str__(self):
         return self.name
     
@@ -106,6 +116,18 @@ class CustomUser(AbstractUser):
             if not is_valid_rut(self.rut):
                 raise ValidationError({'rut': "El RUT del Usuario ingresado no es válido."})
 
+
+class TenantUsage(models.Model):
+    """Contadores de uso por compañía (límites del plan y dashboard); ver usage.py."""
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name='usage')
+    users = models.IntegerField(default=0)
+    products = models.IntegerField(default=0)
+    branches = models.IntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.company_id}: {self.users} usuarios, {self.products} productos, {self.branches} sucursales"
+
 # ====================================================================
 # INVENTARIO Y PROVEEDORES
 # ====================================================================
@@ -120,9 +142,23 @@ class Product(models.Model):
     cost = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=50)
 
+    class Meta:
+        indexes = [
+            # Paginación por keyset del catálogo (catalog.py), con y sin categoría.
+            models.Index(fields=['company', 'name', 'id'], name='product_catalog_idx'),
+            models.Index(fields=['company', 'category', 'name', 'id'], name='product_category_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Precio/costo leídos, para registrar ProductPriceHistory solo si cambian.
+        instance._loaded_prices = (instance.__dict__.get('price'), instance.__dict__.get('cost'))
+        return instance
+
     def clean(self):
         super().clean()
         if self.price < 0:
@@ -130,6 +166,24 @@ class Product(models.Model):
         if self.cost < 0:
             raise ValidationError({'cost': "El costo debe ser mayor o igual a cero."})
 
+class ProductPriceHistory(models.Model):
+    """Precio y costo vigentes de un producto desde `valid_from` (ver pricing.py, as-of)."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    cost = models.DecimalField(max_digits=10, decimal_places=2)
+    valid_from = models.DateTimeField(default=timezone.now)
+    source = models.CharField(max_length=20, default='api')
+    changed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'valid_from'], name='price_history_asof_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.price} desde {self.valid_from:%Y-%m-%d %H:%M}"
+
 class Branch(models.Model):
     """Sucursal: nombre, dirección, teléfono[cite: 51]."""
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -140,6 +194,15 @@ class Branch(models.Model):
     def __str__(self):
         return f"{self.name} ({self.company.name})"
 
+class BranchSequence(models.Model):
+    """Próximo número de boleta libre de una sucursal; se reserva por bloques (ver receipts.py)."""
+    branch = models.OneToOneField(Branch, on_delete=models.CASCADE, related_name='receipt_sequence')
+    next_value = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.branch_id}: {self.next_value}"
+
 class Supplier(models.Model):
     """Proveedor: nombre, rut (validar), contacto[cite: 55]."""
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -163,6 +226,8 @@ class Inventory(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     stock = models.IntegerField(default=0)
     reorder_point = models.IntegerField(default=5)
+    # Control de concurrencia optimista: todo cambio de stock incrementa la versión.
+    version = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ('branch', 'product')
@@ -185,9 +250,16 @@ class Purchase(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.PROTECT)
     branch = models.ForeignKey(Branch, on_delete=models.PROTECT)
     user = models.ForeignKey(CustomUser, on_delete=models.PROTECT)
-    date = models.DateField(default=timezone.now)
+    date = models.DateField(default=timezone.localdate)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='purchase_date_idx'),
+            # Reporte de proveedores (reports.supplier_report).
+            models.Index(fields=['company', 'supplier', 'date'], name='purchase_supplier_date_idx'),
+        ]
+
     def __str__(self):
         return f"Compra {self.pk} a {self.supplier.name}"
 
@@ -203,6 +275,30 @@ class PurchaseItem(models.Model):
     quantity = models.IntegerField()
     unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
 
+class StockTransfer(models.Model):
+    """Traspaso de stock entre dos sucursales de la misma compañía."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    from_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='transfers_out')
+    to_branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='transfers_in')
+    user = models.ForeignKey(CustomUser, on_delete=models.PROTECT)
+    note = models.CharField(max_length=255, blank=True)
+    total_units = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Traspaso {self.pk}: {self.from_branch_id} -> {self.to_branch_id}"
+
+    def clean(self):
+        super().clean()
+        if self.from_branch_id == self.to_branch_id:
+            raise ValidationError({'to_branch': "La sucursal de destino debe ser distinta a la de origen."})
+
+class StockTransferItem(models.Model):
+    """Línea de un traspaso."""
+    transfer = models.ForeignKey(StockTransfer, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT)
+    quantity = models.IntegerField()
+
 class Sale(models.Model):
     """Transacción de venta en Punto de Venta (POS)[cite: 61, 192]."""
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -210,8 +306,18 @@ class Sale(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.PROTECT)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=50)
+    # Correlativo por sucursal (receipts.next_receipt_number); puede tener saltos.
+    receipt_number = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='sale_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'receipt_number'], name='sale_branch_receipt_uniq'),
+        ]
+
     def __str__(self):
         return f"Venta POS {self.pk} - Total: {self.total}"
 
@@ -230,6 +336,11 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Orden E-comm {self.pk} - Cliente: {self.client_name}"
 
@@ -240,6 +351,13 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Clave de partición mensual (ver partitions.py).
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='cartitem_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
@@ -248,3 +366,130 @@ class CartItem(models.Model):
         super().clean()
         if self.quantity < 1:
             raise ValidationError({'quantity': "La cantidad del ítem debe ser mayor o igual a uno."})
+
+
+# ====================================================================
+# REPORTES
+# ====================================================================
+
+class InventoryValuationSnapshot(models.Model):
+    """Foto diaria de la valorización de inventario por sucursal y categoría."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
+    category = models.CharField(max_length=50)
+    products = models.IntegerField(default=0)
+    units = models.BigIntegerField(default=0)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    retail_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    potential_margin = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('company', 'date', 'branch', 'category')
+
+    def __str__(self):
+        return f"Valorización {self.date} sucursal {self.branch_id} / {self.category}"
+
+
+# ====================================================================
+# OUTBOX TRANSACCIONAL
+# ====================================================================
+
+class OutboxEvent(models.Model):
+    """Evento de dominio escrito en la misma transacción que la venta/compra/orden."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    event_type = models.CharField(max_length=50)
+    aggregate_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Posición en el feed de la compañía, asignada por el dispatcher a eventos ya
+    # confirmados (outbox.py) a partir de OutboxSequence.
+    feed_seq = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivered_at', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'feed_seq'], name='outbox_company_feed_seq_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.aggregate_id}"
+
+
+class OutboxSequence(models.Model):
+    """
+    Último feed_seq asignado a la compañía. No baja al purgar eventos y se
+    mueve con el tenant (move_tenant), así los cursores de los consumidores
+    siguen siendo válidos.
+    """
+    # La PK es la compañía: no choca entre shards al mover el tenant.
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='outbox_sequence')
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.company_id}: {self.last_value}"
+
+
+# ====================================================================
+# TRABAJOS EN SEGUNDO PLANO
+# ====================================================================
+
+class Job(models.Model):
+    """Trabajo encolado en la BD y ejecutado por `manage.py run_workers` (sin broker externo)."""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default='pendiente')
+    priority = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    progress = models.IntegerField(default=0)
+    progress_message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.name} ({self.get_status_display()})"
+
+
+# ====================================================================
+# DIAGNÓSTICO
+# ====================================================================
+
+class SlowQuery(models.Model):
+    """Consultas lentas agregadas por huella de SQL normalizado (ver slowqueries.py)."""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    sql = models.TextField()
+    db_alias = models.CharField(max_length=50)
+    view = models.CharField(max_length=255, blank=True)
+    count = models.IntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    # Duraciones más recientes, para p50/p95.
+    samples = models.JSONField(default=list)
+    worst_sql = models.TextField(blank=True)
+    worst_plan = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.fingerprint} ({self.count}x, máx {self.max_ms:.0f} ms)"
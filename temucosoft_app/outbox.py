@@ -0,0 +1,239 @@
+"""
+Outbox transaccional y despacho por lotes a sinks externos.
+
+record_event() se llama dentro de la transacción que crea la venta, compra
+u orden, de modo que el evento existe si y solo si la operación se
+confirmó. `manage.py dispatch_outbox` numera los eventos confirmados y
+drena los pendientes en lotes, en ese orden por tenant, hacia los sinks de
+settings.OUTBOX_SINKS.
+
+Orden: el id se asigna en el INSERT, no en el COMMIT. Una venta que toma el
+id 10 y confirma después de otra con el id 11 haría que un consumidor que
+ya avanzó a 11 nunca viera el 10. Por eso el orden del feed y de la entrega
+es `feed_seq`: el dispatcher lo asigna a los eventos confirmados que aún no
+lo tienen, por compañía, a partir de OutboxSequence. Esa fila se bloquea
+mientras se numera (dos dispatchers no se pisan) y guarda el último valor
+entregado: no baja al purgar eventos y viaja con el tenant en move_tenant,
+así ningún evento nuevo queda bajo un cursor ya entregado.
+
+Sin sinks los eventos nunca se marcan entregados; la purga borra entonces
+los ya numerados por antigüedad (los consumidores del feed deben leer
+antes de ese plazo).
+
+La entrega es al-menos-una-vez: los consumidores deben deduplicar por el
+`id` del evento.
+"""
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent, OutboxSequence
+from .tenancy import tenant_shards
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 15 * 60
+
+
+class SinkBackpressure(Exception):
+    """El destino pidió bajar el ritmo (p. ej. HTTP 429/503)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def record_event(event_type, instance, payload):
+    """Escribe un OutboxEvent en la BD (y transacción) de `instance`."""
+    return OutboxEvent.objects.using(instance._state.db).create(
+        company_id=instance.company_id,
+        event_type=event_type,
+        aggregate_id=instance.pk,
+        payload=payload,
+    )
+
+
+def serialize_event(event):
+    return {
+        'id': event.pk,
+        'company': event.company_id,
+        'type': event.event_type,
+        'aggregate_id': event.aggregate_id,
+        'created_at': event.created_at,
+        'payload': event.payload,
+    }
+
+
+# --------------------------------------------------------------------
+# Sinks
+# --------------------------------------------------------------------
+
+class FileSink:
+    """Agrega los eventos como NDJSON a un archivo local."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def send(self, events):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            for event in events:
+                fh.write(json.dumps(serialize_event(event), cls=DjangoJSONEncoder))
+                fh.write('\n')
+
+
+class WebhookSink:
+    """POST de {"events": [...]} a una URL; 429/503 se tratan como backpressure."""
+
+    def __init__(self, url, timeout=10, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def send(self, events):
+        body = json.dumps({'events': [serialize_event(e) for e in events]}, cls=DjangoJSONEncoder)
+        request = urllib.request.Request(
+            self.url, data=body.encode('utf-8'), method='POST',
+            headers={'Content-Type': 'application/json', **self.headers},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 503):
+                retry_after = e.headers.get('Retry-After')
+                raise SinkBackpressure(f"HTTP {e.code}", int(retry_after) if retry_after else None)
+            raise
+
+
+def load_sinks():
+    sinks = []
+    for conf in getattr(settings, 'OUTBOX_SINKS', []):
+        sinks.append(import_string(conf['class'])(**conf.get('options', {})))
+    return sinks
+
+
+# --------------------------------------------------------------------
+# Despacho
+# --------------------------------------------------------------------
+
+class Dispatcher:
+    """
+    Drena el outbox de cada shard. Por tenant se entrega en orden de
+    feed_seq y, si un lote falla, los eventos posteriores de ese tenant esperan.
+    Debe haber un único dispatcher activo para mantener el orden.
+    """
+
+    def __init__(self, sinks, batch_size=500):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.pause_until = 0
+
+    def run_once(self):
+        """Numera y despacha un ciclo en todos los shards. Devuelve (numerados, entregados)."""
+        sequenced = delivered = 0
+        for db in tenant_shards():
+            sequenced += self.sequence(db)
+            if self.sinks and time.monotonic() >= self.pause_until:
+                delivered += self._drain(db)
+        return sequenced, delivered
+
+    def sequence(self, db):
+        """Asigna feed_seq, en orden de id, a los eventos confirmados que aún no lo tienen."""
+        events = OutboxEvent.objects.using(db)
+        companies = list(events.filter(feed_seq__isnull=True).order_by()
+                         .values_list('company_id', flat=True).distinct())
+        sequenced = 0
+        for company_id in companies:
+            with transaction.atomic(using=db):
+                counter = self._lock_sequence(db, company_id)
+                # Leído con la fila bloqueada: otro dispatcher ya no puede numerar estos eventos.
+                ids = list(events.filter(company_id=company_id, feed_seq__isnull=True).order_by('id')
+                           .values_list('id', flat=True)[:self.batch_size])
+                if not ids:
+                    continue
+                events.bulk_update(
+                    [OutboxEvent(pk=pk, feed_seq=counter.last_value + n) for n, pk in enumerate(ids, 1)],
+                    ['feed_seq'],
+                )
+                OutboxSequence.objects.using(db).filter(pk=company_id) \
+                    .update(last_value=counter.last_value + len(ids))
+                sequenced += len(ids)
+        return sequenced
+
+    def _lock_sequence(self, db, company_id):
+        sequences = OutboxSequence.objects.using(db).select_for_update()
+        counter = sequences.filter(company_id=company_id).first()
+        if counter is None:
+            last = OutboxEvent.objects.using(db).filter(company_id=company_id) \
+                .aggregate(last=Max('feed_seq'))['last'] or 0
+            counter, _ = sequences.get_or_create(company_id=company_id, defaults={'last_value': last})
+        return counter
+
+    def _drain(self, db):
+        now = timezone.now()
+        pending = OutboxEvent.objects.using(db).filter(delivered_at__isnull=True, feed_seq__isnull=False)
+        # Un tenant con un evento en espera de reintento queda bloqueado completo.
+        blocked = set(pending.filter(next_attempt_at__gt=now).values_list('company_id', flat=True).distinct())
+        events = list(pending.exclude(company_id__in=blocked).order_by('feed_seq')[:self.batch_size])
+        if not events:
+            return 0
+
+        by_company = {}
+        for event in events:
+            by_company.setdefault(event.company_id, []).append(event)
+
+        delivered = 0
+        for company_id, batch in by_company.items():
+            try:
+                for sink in self.sinks:
+                    sink.send(batch)
+            except SinkBackpressure as e:
+                self.pause_until = time.monotonic() + (e.retry_after or 5)
+                logger.warning(f"Outbox: backpressure del destino ({e}); pausa.")
+                return delivered
+            except Exception as e:
+                logger.error(f"Outbox: error entregando eventos de la compañía {company_id}: {e}")
+                self._schedule_retry(db, batch[0], str(e))
+                continue
+
+            OutboxEvent.objects.using(db).filter(pk__in=[e.pk for e in batch]) \
+                .update(delivered_at=timezone.now())
+            delivered += len(batch)
+        return delivered
+
+    def _schedule_retry(self, db, event, error):
+        attempts = event.attempts + 1
+        delay = min(MAX_BACKOFF, 2 ** attempts)
+        OutboxEvent.objects.using(db).filter(pk=event.pk).update(
+            attempts=attempts,
+            last_error=error,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def purge(self, older_than_days):
+        """
+        Elimina eventos entregados hace más de `older_than_days` días; sin
+        sinks, los numerados creados hace más de ese plazo.
+        """
+        limit = timezone.now() - timedelta(days=older_than_days)
+        if self.sinks:
+            old = {'delivered_at__lt': limit}
+        else:
+            old = {'feed_seq__isnull': False, 'created_at__lt': limit}
+        deleted = 0
+        for db in tenant_shards():
+            with transaction.atomic(using=db):
+                deleted += OutboxEvent.objects.using(db).filter(**old).delete()[0]
+        return deleted
@@ -0,0 +1,484 @@
+"""
+Particionado mensual por rango (PostgreSQL) y archivado de Sale, Order y CartItem.
+
+- convert(): reemplaza la tabla por una tabla particionada por `created_at`
+  con una partición por mes más una partición DEFAULT.
+- ensure_future(): crea por adelantado las particiones de los próximos meses.
+- archive(): exporta una partición antigua a NDJSON.gz (o Parquet si
+  pyarrow está instalado) y la separa (DETACH) y elimina en la misma
+  transacción. archive_default() hace lo mismo con las filas antiguas que
+  quedaron en la partición DEFAULT (un archivo por mes, luego DELETE).
+- iter_archived_rows() / archived_company_rows(): ruta de lectura para los
+  meses ya archivados (Sale, Order y CartItem).
+
+Cada shard tiene sus propias particiones: PartitionManager recibe el alias
+de BD (`using`) y los archivos llevan ese alias en el nombre
+(<tabla>/YYYY-MM.<alias>.ndjson.gz), así dos shards no se pisan el mismo
+mes. Las lecturas recorren todos los archivos del mes y filtran por
+compañía, por lo que un tenant movido de shard sigue viendo su historial.
+
+Las particiones se llaman <tabla>_pYYYYMM. PostgreSQL exige que la PK
+incluya la clave de partición, por lo que la PK pasa a ser (id, created_at)
+y las FK desde CartItem hacia Sale/Order dejan de existir a nivel de BD
+(la integridad la mantiene la aplicación, que siempre crea ambas en la
+misma transacción).
+"""
+import gzip
+import json
+import logging
+from datetime import date
+from decimal import Decimal
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Sale, Order, CartItem
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY = 'created_at'
+PARTITIONED_MODELS = (Sale, Order, CartItem)
+ARCHIVE_DIR = Path(getattr(settings, 'ARCHIVE_DIR', settings.BASE_DIR / 'var' / 'archive'))
+ARCHIVE_CHUNK_SIZE = 5000
+
+
+class PartitionError(Exception):
+    pass
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_label(month):
+    return month.strftime('%Y%m')
+
+
+class PartitionManager:
+    """Administra las particiones mensuales de la tabla de un modelo."""
+
+    def __init__(self, model, using=DEFAULT_DB_ALIAS):
+        self.model = model
+        self.using = using
+        self.connection = connections[using]
+        self.table = model._meta.db_table
+        self.qn = self.connection.ops.quote_name
+
+    def _check_vendor(self):
+        if self.connection.vendor != 'postgresql':
+            raise PartitionError("El particionado solo está disponible en PostgreSQL.")
+
+    def partition_name(self, month):
+        return f"{self.table}_p{month_label(month)}"
+
+    def is_partitioned(self):
+        self._check_vendor()
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = %s", [self.table]
+            )
+            return cursor.fetchone() is not None
+
+    def partitions(self):
+        """Meses con partición propia adjunta (excluye DEFAULT), ordenados."""
+        self._check_vendor()
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = %s", [self.table]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        prefix = f"{self.table}_p"
+        months = []
+        for name in names:
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit():
+                months.append(date(int(suffix[:4]), int(suffix[4:]), 1))
+        return sorted(months)
+
+    def _create_partition(self, cursor, month, parent=None):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.qn(self.partition_name(month))} "
+            f"PARTITION OF {self.qn(parent or self.table)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [month.isoformat(), add_months(month, 1).isoformat()]
+        )
+
+    def convert(self, months_ahead=3):
+        """Convierte la tabla existente en una tabla particionada por mes."""
+        if self.is_partitioned():
+            raise PartitionError(f"{self.table} ya está particionada.")
+
+        qn, table = self.qn, self.table
+        new_table, legacy_table = f"{table}_partitioned", f"{table}_legacy"
+        pk = self.model._meta.pk.column
+
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT MIN({qn(PARTITION_KEY)}) FROM {qn(table)}")
+            oldest = cursor.fetchone()[0] or timezone.now()
+
+            cursor.execute(
+                f"CREATE TABLE {qn(new_table)} (LIKE {qn(table)} INCLUDING DEFAULTS "
+                f"INCLUDING IDENTITY) PARTITION BY RANGE ({qn(PARTITION_KEY)})"
+            )
+            cursor.execute(f"ALTER TABLE {qn(new_table)} ADD PRIMARY KEY ({qn(pk)}, {qn(PARTITION_KEY)})")
+
+            month, last = month_start(oldest), add_months(month_start(timezone.now()), months_ahead)
+            while month <= last:
+                self._create_partition(cursor, month, parent=new_table)
+                month = add_months(month, 1)
+            cursor.execute(f"CREATE TABLE {qn(table + '_pdefault')} PARTITION OF {qn(new_table)} DEFAULT")
+
+            cursor.execute(f"INSERT INTO {qn(new_table)} SELECT * FROM {qn(table)}")
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({qn(pk)}), 1)) "
+                f"FROM {qn(new_table)}", [new_table, pk]
+            )
+
+            # FK e índices (columna + fecha, el filtro típico de reportes por tenant).
+            partitioned_tables = {m._meta.db_table for m in PARTITIONED_MODELS}
+            for field in self.model._meta.concrete_fields:
+                if not field.is_relation:
+                    continue
+                cursor.execute(
+                    f"CREATE INDEX ON {qn(new_table)} ({qn(field.column)}, {qn(PARTITION_KEY)})"
+                )
+                target = field.related_model._meta
+                if target.db_table not in partitioned_tables:
+                    cursor.execute(
+                        f"ALTER TABLE {qn(new_table)} ADD FOREIGN KEY ({qn(field.column)}) "
+                        f"REFERENCES {qn(target.db_table)} ({qn(target.pk.column)}) "
+                        f"DEFERRABLE INITIALLY DEFERRED"
+                    )
+
+            # Rango por fecha sin filtro de FK (jerarquía de fechas del admin).
+            cursor.execute(f"CREATE INDEX ON {qn(new_table)} ({qn(PARTITION_KEY)})")
+
+            # Un UNIQUE sin la clave de partición no es posible: queda como índice simple
+            # (p. ej. Sale.receipt_number, cuya unicidad garantiza receipts.py).
+            for constraint in self.model._meta.constraints:
+                if isinstance(constraint, models.UniqueConstraint) and constraint.fields:
+                    columns = ', '.join(qn(self.model._meta.get_field(f).column) for f in constraint.fields)
+                    cursor.execute(f"CREATE INDEX ON {qn(new_table)} ({columns})")
+
+            # Las FK que apuntan a esta tabla no pueden referenciar una PK compuesta.
+            cursor.execute(
+                "SELECT con.conname, rel.relname FROM pg_constraint con "
+                "JOIN pg_class rel ON rel.oid = con.conrelid "
+                "WHERE con.contype = 'f' AND con.confrelid = %s::regclass", [table]
+            )
+            for constraint, referencing in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {qn(referencing)} DROP CONSTRAINT {qn(constraint)}")
+
+            cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy_table)}")
+            cursor.execute(f"ALTER TABLE {qn(new_table)} RENAME TO {qn(table)}")
+
+        logger.info(f"{table} ({self.using}) convertida a tabla particionada; copia original en {legacy_table}.")
+        return legacy_table
+
+    def ensure_future(self, months_ahead=3):
+        """Crea las particiones del mes actual y los `months_ahead` siguientes."""
+        if not self.is_partitioned():
+            raise PartitionError(f"{self.table} no está particionada.")
+        created = []
+        existing = set(self.partitions())
+        month = month_start(timezone.now())
+        with self.connection.cursor() as cursor:
+            for _ in range(months_ahead + 1):
+                if month not in existing:
+                    self._create_partition(cursor, month)
+                    created.append(month)
+                month = add_months(month, 1)
+        return created
+
+    def archive(self, month, fmt='ndjson'):
+        """
+        Exporta, separa (DETACH) y elimina la partición de `month`, todo en
+        una transacción: si la exportación falla la partición sigue adjunta
+        y no queda archivo a medias. Devuelve la ruta del archivo.
+        """
+        if month not in self.partitions():
+            raise PartitionError(f"No existe la partición {self.partition_name(month)}.")
+
+        partition = self.partition_name(month)
+        writer = ArchiveWriter(self.model, fmt, tag=self.using)
+        try:
+            with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+                # Sin escrituras en el mes mientras se exporta (las lecturas siguen).
+                cursor.execute(f"LOCK TABLE {self.qn(partition)} IN SHARE MODE")
+                writer.write(month, _iter_table_rows(self.connection, partition))
+                cursor.execute(f"ALTER TABLE {self.qn(self.table)} DETACH PARTITION {self.qn(partition)}")
+                cursor.execute(f"DROP TABLE {self.qn(partition)}")
+                # Antes del COMMIT: si este falla queda el archivo y también las filas.
+                path, = writer.commit()
+        finally:
+            writer.discard()
+        logger.info(f"Partición {partition} ({self.using}) archivada en {path}.")
+        return path
+
+    def default_partition(self):
+        """Nombre de la partición DEFAULT creada por convert(), o None si no existe."""
+        name = f"{self.table}_pdefault"
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [self.qn(name)])
+            return name if cursor.fetchone()[0] else None
+
+    def archive_default(self, before, fmt='ndjson'):
+        """
+        Exporta y elimina las filas de la partición DEFAULT con fecha anterior
+        a `before` (mes sin partición propia: fechas antiguas o posteriores a
+        las creadas), un archivo por mes. Devuelve las rutas escritas.
+        """
+        self._check_vendor()
+        default = self.default_partition()
+        if default is None:
+            return []
+        qn, key = self.qn, self.qn(PARTITION_KEY)
+        # Puede haber ya un archivo del mes (la partición se archivó antes).
+        writer = ArchiveWriter(self.model, fmt, tag=f"{self.using}.pdefault{timezone.now():%Y%m%d%H%M%S}")
+        try:
+            with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+                # Sin escrituras en DEFAULT mientras se exporta y borra (las lecturas siguen).
+                cursor.execute(f"LOCK TABLE {qn(default)} IN EXCLUSIVE MODE")
+                cursor.execute(
+                    f"SELECT DISTINCT date_trunc('month', {key})::date FROM {qn(default)} "
+                    f"WHERE {key} < %s ORDER BY 1", [before.isoformat()]
+                )
+                for (month,) in cursor.fetchall():
+                    where = (f"{key} >= %s AND {key} < %s",
+                             [month.isoformat(), min(add_months(month, 1), before).isoformat()])
+                    writer.write(month, _iter_table_rows(self.connection, default, *where))
+                cursor.execute(f"DELETE FROM {qn(default)} WHERE {key} < %s", [before.isoformat()])
+                paths = writer.commit()
+        finally:
+            writer.discard()
+        for path in paths:
+            logger.info(f"Filas de {default} ({self.using}) archivadas en {path}.")
+        return paths
+
+    def archive_older_than(self, keep_months, fmt='ndjson'):
+        limit = add_months(month_start(timezone.now()), -keep_months)
+        paths = [self.archive(month, fmt) for month in self.partitions() if month < limit]
+        return paths + self.archive_default(limit, fmt)
+
+
+# --------------------------------------------------------------------
+# Exportación y lectura de archivos de archivo
+# --------------------------------------------------------------------
+
+ARCHIVE_SUFFIXES = {'ndjson': 'ndjson.gz', 'parquet': 'parquet'}
+
+
+def archive_path(model, month, fmt='ndjson', tag=None):
+    name = month.strftime('%Y-%m') + (f".{tag}" if tag else '')
+    return ARCHIVE_DIR / model._meta.db_table / f"{name}.{ARCHIVE_SUFFIXES[fmt]}"
+
+
+def archive_files(model, month):
+    """Archivos del mes de `model` (uno por shard, más extracciones de DEFAULT e importaciones)."""
+    directory = ARCHIVE_DIR / model._meta.db_table
+    if not directory.exists():
+        return []
+    return sorted(
+        p for p in directory.glob(f"{month.strftime('%Y-%m')}*")
+        if p.name.endswith(tuple(f".{suffix}" for suffix in ARCHIVE_SUFFIXES.values()))
+    )
+
+
+class ArchiveWriter:
+    """
+    Escribe filas a archivos temporales por mes; commit() los deja en su
+    ruta final y discard() elimina lo que no se confirmó.
+    """
+
+    def __init__(self, model, fmt='ndjson', tag=None):
+        self.model = model
+        self.fmt = fmt
+        self.tag = tag
+        self.pending = {}
+
+    def write(self, month, rows):
+        path = archive_path(self.model, month, self.fmt, self.tag)
+        if month in self.pending or path.exists():
+            raise PartitionError(f"Ya existe el archivo {path}.")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        self.pending[month] = (tmp_path, path)
+        if self.fmt == 'parquet':
+            _write_parquet(tmp_path, rows)
+        else:
+            _write_ndjson(tmp_path, rows)
+
+    def commit(self):
+        paths = []
+        for tmp_path, path in self.pending.values():
+            tmp_path.replace(path)
+            paths.append(path)
+        self.pending = {}
+        return paths
+
+    def discard(self):
+        for tmp_path, _ in self.pending.values():
+            tmp_path.unlink(missing_ok=True)
+        self.pending = {}
+
+
+def _iter_table_rows(connection, table, where=None, params=()):
+    """Filas de `table` como dicts, leídas con un cursor de servidor (memoria constante)."""
+    cursor = connection.chunked_cursor()
+    sql = f"SELECT row_to_json(t)::text FROM {connection.ops.quote_name(table)} t"
+    cursor.execute(f"{sql} WHERE {where}" if where else sql, params)
+    while True:
+        batch = cursor.fetchmany(ARCHIVE_CHUNK_SIZE)
+        if not batch:
+            break
+        for (row,) in batch:
+            yield json.loads(row, parse_float=Decimal)
+    cursor.close()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"No serializable: {type(value)}")
+
+
+def _write_ndjson(path, rows):
+    with gzip.open(path, 'wt', encoding='utf-8') as fh:
+        for row in rows:
+            fh.write(json.dumps(row, default=_json_default))
+            fh.write('\n')
+
+
+def _write_parquet(path, rows):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise PartitionError("El formato parquet requiere pyarrow instalado.")
+
+    writer, schema, batch = None, None, []
+
+    def flush():
+        nonlocal writer, schema
+        table = pa.Table.from_pylist(batch, schema=schema)
+        if writer is None:
+            schema = table.schema
+            writer = pq.ParquetWriter(path, schema, compression='zstd')
+        writer.write_table(table)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ARCHIVE_CHUNK_SIZE:
+            flush()
+    if batch:
+        flush()
+    if writer is not None:
+        writer.close()
+
+
+def archived_months(model):
+    """Meses archivados disponibles para `model`, ordenados."""
+    directory = ARCHIVE_DIR / model._meta.db_table
+    if not directory.exists():
+        return []
+    months = {
+        date(int(p.name[:4]), int(p.name[5:7]), 1)
+        for p in directory.iterdir() if p.name[:7].replace('-', '').isdigit()
+    }
+    return sorted(months)
+
+
+def iter_archived_rows(model, month):
+    """Filas archivadas (dicts con columnas de BD) de `model` para `month`, de todos los shards."""
+    for path in archive_files(model, month):
+        if path.name.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=ARCHIVE_CHUNK_SIZE):
+                yield from batch.to_pylist()
+        else:
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                for line in fh:
+                    yield json.loads(line, parse_float=Decimal)
+
+
+def archived_company_rows(model, company_id, date_from=None, date_to=None, using=None):
+    """
+    Filas archivadas de la compañía con created_at entre `date_from` y
+    `date_to` (datetimes aware; sin límite si son None). Sale y Order se
+    filtran por company_id; CartItem por su venta u orden, archivada o en
+    la BD `using` (por defecto la del router).
+    """
+    months = [
+        m for m in archived_months(model)
+        if (date_from is None or m >= month_start(date_from)) and (date_to is None or m <= month_start(date_to))
+    ]
+    for month in months:
+        rows = []
+        for row in iter_archived_rows(model, month):
+            created_at = parse_datetime(row[PARTITION_KEY])
+            if (date_from and created_at < date_from) or (date_to and created_at > date_to):
+                continue
+            if model is not CartItem and row['company_id'] != company_id:
+                continue
+            row[PARTITION_KEY] = created_at
+            if model is not CartItem:
+                yield row
+            else:
+                rows.append(row)
+        if rows:
+            yield from _owned_cart_items(rows, company_id, month, using)
+
+
+def _owned_cart_items(rows, company_id, month, using=None):
+    """Líneas cuya venta u orden es de la compañía, esté archivada o aún en la BD."""
+    owned = []
+    for parent, column in ((Sale, 'sale_id'), (Order, 'order_id')):
+        parent_ids = {r[column] for r in rows if r.get(column) is not None}
+        if not parent_ids:
+            continue
+        # La cabecera y sus líneas se crean juntas, pero pueden caer a ambos lados de un cambio de mes.
+        nearby = {add_months(month, n) for n in (-1, 0, 1)}
+        ids = {r['id'] for m in archived_months(parent) if m in nearby
+               for r in iter_archived_rows(parent, m) if r['company_id'] == company_id and r['id'] in parent_ids}
+        live = sorted(parent_ids - ids)
+        for i in range(0, len(live), ARCHIVE_CHUNK_SIZE):
+            ids.update(parent.objects.db_manager(using).filter(company_id=company_id, pk__in=live[i:i + ARCHIVE_CHUNK_SIZE])
+                       .values_list('pk', flat=True))
+        owned += [r for r in rows if r.get(column) in ids]
+    return owned
+
+
+def restore_archived_rows(writer, rows, company_id=None):
+    """
+    Vuelve a archivar con `writer` filas exportadas por export_tenant(), un
+    archivo por mes (llegan agrupadas por mes). Omite las que ya están
+    archivadas: importar en el mismo sistema no las duplica. Devuelve la
+    cantidad de filas leídas.
+    """
+    count = 0
+    for month, group in groupby(rows, key=lambda r: month_start(parse_datetime(r[PARTITION_KEY]))):
+        group = list(group)
+        count += len(group)
+        existing = {r['id'] for r in iter_archived_rows(writer.model, month)}
+        new = [r for r in group if r['id'] not in existing]
+        if company_id is not None and writer.model is not CartItem:
+            for row in new:
+                row['company_id'] = company_id
+        if new:
+            writer.write(month, new)
+    return count
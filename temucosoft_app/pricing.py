@@ -0,0 +1,219 @@
+"""
+Repricing masivo del catálogo.
+
+Cada regla (categoría y/o patrón de SKU, cambio porcentual o absoluto,
+redondeo, piso en el costo) se aplica con un único UPDATE sobre los
+productos de la compañía. El preview se calcula con la misma expresión en
+SQL; en modo dry-run las reglas se ejecutan dentro de una transacción que
+se revierte, así el resultado considera reglas encadenadas.
+
+Por lote se escribe una fila de ProductPriceHistory por producto
+modificado (bulk_create) y se invalidan una sola vez los caches del
+catálogo y del inventario.
+
+Historial de precios: cada cambio de precio/costo por save() (API, admin)
+agrega una fila vía la señal product_price_changed; el precio vigente en
+un instante T es la última fila con valid_from <= T (índice
+(product, valid_from)). prices_as_of() resuelve miles de productos en una
+sola consulta con ROW_NUMBER() y cost_as_of() da la expresión correlada
+que usan los reportes de margen.
+"""
+import contextvars
+import re
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Cast, Greatest, Round, RowNumber
+from django.utils import timezone
+
+from .cache_versions import bump_version
+from .models import CustomUser, Product, ProductPriceHistory
+from .tenancy import tenant_db
+
+PREVIEW_LIMIT = 100
+HISTORY_BATCH = 1000
+AS_OF_CHUNK = 5000
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def sku_filter(pattern):
+    """Patrón con comodín `*` -> filtro de SKU (prefijo, sufijo, contenido o regex)."""
+    if '*' not in pattern:
+        return Q(sku=pattern)
+    pieces = pattern.split('*')
+    if len(pieces) == 2 and not pieces[1]:
+        return Q(sku__startswith=pieces[0])
+    if len(pieces) == 2 and not pieces[0]:
+        return Q(sku__endswith=pieces[1])
+    if len(pieces) == 3 and not pieces[0] and not pieces[2]:
+        return Q(sku__contains=pieces[1])
+    return Q(sku__regex='^' + '.*'.join(re.escape(p) for p in pieces) + '$')
+
+
+def rule_filter(rule):
+    q = Q()
+    if rule.get('category'):
+        q &= Q(category=rule['category'])
+    if rule.get('sku_pattern'):
+        q &= sku_filter(rule['sku_pattern'])
+    return q
+
+
+def rule_expression(rule):
+    """Nuevo valor del campo de la regla como expresión SQL."""
+    field = rule.get('field', 'price')
+    current = F(field)
+
+    if rule.get('percent') is not None:
+        factor = Decimal(1) + Decimal(rule['percent']) / Decimal(100)
+        value = ExpressionWrapper(current * Value(factor, output_field=MONEY), output_field=MONEY)
+    else:
+        value = ExpressionWrapper(current + Value(Decimal(rule['amount']), output_field=MONEY), output_field=MONEY)
+
+    step = rule.get('rounding')
+    if step:
+        step = Value(Decimal(step), output_field=MONEY)
+        value = ExpressionWrapper(Round(value / step) * step, output_field=MONEY)
+
+    floor = F('cost') if field == 'price' and rule.get('floor_at_cost', True) else Value(Decimal(0), output_field=MONEY)
+    return Cast(Round(Greatest(value, floor), 2), MONEY)
+
+
+def _preview(queryset, expression):
+    return list(queryset.annotate(new_value=expression).values_list('id', 'sku', 'price', 'cost', 'new_value'))
+
+
+def reprice(company, rules, user=None, dry_run=False):
+    """
+    Aplica `rules` en orden. Devuelve el resumen por regla, la cantidad de
+    productos modificados y una muestra del antes/después.
+    """
+    products = Product.objects.filter(company=company)
+    final = {}
+    summary = []
+    sample = []
+
+    with transaction.atomic(using=tenant_db()):
+        for rule in rules:
+            field = rule.get('field', 'price')
+            expression = rule_expression(rule)
+            # Solo las filas cuyo valor cambia: WHERE NOT (campo = expresión).
+            queryset = products.filter(rule_filter(rule)).exclude(**{field: expression})
+            changes = _preview(queryset.select_for_update(), expression)
+            if changes:
+                queryset.update(**{field: expression})
+
+            for product_id, sku, price, cost, new_value in changes:
+                current = final.get(product_id, {'sku': sku, 'price': price, 'cost': cost,
+                                                 'old_price': price, 'old_cost': cost})
+                current[field] = new_value
+                final[product_id] = current
+            summary.append({'rule': rule, 'changed': len(changes)})
+
+        for product_id, values in list(final.items())[:PREVIEW_LIMIT]:
+            sample.append({
+                'product': product_id, 'sku': values['sku'],
+                'old_price': values['old_price'], 'price': values['price'],
+                'old_cost': values['old_cost'], 'cost': values['cost'],
+            })
+
+        if dry_run:
+            transaction.set_rollback(True, using=tenant_db())
+        elif final:
+            now = timezone.now()
+            ProductPriceHistory.objects.bulk_create(
+                [
+                    ProductPriceHistory(
+                        company=company, product_id=product_id, price=values['price'], cost=values['cost'],
+                        valid_from=now, source='repricing', changed_by=user,
+                    )
+                    for product_id, values in final.items()
+                ],
+                batch_size=HISTORY_BATCH,
+            )
+            # Una sola invalidación por lote, al confirmar.
+            transaction.on_commit(partial(_invalidate_catalog, company.pk), using=tenant_db())
+
+    return {'dry_run': dry_run, 'changed': len(final), 'rules': summary, 'preview': sample}
+
+
+def _invalidate_catalog(company_id):
+    bump_version('catalog', company_id)
+    bump_version('inventory', company_id)
+
+
+# --------------------------------------------------------------------
+# Historial de precios
+# --------------------------------------------------------------------
+
+_change_origin = contextvars.ContextVar('temucosoft_price_change_origin', default=('save', None))
+
+
+@contextmanager
+def price_change_context(user=None, source='api'):
+    """Origen y autor que se anotan en las filas de historial creadas dentro del bloque."""
+    # request.user puede ser el auth.User de Django (admin, sesión): solo se guarda un CustomUser.
+    token = _change_origin.set((source, user if isinstance(user, CustomUser) else None))
+    try:
+        yield
+    finally:
+        _change_origin.reset(token)
+
+
+def record_price_change(product, using=None):
+    source, user = _change_origin.get()
+    return ProductPriceHistory.objects.using(using or tenant_db()).create(
+        company_id=product.company_id, product=product, price=product.price, cost=product.cost,
+        source=source, changed_by=user,
+    )
+
+
+def history_as_of(product_id, at):
+    """Fila de historial vigente para un producto en `at`, o None."""
+    return ProductPriceHistory.objects.filter(product_id=product_id, valid_from__lte=at) \
+        .order_by('-valid_from', '-id').first()
+
+
+def prices_as_of(company, at, product_ids=None):
+    """
+    {product_id: {'price', 'cost', 'valid_from'}} vigentes en `at` para los
+    productos dados (o todos los de la compañía). Una consulta por bloque de
+    AS_OF_CHUNK ids: ROW_NUMBER() OVER (PARTITION BY product ORDER BY valid_from DESC) = 1.
+    """
+    base = ProductPriceHistory.objects.filter(company=company, valid_from__lte=at)
+    if product_ids is None:
+        chunks = [base]
+    else:
+        product_ids = list(product_ids)
+        chunks = [
+            base.filter(product_id__in=product_ids[i:i + AS_OF_CHUNK])
+            for i in range(0, len(product_ids), AS_OF_CHUNK)
+        ]
+
+    result = {}
+    for queryset in chunks:
+        rows = queryset.annotate(
+            rank=Window(RowNumber(), partition_by=F('product_id'), order_by=[F('valid_from').desc(), F('id').desc()]),
+        ).filter(rank=1).values_list('product_id', 'price', 'cost', 'valid_from')
+        for product_id, price, cost, valid_from in rows:
+            result[product_id] = {'price': price, 'cost': cost, 'valid_from': valid_from}
+    return result
+
+
+def cost_as_of(product_ref='product_id', at_ref='created_at', field='cost'):
+    """
+    Subconsulta correlada con el costo (o precio) vigente para cada fila
+    externa; con el índice (product, valid_from) PostgreSQL la resuelve
+    como un index scan por fila, igual que un LATERAL ... LIMIT 1.
+    """
+    return Subquery(
+        ProductPriceHistory.objects
+        .filter(product_id=OuterRef(product_ref), valid_from__lte=OuterRef(at_ref))
+        .order_by('-valid_from', '-id')
+        .values(field)[:1],
+        output_field=MONEY,
+    )
@@ -0,0 +1,318 @@
+"""
+Perfilado bajo demanda de una petición puntual.
+
+Un super_admin agrega el header `X-Profile: 1` (o `?_profile=1`) y
+ProfilerMiddleware perfila solo esa petición. Se guarda el perfil, la
+lista de SQL y los tiempos en un buffer circular en disco
+(settings.PROFILER_DIR, máximo settings.PROFILER_MAX_ENTRIES entradas),
+que se consulta en /api/profiles/.
+
+Modos:
+- sample (por defecto): muestreo de la pila del hilo de la petición;
+  se descarga como speedscope (.speedscope.json) o stacks colapsados
+  (formato de flamegraph.pl).
+- cprofile (`X-Profile: cprofile`): determinista, se descarga como .prof
+  (pstats, snakeviz).
+
+Sin el flag el middleware solo hace una búsqueda en request.META.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+
+from .permissions import IsSuperAdmin
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_FLAG = '_profile'
+PROFILE_MODES = ('sample', 'cprofile')
+DOWNLOAD_FORMATS = {
+    'speedscope': '.speedscope.json',
+    'collapsed': '.collapsed.txt',
+    'pstats': '.prof',
+}
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILER_DIR', Path(settings.BASE_DIR) / 'var' / 'profiles'))
+
+
+def max_entries():
+    return getattr(settings, 'PROFILER_MAX_ENTRIES', 50)
+
+
+def requested_mode(request):
+    """Modo pedido por header o query string, o None si la petición no pide perfil."""
+    flag = request.META.get(PROFILE_HEADER)
+    if flag is None:
+        flag = request.GET.get(PROFILE_QUERY_FLAG) if PROFILE_QUERY_FLAG in request.GET else None
+    if not flag:
+        return None
+    return flag if flag in PROFILE_MODES else 'sample'
+
+
+def is_profiling_allowed(request):
+    """Usuario de sesión o JWT del header, validado con IsSuperAdmin."""
+    from rest_framework.exceptions import APIException
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import TokenError
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (APIException, TokenError):
+            # Token inválido, usuario borrado o inactivo (AuthenticationFailed): la
+            # vista responderá 401 por su cuenta; aquí solo no se perfila.
+            result = None
+        user = result[0] if result else None
+    try:
+        allowed = bool(IsSuperAdmin().has_permission(SimpleNamespace(user=user), None))
+    except AttributeError:
+        # Usuarios sin rol (p. ej. el auth.User de Django) nunca perfilan.
+        allowed = False
+    return allowed, user
+
+
+# --------------------------------------------------------------------
+# Perfiladores
+# --------------------------------------------------------------------
+
+class SamplingProfiler:
+    """Toma la pila del hilo objetivo cada `interval` segundos desde un hilo aparte."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'PROFILER_SAMPLE_INTERVAL', 0.005)
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.target = threading.get_ident()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def speedscope(self, name):
+        frames, index, samples, weights = [], {}, [], []
+        for stack, count in self.stacks.items():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'temucosoft',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.duration,
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+    def collapsed(self):
+        lines = []
+        for stack, count in self.stacks.items():
+            names = ';'.join(f"{name} ({os.path.basename(filename)}:{line})" for name, filename, line in stack)
+            lines.append(f"{names} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, base, name):
+        Path(f"{base}.speedscope.json").write_text(json.dumps(self.speedscope(name)), encoding='utf-8')
+        Path(f"{base}.collapsed.txt").write_text(self.collapsed(), encoding='utf-8')
+        return ['speedscope', 'collapsed']
+
+
+class DeterministicProfiler:
+    """cProfile sobre la petición completa."""
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self.started
+
+    def summary(self, limit=30):
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def write(self, base, name):
+        self.profile.dump_stats(f"{base}.prof")
+        return ['pstats']
+
+
+class QueryRecorder:
+    """execute_wrapper que anota cada SQL con su duración y alias."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'db': context['connection'].alias,
+                'sql': sql,
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+# --------------------------------------------------------------------
+# Buffer circular en disco
+# --------------------------------------------------------------------
+
+def _meta_path(profile_id):
+    return profile_dir() / f"{profile_id}.json"
+
+
+def valid_profile_id(profile_id):
+    return bool(profile_id) and all(c.isalnum() or c == '-' for c in profile_id)
+
+
+def save_profile(profiler, meta):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    base = directory / profile_id
+
+    meta['id'] = profile_id
+    meta['formats'] = profiler.write(base, f"{meta['method']} {meta['path']}")
+    _meta_path(profile_id).write_text(json.dumps(meta, cls=DjangoJSONEncoder), encoding='utf-8')
+    prune_profiles()
+    return profile_id
+
+
+def prune_profiles():
+    """Conserva solo las `max_entries()` entradas más recientes."""
+    metas = sorted(profile_dir().glob('*.json'))
+    metas = [m for m in metas if not m.name.endswith('.speedscope.json')]
+    for meta in metas[:-max_entries()]:
+        profile_id = meta.name[:-len('.json')]
+        meta.unlink(missing_ok=True)
+        for suffix in DOWNLOAD_FORMATS.values():
+            (profile_dir() / f"{profile_id}{suffix}").unlink(missing_ok=True)
+
+
+def list_profiles():
+    profiles = []
+    for meta in sorted(profile_dir().glob('*.json'), reverse=True):
+        if meta.name.endswith('.speedscope.json'):
+            continue
+        data = json.loads(meta.read_text(encoding='utf-8'))
+        data.pop('sql', None)
+        data.pop('summary', None)
+        profiles.append(data)
+    return profiles
+
+
+def load_profile(profile_id):
+    if not valid_profile_id(profile_id):
+        return None
+    try:
+        return json.loads(_meta_path(profile_id).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return None
+
+
+def profile_file(profile_id, fmt):
+    suffix = DOWNLOAD_FORMATS.get(fmt)
+    if suffix is None or not valid_profile_id(profile_id):
+        return None
+    path = profile_dir() / f"{profile_id}{suffix}"
+    return path if path.exists() else None
+
+
+# --------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------
+
+class ProfilerMiddleware:
+    """Perfila la petición si la pide un super_admin; si no, no hace nada."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        allowed, user = is_profiling_allowed(request)
+        if not allowed:
+            return self.get_response(request)
+
+        profiler = DeterministicProfiler() if mode == 'cprofile' else SamplingProfiler()
+        recorder = QueryRecorder()
+        started_at = timezone.now()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            with profiler:
+                response = self.get_response(request)
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+
+        meta = {
+            'mode': mode,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': user.username,
+            'status': response.status_code,
+            'started_at': started_at,
+            'duration_ms': round(profiler.duration * 1000, 3),
+            'sql_count': len(recorder.queries),
+            'sql_ms': round(sum(q['ms'] for q in recorder.queries), 3),
+            'sql': recorder.queries,
+        }
+        if mode == 'cprofile':
+            meta['summary'] = profiler.summary()
+        response['X-Profile-Id'] = save_profile(profiler, meta)
+        return response
@@ -0,0 +1,227 @@
+"""
+Alta masiva de usuarios desde un CSV.
+
+Columnas: username, email, password, role, rut (opcional) y company
+(id; solo la usa el super_admin). Las reglas de rol son las de
+UserViewSet.perform_create: el super_admin crea admin_cliente con
+compañía; un admin_cliente crea gerente/vendedor de su compañía.
+
+1. validate_rows(): valida todas las filas (campos, RUT, contraseña,
+   duplicados en el archivo y en la BD con una consulta por campo, cupo
+   del plan) y devuelve todos los errores juntos.
+2. hash_passwords(): PBKDF2 de todas las contraseñas repartido en un
+   pool de procesos (es CPU pura, ~100-300 ms por usuario).
+3. bulk_create en la BD de control, contadores de uso y copia a los
+   shards (bulk_create no emite señales).
+
+La API valida en la petición y deja el hashing y la inserción a un
+trabajo en segundo plano ('users.bulk_provision'); las contraseñas
+viajan en un archivo temporal (0600) que el trabajo borra al terminar,
+nunca en Job.payload.
+"""
+import csv
+import io
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from .jobs import process_pool
+from .models import Company, CustomUser
+from .tenancy import control_database, mirror_control_rows, shard_for_company
+from .usage import PlanLimitExceeded, check_user_limit, get_usage, increment
+from .utils import clean_rut, is_valid_rut
+
+PROVISION_COLUMNS = ('username', 'email', 'password', 'role', 'rut', 'company')
+MAX_ROWS = 5000
+INSERT_BATCH = 500
+HASH_CHUNK = 16
+ROLES_BY_CREATOR = {
+    'super_admin': ('admin_cliente',),
+    'admin_cliente': ('gerente', 'vendedor'),
+}
+
+
+class ProvisioningError(Exception):
+    """Errores de validación: [{'row': n, 'errors': {campo: mensaje}}]."""
+
+    def __init__(self, errors):
+        # El mensaje (Job.error) lleva las primeras filas; el detalle completo queda en `errors`.
+        detail = '; '.join(f"fila {e['row']}: {', '.join(e['errors'])}" for e in errors[:5])
+        super().__init__(f"{len(errors)} filas con errores ({detail})")
+        self.errors = errors
+
+
+def read_csv(source):
+    """Filas del CSV (archivo de texto o str) como dicts con los valores sin espacios."""
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    reader = csv.DictReader(source)
+    missing = {'username', 'email', 'password', 'role'} - set(reader.fieldnames or ())
+    if missing:
+        raise ProvisioningError([{'row': 0, 'errors': {'columns': f"Faltan columnas: {', '.join(sorted(missing))}"}}])
+    rows = []
+    for row in reader:
+        rows.append({c: (row.get(c) or '').strip() for c in PROVISION_COLUMNS})
+        if len(rows) > MAX_ROWS:
+            raise ProvisioningError([{'row': 0, 'errors': {'rows': f"Máximo {MAX_ROWS} usuarios por archivo."}}])
+    return rows
+
+
+# --------------------------------------------------------------------
+# Validación
+# --------------------------------------------------------------------
+
+def _validate_row(creator, row, companies):
+    errors = {}
+    try:
+        UnicodeUsernameValidator()(row['username'])
+        if len(row['username']) > 150:
+            raise ValidationError("Máximo 150 caracteres.")
+    except ValidationError as e:
+        errors['username'] = ' '.join(e.messages)
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        errors['email'] = "Email no válido."
+
+    allowed = ROLES_BY_CREATOR.get(creator.role, ())
+    if row['role'] not in allowed:
+        errors['role'] = f"Solo puede crear: {', '.join(allowed) or 'ninguno'}."
+
+    if creator.role == 'super_admin':
+        company = companies.get(int(row['company'])) if row['company'].isdigit() else None
+        if company is None:
+            errors['company'] = "Debe asignar una Compañía existente."
+    else:
+        company = creator.company
+        if row['company'] and row['company'] != str(creator.company_id):
+            errors['company'] = "Solo puede crear usuarios en su Compañía."
+    row['company'] = company
+
+    if row['rut']:
+        try:
+            rut = clean_rut(row['rut'])
+        except ValueError:
+            rut = None
+        if not rut or not is_valid_rut(rut):
+            errors['rut'] = "El RUT no es válido o está mal formateado."
+        row['rut'] = rut
+    else:
+        row['rut'] = None
+
+    try:
+        validate_password(row['password'], user=CustomUser(username=row['username'], email=row['email']))
+    except ValidationError as e:
+        errors['password'] = ' '.join(e.messages)
+    return errors
+
+
+def validate_rows(creator, rows):
+    """Valida y normaliza `rows` (company pasa a ser la instancia). Lanza ProvisioningError con todos los errores."""
+    if not rows:
+        raise ProvisioningError([{'row': 0, 'errors': {'rows': "El archivo no tiene usuarios."}}])
+    control = control_database()
+    company_ids = {int(r['company']) for r in rows if r['company'].isdigit()}
+    companies = Company.objects.using(control).select_related('plan').in_bulk(company_ids) \
+        if creator.role == 'super_admin' else {}
+
+    errors = {}
+    for i, row in enumerate(rows, start=2):     # fila 1: encabezado
+        row_errors = _validate_row(creator, row, companies)
+        if row_errors:
+            errors[i] = row_errors
+
+    # Duplicados dentro del archivo y contra la BD (una consulta por campo).
+    for field in ('username', 'rut'):
+        values = [r[field] for r in rows if r[field]]
+        repeated = {v for v, n in Counter(values).items() if n > 1}
+        taken = set(CustomUser.objects.using(control).filter(**{f"{field}__in": values})
+                    .values_list(field, flat=True))
+        for i, row in enumerate(rows, start=2):
+            if row[field] in repeated:
+                errors.setdefault(i, {})[field] = "Repetido en el archivo."
+            elif row[field] in taken:
+                errors.setdefault(i, {})[field] = "Ya existe."
+
+    # Cupo del plan por compañía (sin bloqueo; provision_users lo repite con la fila bloqueada).
+    per_company = Counter(r['company'] for r in rows if isinstance(r['company'], Company))
+    for company, count in per_company.items():
+        if company.plan is None:
+            continue
+        used = get_usage(company.pk).users
+        if used + count > company.plan.max_users:
+            errors.setdefault(0, {})['company'] = (
+                f"{company.name}: el plan {company.plan} permite {company.plan.max_users} usuarios; "
+                f"hay {used} y el archivo agrega {count}."
+            )
+
+    if errors:
+        raise ProvisioningError([{'row': i, 'errors': e} for i, e in sorted(errors.items())])
+    return rows
+
+
+# --------------------------------------------------------------------
+# Hashing e inserción
+# --------------------------------------------------------------------
+
+def hash_passwords(passwords, processes=None):
+    """make_password() de cada contraseña; con processes > 1 en un pool de procesos."""
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(passwords) < 2:
+        return [make_password(p) for p in passwords]
+    with process_pool(processes) as pool:
+        return list(pool.map(make_password, passwords, chunksize=HASH_CHUNK))
+
+
+def provision_users(creator, rows, processes=None, progress=None):
+    """Valida, hashea en paralelo e inserta. Devuelve {'created': n, 'users': [ids]}."""
+    rows = validate_rows(creator, rows)
+    if progress:
+        progress(10, f"{len(rows)} filas válidas")
+    hashes = hash_passwords([r['password'] for r in rows], processes)
+    if progress:
+        progress(80, "Contraseñas procesadas")
+
+    users = [
+        CustomUser(username=r['username'], email=r['email'], password=h, role=r['role'],
+                   rut=r['rut'], company=r['company'])
+        for r, h in zip(rows, hashes)
+    ]
+    per_company = Counter(u.company for u in users)
+    control = control_database()
+    with transaction.atomic(using=control):
+        for company, count in per_company.items():
+            try:
+                check_user_limit(company, count)
+            except PlanLimitExceeded as e:
+                raise ProvisioningError([{'row': 0, 'errors': {'company': str(e)}}])
+        CustomUser.objects.using(control).bulk_create(users, batch_size=INSERT_BATCH)
+        created = list(CustomUser.objects.using(control)
+                       .filter(username__in=[u.username for u in users]))
+        for company, count in per_company.items():
+            increment(company.pk, 'users', count)
+
+    for company in per_company:
+        shard = shard_for_company(company.pk)
+        if shard and shard != control:
+            mirror_control_rows(shard, company.pk, users=[u for u in created if u.company_id == company.pk])
+    return {'created': len(created), 'users': sorted(u.pk for u in created)}
+
+
+def save_upload(content, directory):
+    """Guarda el CSV subido (con contraseñas) legible solo por el proceso. Devuelve la ruta."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # mkstemp crea el archivo con permisos 0600.
+    fd, path = tempfile.mkstemp(prefix='users-', suffix='.csv', dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='') as fh:
+        fh.write(content)
+    return path
@@ -0,0 +1,323 @@
+"""
+Canal push de stock y ventas por sucursal (Server-Sent Events).
+
+- StockHub: pub/sub en proceso. Cada suscriptor es una asyncio.Queue
+  acotada en el event loop de la vista SSE; un suscriptor inactivo solo
+  ocupa su cola, por lo que un worker ASGI sostiene miles de conexiones.
+  La ruta se sirve desde un proceso ASGI aparte (gunicorn_stream.conf.py);
+  bajo WSGI la vista usa ThreadSubscription con una conexión acotada.
+- Backends: PostgresNotifyBackend (por defecto) reparte entre procesos con
+  LISTEN/NOTIFY: las ventas se publican en los workers WSGI o en
+  run_workers y los suscriptores están en el proceso ASGI. LocalBackend
+  entrega solo dentro del proceso (runserver, pruebas).
+
+publish_branch_event() se llama con transaction.on_commit() desde ventas y
+compras, así solo se anuncian cambios confirmados.
+"""
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+NOTIFY_CHANNEL = 'temucosoft_stock'
+# pg_notify rechaza payloads de 8000 bytes o más; los mensajes mayores
+# (p. ej. el stock de una recepción con cientos de productos) se parten.
+NOTIFY_CHUNK_SIZE = 7500
+NOTIFY_MAX_PENDING = 100
+NOTIFY_RECONNECT_MAX_DELAY = 30
+
+
+class Subscription:
+    def __init__(self, hub, branch_id, loop):
+        self.hub = hub
+        self.branch_id = branch_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, message):
+        """Se ejecuta en el loop del suscriptor. Si la cola está llena descarta el más antiguo."""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def push(self, message):
+        """Desde cualquier hilo; RuntimeError si el loop del suscriptor ya se cerró."""
+        self.loop.call_soon_threadsafe(self.deliver, message)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class ThreadSubscription:
+    """Suscriptor bloqueante para una vista servida por WSGI (un hilo por conexión)."""
+
+    def __init__(self, hub, branch_id):
+        self.hub = hub
+        self.branch_id = branch_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """El siguiente mensaje, o None si pasan `timeout` segundos sin eventos."""
+        try:
+            return self.queue.get(timeout=max(0, timeout))
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class StockHub:
+    """Registro de suscriptores por sucursal con entrega thread-safe."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, branch_id):
+        return self._add(Subscription(self, branch_id, asyncio.get_running_loop()))
+
+    def subscribe_thread(self, branch_id):
+        return self._add(ThreadSubscription(self, branch_id))
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.branch_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.branch_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.branch_id]
+
+    def dispatch(self, branch_id, message):
+        """Entrega `message` a los suscriptores locales de la sucursal (desde cualquier hilo)."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(branch_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.push(message)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró.
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class LocalBackend:
+    """Entrega solo a los suscriptores de este proceso (un único proceso: runserver, pruebas)."""
+
+    cross_process = False
+
+    def start(self, hub):
+        self.hub = hub
+
+    def listen(self):
+        pass
+
+    def publish(self, branch_id, message):
+        self.hub.dispatch(branch_id, message)
+
+
+class PostgresNotifyBackend:
+    """
+    Reparte eventos entre procesos con pg_notify. Los procesos que tienen
+    suscriptores (listen(), desde la vista SSE) abren un hilo que escucha el
+    canal y entrega al hub local; los que solo publican no abren conexión extra.
+
+    Un payload que no cabe en un NOTIFY se envía en partes
+    `~<id>:<n>:<total>:<trozo>` dentro de una misma transacción (llegan
+    juntas y en orden) y el listener las reensambla. Si la conexión del
+    listener se cae, se reconecta con espera creciente.
+    """
+
+    cross_process = True
+
+    def __init__(self, using='default', channel=NOTIFY_CHANNEL):
+        self.using = using
+        self.channel = channel
+        self._listener = None
+        self._lock = threading.Lock()
+        self._partial = {}
+        self._failures = 0
+        self.stopped = threading.Event()
+
+    def start(self, hub):
+        if connections[self.using].vendor != 'postgresql':
+            raise ImproperlyConfigured(
+                f"PostgresNotifyBackend requiere PostgreSQL en '{self.using}'; "
+                "con otra BD y un solo proceso use temucosoft_app.realtime.LocalBackend."
+            )
+        self.hub = hub
+
+    def listen(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='stock-hub-listener', daemon=True)
+                self._listener.start()
+
+    def publish(self, branch_id, message):
+        payload = json.dumps({'branch': branch_id, 'message': message}, cls=DjangoJSONEncoder)
+        with transaction.atomic(using=self.using), connections[self.using].cursor() as cursor:
+            for part in self.split_payload(payload):
+                cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, part])
+
+    @staticmethod
+    def split_payload(payload):
+        # json.dumps escapa lo no ASCII: un carácter es un byte.
+        if len(payload) <= NOTIFY_CHUNK_SIZE:
+            return [payload]
+        message_id = uuid.uuid4().hex
+        chunks = [payload[i:i + NOTIFY_CHUNK_SIZE] for i in range(0, len(payload), NOTIFY_CHUNK_SIZE)]
+        return [f"~{message_id}:{n}:{len(chunks)}:{chunk}" for n, chunk in enumerate(chunks, 1)]
+
+    def _handle(self, payload):
+        if payload.startswith('~'):
+            payload = self._reassemble(payload)
+            if payload is None:
+                return
+        data = json.loads(payload)
+        self.hub.dispatch(data['branch'], data['message'])
+
+    def _reassemble(self, part):
+        """Guarda una parte; devuelve el payload completo al llegar la última."""
+        message_id, n, total, chunk = part[1:].split(':', 3)
+        chunks = self._partial.setdefault(message_id, {})
+        chunks[int(n)] = chunk
+        if len(chunks) < int(total):
+            if len(self._partial) > NOTIFY_MAX_PENDING:
+                # Partes huérfanas (p. ej. de antes de una reconexión).
+                self._partial.pop(next(iter(self._partial)))
+            return None
+        del self._partial[message_id]
+        return ''.join(chunks[i] for i in range(1, int(total) + 1))
+
+    def _listen(self):
+        while not self.stopped.is_set():
+            try:
+                self._listen_once()
+            except Exception as e:
+                self._failures += 1
+                delay = min(NOTIFY_RECONNECT_MAX_DELAY, 2 ** self._failures)
+                logger.error(f"Listener de {self.channel} desconectado ({e}); reintento en {delay}s.")
+                self._partial.clear()
+                self.stopped.wait(delay)
+
+    def _listen_once(self):
+        wrapper = connections[self.using]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f'LISTEN "{self.channel}"')
+            self._failures = 0
+
+            if callable(getattr(conn, 'notifies', None)):
+                # psycopg 3
+                for notify in conn.notifies():
+                    self._handle(notify.payload)
+                    if self.stopped.is_set():
+                        return
+                return
+
+            # psycopg2
+            while not self.stopped.is_set():
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+hub = StockHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+DEFAULT_BACKEND = {'class': 'temucosoft_app.realtime.PostgresNotifyBackend'}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                conf = getattr(settings, 'REALTIME_BACKEND', DEFAULT_BACKEND)
+                backend = import_string(conf['class'])(**conf.get('options', {}))
+                backend.start(hub)
+                _backend = backend
+    return _backend
+
+
+def check_multiprocess_backend():
+    """
+    Para los hooks de arranque de gunicorn: con varios procesos un backend
+    local dejaría a los suscriptores sin los eventos publicados en los demás.
+    """
+    conf = getattr(settings, 'REALTIME_BACKEND', DEFAULT_BACKEND)
+    backend_class = import_string(conf['class'])
+    if not getattr(backend_class, 'cross_process', False):
+        raise ImproperlyConfigured(
+            f"REALTIME_BACKEND ({conf['class']}) entrega solo dentro de un proceso; con varios "
+            "workers o el proceso ASGI aparte use temucosoft_app.realtime.PostgresNotifyBackend."
+        )
+
+
+def publish_branch_event(branch_id, event, data):
+    """Publica un evento SSE (`event`, `data`) para los suscriptores de la sucursal."""
+    try:
+        get_backend().publish(branch_id, {'event': event, 'data': data})
+    except Exception as e:
+        # El canal push nunca debe hacer fallar una venta o compra.
+        logger.error(f"Error publicando evento {event} de sucursal {branch_id}: {e}")
+
+
+def publish_stock_change(branch_id, product_ids, using, event=None, event_data=None):
+    """Publica el stock actual de `product_ids` en la sucursal y, opcionalmente, un evento extra."""
+    from .models import Inventory
+
+    rows = list(
+        Inventory.objects.using(using)
+        .filter(branch_id=branch_id, product_id__in=product_ids)
+        .values('product_id', 'stock', 'reorder_point')
+    )
+    publish_branch_event(branch_id, 'stock', {'branch': branch_id, 'items': rows})
+    if event:
+        publish_branch_event(branch_id, event, event_data)
+
+
+def format_sse(message):
+    data = json.dumps(message['data'], cls=DjangoJSONEncoder)
+    return f"event: {message['event']}\ndata: {data}\n\n"
@@ -0,0 +1,122 @@
+"""
+Formatos compactos para los terminales POS.
+
+- MessagePack (application/msgpack, ?format=msgpack): binario, sin
+  comillas ni escapes; requiere el paquete `msgpack` (opcional). Si no
+  está instalado, la negociación lo omite y un cliente que solo acepta
+  msgpack recibe 406.
+- JSON columnar (application/vnd.temucosoft.columnar+json,
+  ?format=columnar): una lista de objetos con las mismas claves se envía
+  como {"columns": [...], "rows": [[...], ...]}, sin repetir las claves en
+  cada fila. Se aplica también a "results" de una respuesta paginada.
+
+Ambos tienen parser, así que los POST masivos pueden usar el mismo formato.
+Con `manage.py bench_renderers` se comparan tamaño y tiempo frente a JSON.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+# --------------------------------------------------------------------
+# Layout columnar
+# --------------------------------------------------------------------
+
+def to_columnar(data):
+    """Lista de dicts homogéneos -> {'columns', 'rows'}; cualquier otra cosa queda igual."""
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return dict(data, results=to_columnar(data['results']))
+    if not isinstance(data, list) or not data or not all(isinstance(row, dict) for row in data):
+        return data
+    columns = list(data[0])
+    if any(list(row) != columns for row in data):
+        return data
+    return {'columns': columns, 'rows': [list(row.values()) for row in data]}
+
+
+def from_columnar(data):
+    """Inverso de to_columnar()."""
+    if isinstance(data, dict) and set(data) == {'columns', 'rows'}:
+        columns = data['columns']
+        return [dict(zip(columns, row)) for row in data['rows']]
+    if isinstance(data, dict) and isinstance(data.get('results'), dict):
+        return dict(data, results=from_columnar(data['results']))
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.temucosoft.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(to_columnar(data), accepted_media_type, renderer_context)
+
+
+class ColumnarJSONParser(JSONParser):
+    media_type = 'application/vnd.temucosoft.columnar+json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return from_columnar(super().parse(stream, media_type, parser_context))
+
+
+# --------------------------------------------------------------------
+# MessagePack
+# --------------------------------------------------------------------
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @staticmethod
+    def available():
+        return _msgpack() is not None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Decimal, fechas, UUID, etc. con las mismas reglas que el JSON de DRF.
+        return _msgpack().packb(data, default=_encoder.default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    @staticmethod
+    def available():
+        return _msgpack() is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return _msgpack().unpackb(stream.read(), raw=False)
+        except Exception as e:
+            raise ParseError(f"Cuerpo MessagePack inválido ({type(e).__name__}).")
+
+
+class CompactContentNegotiation(DefaultContentNegotiation):
+    """Negociación por defecto sin los formatos cuya dependencia no está instalada."""
+
+    def select_parser(self, request, parsers):
+        return super().select_parser(request, [p for p in parsers if _available(p)])
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, [r for r in renderers if _available(r)], format_suffix)
+
+
+def _available(component):
+    check = getattr(component, 'available', None)
+    return check is None or check()
+
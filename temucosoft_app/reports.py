@@ -0,0 +1,451 @@
+"""Consultas de reportes compartidas por ReportViewSet y los trabajos en segundo plano."""
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Avg, Count, DecimalField, DurationField, ExpressionWrapper, F, Max, Min, StdDev, Sum, Window
+)
+from django.db.models.functions import Coalesce, FirstValue, Lag, Rank, Round, TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .cache_versions import versioned_key
+from .models import (
+    CartItem, Inventory, InventoryValuationSnapshot, Product, ProductPriceHistory, PurchaseItem, Sale, Branch, CustomUser
+)
+from .partitions import archived_company_rows
+from .pricing import cost_as_of
+from .tenancy import tenant_db
+
+STOCK_REPORT_FIELDS = ('branch__name', 'product__sku', 'product__name', 'stock', 'reorder_point')
+SALES_REPORT_FIELDS = ('branch__name', 'total', 'created_at', 'user__username', 'payment_method')
+
+
+def stock_report_queryset(company, params=None):
+    return Inventory.objects.filter(branch__company=company) \
+        .values(*STOCK_REPORT_FIELDS) \
+        .order_by('branch__name', 'product__name')
+
+
+def sales_report_queryset(company, params=None):
+    params = params or {}
+    qs = Sale.objects.filter(company=company)
+
+    # Mismos límites que archived_sales_rows(): date_to como fecha incluye todo el día.
+    date_from = parse_bound(params.get('date_from'))
+    date_to = parse_bound(params.get('date_to'), end=True)
+    if date_from:
+        qs = qs.filter(created_at__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__lte=date_to)
+    if params.get('branch'):
+        qs = qs.filter(branch_id=params['branch'])
+
+    return qs.values(*SALES_REPORT_FIELDS).order_by('-created_at')
+
+
+def parse_bound(value, end=False):
+    """
+    Convierte date_from/date_to (fecha o fecha-hora) en datetime aware.
+    ValueError si no es una fecha válida: ignorarla dejaría el reporte sin
+    límite sobre todo el historial.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Fecha inválida: {value!r}")
+        parsed = datetime.combine(day, time.max if end else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def archived_sales_rows(company, params=None):
+    """
+    Filas del reporte de ventas provenientes de meses archivados (ver
+    partitions.py). Solo se leen si date_from cae en un mes archivado; sin
+    date_from el reporte se limita a las particiones vivas.
+    """
+    params = params or {}
+    date_from = parse_bound(params.get('date_from'))
+    date_to = parse_bound(params.get('date_to'), end=True)
+    if date_from is None:
+        return []
+
+    branch = str(params.get('branch') or '')
+    rows = [
+        row for row in archived_company_rows(Sale, company.pk, date_from, date_to)
+        if not branch or str(row['branch_id']) == branch
+    ]
+
+    branches = Branch.objects.in_bulk({r['branch_id'] for r in rows})
+    users = CustomUser.objects.only('username').in_bulk({r['user_id'] for r in rows})
+    rows.sort(key=lambda r: r['created_at'], reverse=True)
+    return [
+        {
+            'branch__name': branches[r['branch_id']].name if r['branch_id'] in branches else None,
+            'total': Decimal(str(r['total'])),
+            'created_at': r['created_at'],
+            'user__username': users[r['user_id']].username if r['user_id'] in users else None,
+            'payment_method': r['payment_method'],
+        }
+        for r in rows
+    ]
+
+
+# --------------------------------------------------------------------
+# Valorización de inventario
+# --------------------------------------------------------------------
+
+VALUATION_FIELDS = ('products', 'units', 'value', 'retail_value', 'potential_margin')
+
+
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=DecimalField(max_digits=16, decimal_places=2))
+
+
+def valuation_queryset(company, branch=None):
+    """Valor a costo, a precio y margen potencial por sucursal y categoría, agregado en SQL."""
+    qs = Inventory.objects.filter(branch__company=company)
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    return qs.values('branch_id', 'branch__name', 'product__category').annotate(
+        products=Count('id'),
+        units=Sum('stock'),
+        value=Sum(_money(F('stock') * F('product__cost'))),
+        retail_value=Sum(_money(F('stock') * F('product__price'))),
+        potential_margin=Sum(_money(F('stock') * (F('product__price') - F('product__cost')))),
+    ).order_by('branch__name', 'product__category')
+
+
+def _with_totals(rows, fields=VALUATION_FIELDS):
+    totals = {field: 0 for field in fields}
+    for row in rows:
+        for field in fields:
+            totals[field] += row[field] or 0
+    return {'rows': rows, 'totals': totals}
+
+
+def valuation_report(company, params=None):
+    """
+    Reporte de valorización en vivo. Se cachea por compañía con la versión
+    de inventario (ver cache_versions.py): cualquier cambio de stock o de
+    producto invalida el resultado.
+    """
+    params = params or {}
+    branch = params.get('branch') or ''
+    key = versioned_key('inventory', company.pk, 'valuation', branch)
+    report = cache.get(key)
+    if report is None:
+        report = _with_totals(list(valuation_queryset(company, branch)))
+        report['generated_at'] = timezone.now()
+        cache.set(key, report, getattr(settings, 'VALUATION_CACHE_TTL', 3600))
+    return report
+
+
+def valuation_snapshot_report(company, day, branch=None):
+    qs = InventoryValuationSnapshot.objects.filter(company=company, date=day)
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    rows = list(
+        qs.values('branch_id', 'branch__name', 'category', *VALUATION_FIELDS)
+        .order_by('branch__name', 'category')
+    )
+    for row in rows:
+        row['product__category'] = row.pop('category')
+    report = _with_totals(rows)
+    report['date'] = day
+    return report
+
+
+def valuation_history(company, date_from=None, date_to=None, branch=None):
+    """Totales diarios a partir de las fotos, sin recalcular el inventario."""
+    qs = InventoryValuationSnapshot.objects.filter(company=company)
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+    if branch:
+        qs = qs.filter(branch_id=branch)
+    return qs.values('date').annotate(**{f: Sum(f) for f in VALUATION_FIELDS}).order_by('date')
+
+
+def snapshot_valuation(company, day=None):
+    """Guarda (o reemplaza) la foto de valorización del día. Devuelve la cantidad de filas."""
+    day = day or timezone.localdate()
+    rows = [
+        InventoryValuationSnapshot(
+            company=company, date=day, branch_id=row['branch_id'], category=row['product__category'],
+            **{field: row[field] or 0 for field in VALUATION_FIELDS},
+        )
+        for row in valuation_queryset(company)
+    ]
+    with transaction.atomic(using=tenant_db()):
+        InventoryValuationSnapshot.objects.filter(company=company, date=day).delete()
+        InventoryValuationSnapshot.objects.bulk_create(rows)
+    return len(rows)
+
+
+# --------------------------------------------------------------------
+# Margen histórico
+# --------------------------------------------------------------------
+
+MARGIN_FIELDS = ('units', 'revenue', 'cost', 'margin')
+MARGIN_GROUPS = {
+    'category': ('product__category',),
+    'product': ('product_id', 'product__sku', 'product__name'),
+    'branch': ('sale__branch_id', 'sale__branch__name'),
+    'day': ('day',),
+}
+
+
+def margin_queryset(company, params=None):
+    """
+    Margen de las ventas POS: ingreso al precio de cada línea y costo
+    vigente al momento de la venta según ProductPriceHistory (no el costo
+    actual del producto). Todo se agrega en SQL.
+    """
+    params = params or {}
+    fields = MARGIN_GROUPS[params.get('group') or 'category']
+    qs = CartItem.objects.filter(sale__company=company)
+
+    date_from = parse_bound(params.get('date_from'))
+    date_to = parse_bound(params.get('date_to'), end=True)
+    if date_from:
+        qs = qs.filter(created_at__gte=date_from)
+    if date_to:
+        qs = qs.filter(created_at__lte=date_to)
+    if params.get('branch'):
+        qs = qs.filter(sale__branch_id=params['branch'])
+
+    # Sin historial (producto creado antes de la tabla y sin backfill) se usa el costo actual.
+    qs = qs.annotate(unit_cost=Coalesce(cost_as_of(), F('product__cost')), day=TruncDate('created_at'))
+    return qs.values(*fields).annotate(
+        units=Sum('quantity'),
+        revenue=Sum(_money(F('quantity') * F('price'))),
+        cost=Sum(_money(F('quantity') * F('unit_cost'))),
+    ).annotate(margin=_money(F('revenue') - F('cost'))).order_by(*fields)
+
+
+def archived_margin_rows(company, params=None):
+    """
+    Filas de margin_queryset() para las líneas de venta de meses archivados
+    (como en archived_sales_rows, solo si date_from cae en uno). El costo
+    vigente se busca en ProductPriceHistory igual que en SQL.
+    """
+    params = params or {}
+    date_from = parse_bound(params.get('date_from'))
+    date_to = parse_bound(params.get('date_to'), end=True)
+    if date_from is None:
+        return []
+    items = [r for r in archived_company_rows(CartItem, company.pk, date_from, date_to) if r['sale_id'] is not None]
+    if not items:
+        return []
+
+    # Sucursal de cada venta: archivada (mismo rango, más un margen por el cambio de mes) o aún en la BD.
+    sale_ids = {r['sale_id'] for r in items}
+    margin = timedelta(days=1)
+    sale_branch = {
+        r['id']: r['branch_id']
+        for r in archived_company_rows(Sale, company.pk, date_from - margin, date_to and date_to + margin)
+        if r['id'] in sale_ids
+    }
+    sale_branch.update(Sale.objects.filter(company=company, pk__in=sale_ids - sale_branch.keys())
+                       .values_list('pk', 'branch_id'))
+    branch = str(params.get('branch') or '')
+    if branch:
+        items = [r for r in items if str(sale_branch.get(r['sale_id'])) == branch]
+
+    product_ids = {r['product_id'] for r in items}
+    products = Product.objects.in_bulk(product_ids)
+    branches = Branch.objects.in_bulk(set(sale_branch.values()))
+    history = {}
+    for product_id, valid_from, cost in ProductPriceHistory.objects.filter(product_id__in=product_ids) \
+            .order_by('product_id', 'valid_from', 'id').values_list('product_id', 'valid_from', 'cost'):
+        dates, costs = history.setdefault(product_id, ([], []))
+        dates.append(valid_from)
+        costs.append(cost)
+
+    fields = MARGIN_GROUPS[params.get('group') or 'category']
+    groups = {}
+    for item in items:
+        product = products.get(item['product_id'])
+        dates, costs = history.get(item['product_id'], ((), ()))
+        i = bisect_right(dates, item['created_at'])
+        unit_cost = costs[i - 1] if i else (product.cost if product else None)
+        branch_id = sale_branch.get(item['sale_id'])
+        values = {
+            'product__category': product.category if product else None,
+            'product_id': item['product_id'],
+            'product__sku': product.sku if product else None,
+            'product__name': product.name if product else None,
+            'sale__branch_id': branch_id,
+            'sale__branch__name': branches[branch_id].name if branch_id in branches else None,
+            'day': timezone.localtime(item['created_at']).date(),
+        }
+        row = groups.setdefault(tuple(values[f] for f in fields),
+                                {**{f: values[f] for f in fields}, 'units': 0, 'revenue': 0, 'cost': 0})
+        quantity = item['quantity']
+        row['units'] += quantity
+        row['revenue'] += quantity * Decimal(str(item['price']))
+        row['cost'] += quantity * unit_cost if unit_cost is not None else 0
+    for row in groups.values():
+        row['margin'] = row['revenue'] - row['cost']
+    return list(groups.values())
+
+
+def _merge_margin_rows(rows, extra, fields):
+    if not extra:
+        return rows
+    merged = {tuple(row[f] for f in fields): row for row in rows}
+    for row in extra:
+        key = tuple(row[f] for f in fields)
+        if key not in merged:
+            merged[key] = row
+            continue
+        target = merged[key]
+        for field in MARGIN_FIELDS:
+            target[field] = (target[field] or 0) + row[field]
+    return sorted(merged.values(), key=lambda r: [(r[f] is None, r[f]) for f in fields])
+
+
+def margin_report(company, params=None):
+    params = params or {}
+    fields = MARGIN_GROUPS[params.get('group') or 'category']
+    rows = _merge_margin_rows(list(margin_queryset(company, params)), archived_margin_rows(company, params), fields)
+    report = _with_totals(rows, MARGIN_FIELDS)
+    for row in report['rows'] + [report['totals']]:
+        row['margin_pct'] = round(row['margin'] * 100 / row['revenue'], 2) if row['revenue'] else None
+    return report
+
+
+# --------------------------------------------------------------------
+# Proveedores
+# --------------------------------------------------------------------
+
+SUPPLIER_FIELDS = ('purchases', 'products', 'units', 'spend')
+
+
+def _unit_cost(expression):
+    return Round(ExpressionWrapper(expression, output_field=DecimalField(max_digits=14, decimal_places=4)), 4)
+
+
+def supplier_items_queryset(company, params=None):
+    """Líneas de compra de la compañía filtradas por ?date_from, ?date_to, ?branch y ?supplier."""
+    params = params or {}
+    qs = PurchaseItem.objects.filter(purchase__company=company)
+    date_from, date_to = parse_date(params.get('date_from') or ''), parse_date(params.get('date_to') or '')
+    if date_from:
+        qs = qs.filter(purchase__date__gte=date_from)
+    if date_to:
+        qs = qs.filter(purchase__date__lte=date_to)
+    if params.get('branch'):
+        qs = qs.filter(purchase__branch_id=params['branch'])
+    if params.get('supplier'):
+        qs = qs.filter(purchase__supplier_id=params['supplier'])
+    return qs
+
+
+def supplier_summary_queryset(items):
+    """Gasto, compras y productos por proveedor, con su ranking por gasto."""
+    return items.values('purchase__supplier_id', 'purchase__supplier__name').annotate(
+        purchases=Count('purchase', distinct=True),
+        products=Count('product', distinct=True),
+        units=Sum('quantity'),
+        spend=Sum(_money(F('quantity') * F('unit_cost'))),
+        first_date=Min('purchase__date'),
+        last_date=Max('purchase__date'),
+        active_span=ExpressionWrapper(Max('purchase__date') - Min('purchase__date'), output_field=DurationField()),
+    ).annotate(
+        spend_rank=Window(Rank(), order_by=F('spend').desc()),
+    ).order_by('spend_rank', 'purchase__supplier__name')
+
+
+def cost_trend_queryset(items):
+    """Costo unitario promedio ponderado por producto y mes, con la variación respecto del mes anterior."""
+    avg_cost = _unit_cost(Sum(_money(F('quantity') * F('unit_cost'))) / Sum('quantity'))
+    month_order = F('month').asc()
+    return items.values('product_id', 'product__sku', 'product__name', month=TruncMonth('purchase__date')).annotate(
+        units=Sum('quantity'),
+        avg_unit_cost=avg_cost,
+    ).annotate(
+        previous_unit_cost=Window(Lag(avg_cost), partition_by=[F('product_id')], order_by=month_order),
+        first_unit_cost=Window(FirstValue(avg_cost), partition_by=[F('product_id')], order_by=month_order),
+    ).order_by('product__sku', 'month')
+
+
+def cost_variance_queryset(items):
+    """Dispersión del costo unitario de cada producto por proveedor."""
+    return items.values(
+        'purchase__supplier_id', 'purchase__supplier__name', 'product_id', 'product__sku', 'product__name',
+    ).annotate(
+        lines=Count('id'),
+        min_unit_cost=Min('unit_cost'),
+        max_unit_cost=Max('unit_cost'),
+        avg_unit_cost=_unit_cost(Avg('unit_cost')),
+        stddev_unit_cost=_unit_cost(StdDev('unit_cost')),
+    ).filter(lines__gt=1).order_by('purchase__supplier__name', 'product__sku')
+
+
+def _pct(value, base):
+    return round((value - base) * 100 / base, 2) if value is not None and base else None
+
+
+def _supplier_keys(row):
+    return {
+        'supplier_id': row.pop('purchase__supplier_id'),
+        'supplier_name': row.pop('purchase__supplier__name'),
+        **row,
+    }
+
+
+def _supplier_report(company, params):
+    items = supplier_items_queryset(company, params)
+    suppliers = [_supplier_keys(row) for row in supplier_summary_queryset(items)]
+    totals = _with_totals(suppliers, SUPPLIER_FIELDS)['totals']
+    for row in suppliers:
+        span = row.pop('active_span')
+        # Días promedio entre compras (None con una sola compra).
+        row['avg_days_between'] = round(span.days / (row['purchases'] - 1), 1) if row['purchases'] > 1 else None
+        row['spend_share_pct'] = round(row['spend'] * 100 / totals['spend'], 2) if totals['spend'] else None
+
+    trend = list(cost_trend_queryset(items))
+    for row in trend:
+        row['change_pct'] = _pct(row['avg_unit_cost'], row['previous_unit_cost'])
+        row['change_since_first_pct'] = _pct(row['avg_unit_cost'], row.pop('first_unit_cost'))
+
+    variance = [_supplier_keys(row) for row in cost_variance_queryset(items)]
+    for row in variance:
+        row['cv_pct'] = round(row['stddev_unit_cost'] * 100 / row['avg_unit_cost'], 2) \
+            if row['avg_unit_cost'] else None
+
+    return {
+        'suppliers': suppliers,
+        'totals': {field: totals[field] for field in ('purchases', 'units', 'spend')},
+        'cost_trend': trend,
+        'cost_variance': variance,
+        'generated_at': timezone.now(),
+    }
+
+
+def supplier_report(company, params=None):
+    """
+    Analítica de proveedores agregada en SQL. Se cachea por compañía y
+    filtros con la versión 'purchases', que se incrementa al registrar o
+    modificar compras o proveedores (signals.py).
+    """
+    params = params or {}
+    filters = [params.get(name) or '' for name in ('date_from', 'date_to', 'branch', 'supplier')]
+    key = versioned_key('purchases', company.pk, 'suppliers', *filters)
+    report = cache.get(key)
+    if report is None:
+        report = _supplier_report(company, params)
+        cache.set(key, report, getattr(settings, 'SUPPLIER_REPORT_CACHE_TTL', 3600))
+    return report
@@ -0,0 +1,54 @@
+from .tenancy import (
+    control_database, tenant_shards, is_tenant_model, shard_for_company, current_shard
+)
+
+
+class TenantShardRouter:
+    """
+    Enruta los modelos de tenant al shard de su compañía y los modelos de
+    control (y apps de Django) a settings.CONTROL_DATABASE.
+
+    Orden de resolución para modelos de tenant:
+      1. BD de la instancia de la pista o de sus padres ya cargados.
+      2. Shard de la compañía de la instancia (company_id o la propia Company).
+      3. Shard fijado para la petición/tarea actual (tenancy.use_tenant_shard).
+      4. BD de control.
+    """
+
+    def _db_for_tenant_model(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None:
+            if is_tenant_model(type(instance)):
+                if instance._state.db in tenant_shards():
+                    return instance._state.db
+                # Instancia nueva: usar la BD de sus padres de tenant ya cargados (p. ej. Inventory.branch).
+                for related in instance._state.fields_cache.values():
+                    if related is not None and is_tenant_model(type(related)) and related._state.db:
+                        return related._state.db
+                company_id = getattr(instance, 'company_id', None)
+            elif instance._meta.model_name == 'company':
+                company_id = instance.pk
+            else:
+                company_id = getattr(instance, 'company_id', None)
+            shard = shard_for_company(company_id)
+            if shard:
+                return shard
+        return current_shard() or control_database()
+
+    def db_for_read(self, model, **hints):
+        if is_tenant_model(model):
+            return self._db_for_tenant_model(model, **hints)
+        return control_database()
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las FK de los modelos de tenant hacia Company/CustomUser cruzan
+        # bases de datos; cada shard mantiene una copia espejo de esas filas.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Todas las BD tienen el esquema completo para que las FK hacia las
+        # filas espejo de control sean válidas en cada shard.
+        return db == control_database() or db in tenant_shards()
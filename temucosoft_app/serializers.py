@@ -1,9 +1,13 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
 from .models import (CustomUser, Company, Subscription, Product, Branch, Supplier, 
-    Inventory, Purchase, PurchaseItem, Sale, Order, CartItem, ROLES_CHOICES, ORDER_STATUS_CHOICES
+    Inventory, Purchase, PurchaseItem, Sale, Order, CartItem, Job, OutboxEvent,
+    StockTransfer, StockTransferItem,
+    ROLES_CHOICES, ORDER_STATUS_CHOICES
 )
 from .utils import is_valid_rut, clean_rut
 
@@ -85,6 +89,43 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'company', 'sku', 'name', 'description', 'price', 'cost', 'category']
         read_only_fields = ['company']
 
+class RepricingRuleSerializer(serializers.Serializer):
+    """Regla de repricing: filtro (categoría / patrón de SKU con `*`) y cambio porcentual o absoluto."""
+    category = serializers.CharField(required=False, allow_blank=False)
+    sku_pattern = serializers.CharField(required=False, allow_blank=False, max_length=50)
+    field = serializers.ChoiceField(choices=['price', 'cost'], default='price')
+    percent = serializers.DecimalField(max_digits=7, decimal_places=3, required=False, min_value=-100)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    rounding = serializers.DecimalField(max_digits=10, decimal_places=2, required=False,
+                                        min_value=Decimal('0.01'))
+    floor_at_cost = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        if ('percent' in data) == ('amount' in data):
+            raise serializers.ValidationError("Debe indicar 'percent' o 'amount' (solo uno).")
+        return data
+
+class RepricingSerializer(serializers.Serializer):
+    rules = RepricingRuleSerializer(many=True, allow_empty=False, max_length=50)
+    dry_run = serializers.BooleanField(default=False)
+
+class PricesAsOfSerializer(serializers.Serializer):
+    """Consulta as-of por lote: `skus` o `products` (ids), hasta 10000."""
+    at = serializers.DateTimeField()
+    skus = serializers.ListField(child=serializers.CharField(max_length=50), required=False, max_length=10000)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=10000)
+
+    def validate(self, data):
+        if ('skus' in data) == ('products' in data):
+            raise serializers.ValidationError("Debe indicar 'skus' o 'products' (solo uno).")
+        return data
+
+class ReportDatesSerializer(serializers.Serializer):
+    """?date, ?date_from y ?date_to de los reportes diarios; una fecha inexistente (2024-02-30) es un 400."""
+    date = serializers.DateField(required=False, allow_null=True)
+    date_from = serializers.DateField(required=False, allow_null=True)
+    date_to = serializers.DateField(required=False, allow_null=True)
+
 class BranchSerializer(serializers.ModelSerializer):
     class Meta:
         model = Branch
@@ -103,8 +144,40 @@ class SupplierSerializer(serializers.ModelSerializer):
 class InventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Inventory
-        fields = ['branch', 'product', 'stock', 'reorder_point']
-        
+        fields = ['branch', 'product', 'stock', 'reorder_point', 'version']
+        read_only_fields = ['version']
+
+
+class InventoryAdjustSerializer(serializers.Serializer):
+    """Ajuste de una fila: `delta` relativo o `stock` absoluto, con `version` opcional."""
+    branch = serializers.IntegerField()
+    product = serializers.IntegerField()
+    delta = serializers.IntegerField(required=False)
+    stock = serializers.IntegerField(required=False, min_value=0)
+    version = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, data):
+        if ('delta' in data) == ('stock' in data):
+            raise serializers.ValidationError("Debe indicar 'delta' o 'stock' (solo uno).")
+        return data
+
+
+class CycleCountItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    stock = serializers.IntegerField(min_value=0)
+    version = serializers.IntegerField(required=False, min_value=0)
+
+
+class CycleCountSerializer(serializers.Serializer):
+    branch = serializers.IntegerField()
+    counts = CycleCountItemSerializer(many=True, allow_empty=False)
+
+    def validate_counts(self, counts):
+        if len({c['product'] for c in counts}) != len(counts):
+            raise serializers.ValidationError("Hay productos repetidos en el conteo.")
+        return counts
+
+
 # --- SERIALIZERS DE TRANSACCIONES ---
 
 class PurchaseItemSerializer(serializers.ModelSerializer):
@@ -126,9 +199,120 @@ class PurchaseCreateSerializer(serializers.ModelSerializer):
         return value
 
 class SaleCreateSerializer(serializers.ModelSerializer):
-    items = serializers.JSONField() # Usar JSONField para la lista anidada simplifica la estructura
+    items = serializers.JSONField(write_only=True) # Usar JSONField para la lista anidada simplifica la estructura
 
     class Meta:
         model = Sale
-        fields = ['id', 'branch', 'payment_method', 'items'] # user y total son asignados en la vista
-        read_only_fields = ['user', 'company']
+        fields = ['id', 'branch', 'payment_method', 'items', 'receipt_number'] # user y total son asignados en la vista
+        read_only_fields = ['user', 'company', 'receipt_number']
+
+class StockTransferLineSerializer(serializers.Serializer):
+    # Ids simples: un traspaso de miles de líneas no debe resolver cada producto por separado.
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class StockTransferItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockTransferItem
+        fields = ['product', 'quantity']
+
+class StockTransferSerializer(serializers.ModelSerializer):
+    lines = StockTransferLineSerializer(many=True, write_only=True, allow_empty=False)
+    items = StockTransferItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = StockTransfer
+        fields = ['id', 'from_branch', 'to_branch', 'note', 'lines', 'items', 'total_units', 'created_at']
+        read_only_fields = ['total_units', 'created_at', 'user', 'company']
+
+    def validate(self, data):
+        if data['from_branch'] == data['to_branch']:
+            raise serializers.ValidationError({'to_branch': "La sucursal de destino debe ser distinta a la de origen."})
+        if data['from_branch'].company_id != data['to_branch'].company_id:
+            raise serializers.ValidationError("Ambas sucursales deben pertenecer a la misma compañía.")
+        return data
+
+    def validate_lines(self, lines):
+        if len({line['product'] for line in lines}) != len(lines):
+            raise serializers.ValidationError("Hay productos repetidos en el traspaso.")
+        return lines
+
+# --- SERIALIZERS DE TRABAJOS ---
+
+class JobSerializer(serializers.ModelSerializer):
+    has_file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'priority', 'attempts', 'max_attempts', 'progress',
+                  'progress_message', 'result', 'error', 'has_file', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_has_file(self, obj):
+        return bool(obj.result_file)
+
+
+# --- SERIALIZERS DE EVENTOS (OUTBOX) ---
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    seq = serializers.IntegerField(source='feed_seq', read_only=True)
+
+    class Meta:
+        model = OutboxEvent
+        fields = ['id', 'seq', 'event_type', 'aggregate_id', 'payload', 'created_at']
+        read_only_fields = fields
+
+
+def sale_event_payload(sale):
+    return {
+        'id': sale.pk,
+        'branch': sale.branch_id,
+        'receipt_number': sale.receipt_number,
+        'user': sale.user_id,
+        'total': str(sale.total),
+        'payment_method': sale.payment_method,
+        'created_at': sale.created_at.isoformat(),
+        'items': [
+            {'product': i.product_id, 'quantity': i.quantity, 'price': str(i.price)}
+            for i in sale.items.all()
+        ],
+    }
+
+
+def purchase_event_payload(purchase):
+    return {
+        'id': purchase.pk,
+        'supplier': purchase.supplier_id,
+        'branch': purchase.branch_id,
+        'user': purchase.user_id,
+        'total': str(purchase.total),
+        'date': str(purchase.date),
+        'items': [
+            {'product': i.product_id, 'quantity': i.quantity, 'unit_cost': str(i.unit_cost)}
+            for i in purchase.items.all()
+        ],
+    }
+
+
+def transfer_event_payload(transfer, lines):
+    return {
+        'id': transfer.pk,
+        'from_branch': transfer.from_branch_id,
+        'to_branch': transfer.to_branch_id,
+        'user': transfer.user_id,
+        'total_units': transfer.total_units,
+        'created_at': transfer.created_at.isoformat(),
+        'items': [{'product': pid, 'quantity': qty} for pid, qty in lines.items()],
+    }
+
+
+def order_event_payload(order):
+    return {
+        'id': order.pk,
+        'user': order.user_id,
+        'client_name': order.client_name,
+        'client_email': order.client_email,
+        'status': order.status,
+        'total': str(order.total),
+        'created_at': order.created_at.isoformat(),
+    }
@@ -0,0 +1,113 @@
+"""
+Receptores de señales de la app (conectados en TemucosoftAppConfig.ready).
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versions import bump_version
+from .models import Company, CustomUser, Order, Product, Branch, Inventory, Purchase, Supplier
+from .outbox import record_event
+from .pricing import record_price_change
+from .serializers import order_event_payload
+from .tenancy import control_database, forget_company_shard, sharding_enabled, mirror_control_rows
+from .throttling import forget_company_plan
+from .usage import increment
+
+
+@receiver(post_save, sender=Company)
+def company_saved(sender, instance, using, **kwargs):
+    if using != control_database():
+        return
+    forget_company_shard(instance.pk)
+    forget_company_plan(instance.pk)
+    # El catálogo público muestra el nombre y oculta las compañías inactivas.
+    transaction.on_commit(partial(bump_version, 'catalog', instance.pk), using=using)
+    if sharding_enabled() and instance.shard != control_database():
+        mirror_control_rows(instance.shard, instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, using, **kwargs):
+    if using != control_database():
+        return
+    if sharding_enabled() and instance.company_id:
+        company = Company.objects.only('shard').get(pk=instance.company_id)
+        if company.shard != control_database():
+            mirror_control_rows(company.shard, instance.company_id, users=[instance])
+
+
+@receiver(post_save, sender=Order)
+def order_created(sender, instance, created, **kwargs):
+    # Corre dentro de la transacción del código que crea la orden.
+    if created:
+        record_event('order.created', instance, order_event_payload(instance))
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Branch)
+def catalog_row_changed(sender, instance, using, **kwargs):
+    # Cambios por save()/delete() (admin, API). Los UPDATE masivos incrementan la versión por su cuenta.
+    transaction.on_commit(partial(bump_version, 'inventory', instance.company_id), using=using)
+    if sender is Product:
+        # Páginas y fragmentos del catálogo público (catalog.py).
+        transaction.on_commit(partial(bump_version, 'catalog', instance.company_id), using=using)
+
+
+@receiver([post_save, post_delete], sender=Purchase)
+@receiver([post_save, post_delete], sender=Supplier)
+def purchase_row_changed(sender, instance, using, **kwargs):
+    # Reporte de proveedores (reports.supplier_report). Las líneas se crean en la
+    # misma transacción que la compra, así que basta con confirmar la compra.
+    transaction.on_commit(partial(bump_version, 'purchases', instance.company_id), using=using)
+
+
+@receiver([post_save, post_delete], sender=Inventory)
+def inventory_row_changed(sender, instance, using, **kwargs):
+    company_id = Branch.objects.using(using).filter(pk=instance.branch_id) \
+        .values_list('company_id', flat=True).first()
+    if company_id:
+        transaction.on_commit(partial(bump_version, 'inventory', company_id), using=using)
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created, using, raw=False, update_fields=None, **kwargs):
+    # Los UPDATE masivos (pricing.reprice) escriben su propio historial.
+    if raw or (update_fields is not None and not {'price', 'cost'} & set(update_fields)):
+        return
+    prices = (instance.price, instance.cost)
+    if not created and getattr(instance, '_loaded_prices', None) == prices:
+        return
+    record_price_change(instance, using=using)
+    instance._loaded_prices = prices
+
+
+USAGE_COUNTERS = {CustomUser: 'users', Product: 'products', Branch: 'branches'}
+
+
+def _count_usage(sender, instance, using, delta):
+    counter = USAGE_COUNTERS[sender]
+    if sender is CustomUser:
+        # Las copias de usuarios en los shards no cuentan; en control va en la misma transacción.
+        if using == control_database():
+            increment(instance.company_id, counter, delta)
+        return
+    # TenantUsage vive en la BD de control: solo se cuenta lo confirmado en el shard.
+    transaction.on_commit(partial(increment, instance.company_id, counter, delta), using=using)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Branch)
+def usage_row_created(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw:
+        _count_usage(sender, instance, using, 1)
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Branch)
+def usage_row_deleted(sender, instance, using, **kwargs):
+    _count_usage(sender, instance, using, -1)
@@ -0,0 +1,286 @@
+"""
+Captura automática de consultas lentas.
+
+install() (llamado desde TemucosoftAppConfig.ready) agrega un execute
+wrapper a cada conexión que se abre. Si una sentencia supera
+settings.SLOW_QUERY_THRESHOLD_MS, se encola junto con la vista que la
+originó; un hilo aparte normaliza el SQL, corre EXPLAIN (ANALYZE opcional,
+solo para SELECT sin efectos) cuando la duración es la peor vista para esa huella y
+actualiza el agregado en SlowQuery.
+
+Bajo el umbral el costo es una resta de perf_counter por consulta.
+Consultar con `manage.py slow_queries` o GET /api/slow-queries/.
+"""
+import contextvars
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 1000
+
+_current_view = contextvars.ContextVar('temucosoft_current_view', default='')
+_local = threading.local()
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+
+
+# --------------------------------------------------------------------
+# Huella de SQL
+# --------------------------------------------------------------------
+
+_NORMALIZERS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?+)'),
+    (re.compile(r'(?:\(\?\+\)\s*,\s*)+\(\?\+\)'), '(?+)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize_sql(sql):
+    """Reemplaza literales y listas IN/VALUES por marcadores para agrupar consultas iguales."""
+    for pattern, replacement in _NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+# --------------------------------------------------------------------
+# Captura
+# --------------------------------------------------------------------
+
+def set_current_view(name):
+    return _current_view.set(name)
+
+
+def reset_current_view(token):
+    _current_view.reset(token)
+
+
+def capture_slow_queries(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        limit = threshold_ms()
+        if limit is not None and elapsed >= limit and not getattr(_local, 'suspended', False):
+            try:
+                _queue.put_nowait((
+                    context['connection'].alias, sql, None if many else params,
+                    elapsed, _current_view.get(),
+                ))
+            except queue.Full:
+                pass
+            _ensure_worker()
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if capture_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_slow_queries)
+
+
+def install():
+    """
+    connection.execute_wrapper() solo afecta a la conexión del hilo actual,
+    así que el wrapper se agrega en cada conexión nueva (connection_created).
+    """
+    if threshold_ms() is None:
+        return
+    connection_created.connect(_install_wrapper, dispatch_uid='temucosoft_slow_queries')
+    for connection in connections.all(initialized_only=True):
+        _install_wrapper(None, connection)
+
+
+class QueryContextMiddleware:
+    """Anota la vista y el método de la petición para asociarlos a las consultas lentas."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = set_current_view(f"{request.method} {request.path}")
+        try:
+            return self.get_response(request)
+        finally:
+            reset_current_view(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        name = match.view_name if match else view_func.__name__
+        # Los ViewSets de DRF exponen el mapeo método -> acción en view_func.actions.
+        action = (getattr(view_func, 'actions', None) or {}).get(request.method.lower())
+        _current_view.set(f"{request.method} {name}" + (f" ({action})" if action else ''))
+
+
+# --------------------------------------------------------------------
+# Procesamiento fuera de banda
+# --------------------------------------------------------------------
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='slow-query-recorder', daemon=True)
+            _worker.start()
+
+
+def _run_worker():
+    _local.suspended = True
+    while True:
+        item = _queue.get()
+        try:
+            record(*item)
+        except Exception as e:
+            logger.error(f"Error registrando consulta lenta: {e}")
+        finally:
+            _queue.task_done()
+
+
+# Cláusulas con efectos al ejecutarse: bloqueos, escrituras (también dentro de
+# un WITH), NOTIFY, secuencias y advisory locks.
+_SIDE_EFFECTS = re.compile(
+    r"\b(?:FOR\s+(?:NO\s+KEY\s+)?UPDATE|FOR\s+(?:KEY\s+)?SHARE|INSERT|UPDATE|DELETE|MERGE|INTO"
+    r"|PG_NOTIFY|NEXTVAL|SETVAL|PG_ADVISORY\w*|PG_TRY_ADVISORY\w*)\b"
+)
+
+
+def can_analyze(sql):
+    """Solo un SELECT simple, sin WITH ni nada que bloquee, escriba o notifique."""
+    statement = sql.lstrip().upper()
+    return statement.startswith('SELECT') and not _SIDE_EFFECTS.search(statement)
+
+
+def explain(alias, sql, params):
+    """
+    Plan de ejecución de `sql`, o '' si no aplica. EXPLAIN ANALYZE ejecuta la
+    sentencia de nuevo, fuera de su transacción original: solo se usa cuando
+    can_analyze() lo permite, y además dentro de una transacción que siempre
+    se revierte.
+    """
+    connection = connections[alias]
+    statement = sql.lstrip().upper()
+    is_select = statement.startswith(('SELECT', 'WITH'))
+    analyze = False
+    if connection.vendor == 'postgresql':
+        analyze = getattr(settings, 'SLOW_QUERY_EXPLAIN_ANALYZE', False) and can_analyze(sql)
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'mysql':
+        prefix = 'EXPLAIN '
+    else:
+        return ''
+    if not (is_select or statement.startswith(('UPDATE', 'DELETE', 'INSERT'))):
+        return ''
+
+    with transaction.atomic(using=alias):
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params or ())
+            rows = cursor.fetchall()
+        if analyze:
+            transaction.set_rollback(True, using=alias)
+    return '\n'.join(' | '.join(str(col) for col in row) for row in rows)
+
+
+def record(alias, sql, params, elapsed, view):
+    """Suma la ejecución al agregado de su huella (en la BD de control)."""
+    from .models import SlowQuery
+    from .tenancy import control_database
+
+    normalized = normalize_sql(sql)
+    key = fingerprint(normalized)
+    max_samples = getattr(settings, 'SLOW_QUERY_SAMPLES', 200)
+    db = control_database()
+
+    # EXPLAIN fuera de la transacción: si falla no debe abortar el registro.
+    plan = None
+    worst = SlowQuery.objects.using(db).filter(fingerprint=key).values_list('max_ms', flat=True).first()
+    if worst is None or elapsed > worst:
+        try:
+            plan = explain(alias, sql, params)
+        except Exception as e:
+            plan = f"EXPLAIN falló: {e}"
+
+    with transaction.atomic(using=db):
+        entry, _ = SlowQuery.objects.using(db).select_for_update().get_or_create(
+            fingerprint=key, defaults={'sql': normalized, 'db_alias': alias},
+        )
+        entry.count += 1
+        entry.total_ms += elapsed
+        entry.samples = (entry.samples + [round(elapsed, 3)])[-max_samples:]
+        if view:
+            entry.view = view[:255]
+        if elapsed > entry.max_ms:
+            entry.max_ms = elapsed
+            entry.worst_sql = sql
+            if plan is not None:
+                entry.worst_plan = plan
+        entry.save()
+    return entry
+
+
+def flush(timeout=5):
+    """Espera a que se procese lo encolado (para comandos y pruebas)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+# --------------------------------------------------------------------
+# Agregados
+# --------------------------------------------------------------------
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(entry, include_plan=False):
+    data = {
+        'fingerprint': entry.fingerprint,
+        'sql': entry.sql,
+        'db': entry.db_alias,
+        'view': entry.view,
+        'count': entry.count,
+        'avg_ms': round(entry.total_ms / entry.count, 3) if entry.count else 0,
+        'p50_ms': percentile(entry.samples, 0.5),
+        'p95_ms': percentile(entry.samples, 0.95),
+        'max_ms': round(entry.max_ms, 3),
+        'last_seen': entry.last_seen,
+    }
+    if include_plan:
+        data['worst_sql'] = entry.worst_sql
+        data['worst_plan'] = entry.worst_plan
+    return data
+
+
+def top_slow_queries(order='total', limit=50):
+    from .models import SlowQuery
+    from .tenancy import control_database
+
+    ordering = {'total': '-total_ms', 'count': '-count', 'max': '-max_ms', 'recent': '-last_seen'}[order]
+    return SlowQuery.objects.using(control_database()).order_by(ordering)[:limit]
@@ -0,0 +1,118 @@
+"""
+Handlers de trabajos en segundo plano (ver jobs.py).
+
+Cada handler recibe un JobContext y el payload del Job como kwargs, y
+devuelve un dict JSON-serializable que queda en Job.result.
+"""
+import csv
+import itertools
+import os
+
+from django.core.management import call_command
+from django.db import transaction
+
+from .inventory import receive_purchase_items
+from .jobs import register_job
+from .models import Company, CustomUser, Purchase
+from .provisioning import provision_users, read_csv
+from .reports import (
+    stock_report_queryset, sales_report_queryset, archived_sales_rows,
+    STOCK_REPORT_FIELDS, SALES_REPORT_FIELDS
+)
+from .tenant_archive import archive_filename, export_tenant
+from .tenant_purge import purge_tenant
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _export_csv(ctx, queryset, fields, filename, extra_rows=()):
+    """Escribe `queryset` (values()) y `extra_rows` a CSV en streaming, reportando progreso."""
+    total = queryset.count() + len(extra_rows)
+    path = ctx.result_path(filename)
+    rows = itertools.chain(queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE), extra_rows)
+
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(fields)
+        for i, row in enumerate(rows, start=1):
+            writer.writerow([row[f] for f in fields])
+            if i % EXPORT_CHUNK_SIZE == 0:
+                ctx.set_progress(i * 100 / total, f"{i}/{total} filas")
+
+    return {'rows': total, 'filename': filename}
+
+
+@register_job('reports.stock')
+def export_stock_report(ctx, company_id, params=None):
+    company = Company.objects.get(pk=company_id)
+    return _export_csv(ctx, stock_report_queryset(company, params), STOCK_REPORT_FIELDS, 'stock.csv')
+
+
+@register_job('reports.sales')
+def export_sales_report(ctx, company_id, params=None):
+    company = Company.objects.get(pk=company_id)
+    return _export_csv(ctx, sales_report_queryset(company, params), SALES_REPORT_FIELDS, 'sales.csv',
+                       extra_rows=archived_sales_rows(company, params))
+
+
+@register_job('purchases.bulk_receive')
+def bulk_receive_purchases(ctx, user_id, purchases):
+    """Registra varias compras ya validadas, cada una en su propia transacción."""
+    user = CustomUser.objects.select_related('company').get(pk=user_id)
+    created = []
+    for i, data in enumerate(purchases, start=1):
+        with transaction.atomic():
+            purchase = Purchase.objects.create(
+                company=user.company,
+                user=user,
+                supplier_id=data['supplier'],
+                branch_id=data['branch'],
+                date=data['date'],
+                total=0,
+            )
+            receive_purchase_items(purchase, data['items'])
+        created.append(purchase.pk)
+        ctx.set_progress(i * 100 / len(purchases), f"{i}/{len(purchases)} compras")
+    return {'purchases': created}
+
+
+@register_job('tenants.export')
+def export_tenant_archive(ctx, company_id, compression='gz'):
+    """Respaldo completo del tenant; se descarga desde /api/jobs/{id}/download/."""
+    filename = archive_filename(company_id, compression)
+    rows = export_tenant(
+        company_id, ctx.result_path(filename), compression,
+        progress=lambda done, total, message: ctx.set_progress(done * 100 / total, message),
+    )
+    return {'rows': rows, 'filename': filename}
+
+
+@register_job('tenants.purge')
+def purge_tenant_data(ctx, company_id, keep_company=False):
+    """Reanudable: un reintento continúa con las filas que queden."""
+    deleted = purge_tenant(
+        company_id, keep_company=keep_company,
+        progress=lambda done, total, message: ctx.set_progress(done * 100 / total, message),
+    )
+    return {'deleted': deleted}
+
+
+@register_job('users.bulk_provision')
+def bulk_provision_users(ctx, user_id, path):
+    """
+    Alta masiva desde el CSV guardado por /api/users/bulk/. Se encola con
+    max_attempts=1 y el archivo (con contraseñas) se borra siempre al terminar.
+    """
+    try:
+        creator = CustomUser.objects.select_related('company').get(pk=user_id)
+        with open(path, encoding='utf-8', newline='') as fh:
+            rows = read_csv(fh)
+        return provision_users(creator, rows, progress=ctx.set_progress)
+    finally:
+        os.unlink(path)
+
+
+@register_job('seed_tenants')
+def seed_tenants(ctx):
+    call_command('seed_tenants')
+    return {'status': 'success'}
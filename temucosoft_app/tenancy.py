@@ -0,0 +1,138 @@
+"""
+Utilidades multi-tenant: alcance de cada modelo por compañía y asignación
+Company -> shard (alias de settings.DATABASES).
+
+Los modelos de control (Subscription, Company, CustomUser, Job) viven en
+settings.CONTROL_DATABASE. El resto de los modelos de la app son "de tenant"
+y se enrutan al shard indicado en Company.shard (ver routers.py).
+"""
+import contextvars
+import copy
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Q
+
+CONTROL_MODELS = {'subscription', 'company', 'customuser', 'job', 'slowquery', 'tenantusage'}
+
+# Alcance por compañía de cada modelo de tenant, en orden padre -> hijo.
+TENANT_SCOPES = (
+    ('product', 'company'),
+    ('productpricehistory', 'company'),
+    ('branch', 'company'),
+    ('branchsequence', 'branch__company'),
+    ('supplier', 'company'),
+    ('inventory', 'branch__company'),
+    ('purchase', 'company'),
+    ('purchaseitem', 'purchase__company'),
+    ('stocktransfer', 'company'),
+    ('stocktransferitem', 'transfer__company'),
+    ('sale', 'company'),
+    ('order', 'company'),
+    ('cartitem', ('sale__company', 'order__company')),
+    ('outboxevent', 'company'),
+    ('outboxsequence', 'company'),
+    ('inventoryvaluationsnapshot', 'company'),
+)
+
+_current_shard = contextvars.ContextVar('temucosoft_current_shard', default=None)
+_shard_cache = {}
+# Segundos que cada proceso recuerda el shard de una compañía.
+SHARD_CACHE_TTL = getattr(settings, 'SHARD_CACHE_TTL', 60)
+
+
+def control_database():
+    return getattr(settings, 'CONTROL_DATABASE', 'default')
+
+
+def tenant_shards():
+    return list(getattr(settings, 'TENANT_SHARDS', [control_database()]))
+
+
+def sharding_enabled():
+    return tenant_shards() != [control_database()]
+
+
+def is_tenant_model(model):
+    return model._meta.app_label == 'temucosoft_app' and model._meta.model_name not in CONTROL_MODELS
+
+
+def tenant_models():
+    """Modelos de tenant con su filtro por compañía, en orden padre -> hijo."""
+    from django.apps import apps
+    app = apps.get_app_config('temucosoft_app')
+    return [(app.get_model(name), scope) for name, scope in TENANT_SCOPES]
+
+
+def tenant_filter(scope, company_id):
+    if isinstance(scope, tuple):
+        q = Q()
+        for path in scope:
+            q |= Q(**{f"{path}_id": company_id})
+        return q
+    return Q(**{f"{scope}_id": company_id})
+
+
+def shard_for_company(company_id):
+    """Alias de BD del shard dueño de `company_id` (cacheado en memoria)."""
+    if company_id is None or not sharding_enabled():
+        return None
+    cached = _shard_cache.get(company_id)
+    if cached is None or cached[1] < time.monotonic():
+        from .models import Company
+        shard = Company.objects.using(control_database()) \
+            .filter(pk=company_id).values_list('shard', flat=True).first()
+        cached = (shard or control_database(), time.monotonic() + SHARD_CACHE_TTL)
+        _shard_cache[company_id] = cached
+    return cached[0]
+
+
+def forget_company_shard(company_id):
+    _shard_cache.pop(company_id, None)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+def tenant_db():
+    """BD de los datos del tenant activo (la de control si no hay shard activo)."""
+    return current_shard() or control_database()
+
+
+def activate_tenant_shard(company_id):
+    """Fija el shard por defecto para las consultas sin pista de instancia."""
+    return _current_shard.set(shard_for_company(company_id))
+
+
+def deactivate_tenant_shard(token):
+    _current_shard.reset(token)
+
+
+@contextmanager
+def use_tenant_shard(company_id):
+    token = activate_tenant_shard(company_id)
+    try:
+        yield
+    finally:
+        deactivate_tenant_shard(token)
+
+
+def mirror_control_rows(shard, company_id, users=None):
+    """
+    Copia al shard las filas de control de una compañía (plan, Company y
+    usuarios) para que las FK de las tablas de tenant sean válidas allí.
+    """
+    from .models import Company, CustomUser
+
+    control = control_database()
+    company = Company.objects.using(control).select_related('plan').get(pk=company_id)
+    if company.plan is not None:
+        company.plan.save(using=shard)
+    company.save(using=shard)
+    if users is None:
+        users = CustomUser.objects.using(control).filter(company_id=company_id)
+    for user in users:
+        # Copia: no cambiar el _state.db de la instancia del llamador.
+        copy.copy(user).save(using=shard)
@@ -0,0 +1,415 @@
+"""
+Exportación e importación completa de un tenant (respaldo / offboarding).
+
+Formato: un tar comprimido con gzip (o zstd si está instalado el paquete
+`zstandard`) que contiene, en este orden:
+- manifest.json: versión, compañía y columnas de cada tabla.
+- company.ndjson y users.ndjson: filas de control (usuarios sin contraseña).
+- <modelo>.ndjson: una por tabla de tenant (TENANT_SCOPES, padre -> hijo).
+- archived/<modelo>.ndjson: filas de Sale, Order y CartItem de meses ya
+  archivados (particiones separadas, ver partitions.py). Al importar
+  vuelven al archivo del shard destino, no a las tablas.
+- rows.json: cantidad de filas por archivo, para verificar la importación.
+
+export_tenant() lee cada tabla con iterator() (cursor del lado del servidor
+en PostgreSQL) y escribe las filas a un archivo temporal antes de
+agregarlo al tar, que en modo stream necesita conocer el tamaño del
+miembro: la memoria usada no depende del tamaño del tenant. En PostgreSQL
+las tablas se leen en una transacción REPEATABLE READ (foto consistente).
+
+import_tenant() recorre el tar en modo stream y carga cada tabla
+conservando las PK: en PostgreSQL con COPY ... FROM STDIN por bloques, en
+otros motores con bulk_create.
+"""
+import io
+import json
+import tarfile
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .cache_versions import bump_tenant_versions
+from .models import Company, CustomUser
+from .partitions import (
+    PARTITIONED_MODELS, ArchiveWriter, PartitionError, archived_company_rows, restore_archived_rows
+)
+from .tenancy import (
+    control_database, mirror_control_rows, shard_for_company, tenant_filter, tenant_models
+)
+from .usage import reconcile_company
+
+ARCHIVE_VERSION = 1
+READ_CHUNK = 2000
+LOAD_CHUNK = 10000
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+COMPRESSIONS = {'gz': '.tar.gz', 'zst': '.tar.zst'}
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Columnas de control que nunca salen del sistema.
+USER_EXCLUDED_COLUMNS = {'password'}
+
+
+class TenantArchiveError(Exception):
+    pass
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise TenantArchiveError("La compresión zstd requiere el paquete zstandard (pip install zstandard).")
+    return zstandard
+
+
+def check_compression(compression):
+    if compression not in COMPRESSIONS:
+        raise TenantArchiveError(f"Compresión desconocida: {compression}")
+    if compression == 'zst':
+        _zstandard()
+
+
+def archive_filename(company_id, compression='gz'):
+    check_compression(compression)
+    return f"tenant-{company_id}-{timezone.localdate():%Y%m%d}{COMPRESSIONS[compression]}"
+
+
+def _json_default(value):
+    # Sin pérdida: DjangoJSONEncoder recorta los microsegundos.
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _columns(model, exclude=()):
+    return [f.attname for f in model._meta.concrete_fields if f.attname not in exclude]
+
+
+# --------------------------------------------------------------------
+# Exportación
+# --------------------------------------------------------------------
+
+@contextmanager
+def _open_for_writing(path, compression):
+    if compression == 'zst':
+        zstandard = _zstandard()
+        with open(path, 'wb') as raw, \
+                zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False) as stream, \
+                tarfile.open(fileobj=stream, mode='w|') as tar:
+            yield tar
+    else:
+        with open(path, 'wb') as raw, tarfile.open(fileobj=raw, mode='w|gz') as tar:
+            yield tar
+
+
+@contextmanager
+def _consistent_snapshot(db):
+    # Dentro de una transacción ya abierta (p. ej. un job atómico) se usa la foto de esa transacción.
+    outer = connections[db].in_atomic_block
+    with transaction.atomic(using=db):
+        if connections[db].vendor == 'postgresql' and not outer:
+            with connections[db].cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
+
+
+def _add_member(tar, name, fh):
+    info = tarfile.TarInfo(name)
+    info.size = fh.tell()
+    info.mtime = int(time.time())
+    fh.seek(0)
+    tar.addfile(info, fh)
+
+
+def _add_json(tar, name, data):
+    fh = io.BytesIO(json.dumps(data, default=_json_default, indent=2).encode('utf-8'))
+    fh.seek(0, io.SEEK_END)
+    _add_member(tar, name, fh)
+
+
+def _add_rows(tar, name, queryset, columns):
+    """Vuelca `queryset` como NDJSON en el tar. Devuelve la cantidad de filas."""
+    rows = (dict(zip(columns, row)) for row in queryset.values_list(*columns).iterator(chunk_size=READ_CHUNK))
+    return _add_dicts(tar, name, rows)
+
+
+def _add_dicts(tar, name, rows):
+    count = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as fh:
+        for row in rows:
+            fh.write(json.dumps(row, default=_json_default, ensure_ascii=False).encode('utf-8'))
+            fh.write(b'\n')
+            count += 1
+        _add_member(tar, name, fh)
+    return count
+
+
+def export_tenant(company_id, path, compression='gz', progress=None):
+    """Escribe el respaldo de la compañía en `path`. Devuelve {archivo: filas}."""
+    control = control_database()
+    try:
+        company = Company.objects.using(control).get(pk=company_id)
+    except Company.DoesNotExist:
+        raise TenantArchiveError(f"No existe la compañía {company_id}.")
+    db = shard_for_company(company_id) or control
+    models = tenant_models()
+    user_columns = _columns(CustomUser, exclude=USER_EXCLUDED_COLUMNS)
+
+    manifest = {
+        'version': ARCHIVE_VERSION,
+        'company': company.pk,
+        'company_name': company.name,
+        'exported_at': timezone.now(),
+        'files': [{'file': 'company.ndjson', 'model': 'company', 'columns': _columns(Company)},
+                  {'file': 'users.ndjson', 'model': 'customuser', 'columns': user_columns}],
+    }
+    manifest['files'] += [
+        {'file': f"{model._meta.model_name}.ndjson", 'model': model._meta.model_name, 'columns': _columns(model)}
+        for model, _ in models
+    ]
+    manifest['files'] += [
+        {'file': f"archived/{model._meta.model_name}.ndjson", 'model': model._meta.model_name,
+         'columns': _columns(model), 'archived': True}
+        for model in PARTITIONED_MODELS
+    ]
+
+    rows = {}
+    with _open_for_writing(path, compression) as tar:
+        _add_json(tar, 'manifest.json', manifest)
+        rows['company.ndjson'] = _add_rows(
+            tar, 'company.ndjson', Company.objects.using(control).filter(pk=company.pk), manifest['files'][0]['columns'])
+        rows['users.ndjson'] = _add_rows(
+            tar, 'users.ndjson', CustomUser.objects.using(control).filter(company_id=company.pk).order_by('pk'),
+            user_columns)
+
+        with _consistent_snapshot(db):
+            for i, (model, scope) in enumerate(models, start=1):
+                name = f"{model._meta.model_name}.ndjson"
+                queryset = model.objects.using(db).filter(tenant_filter(scope, company.pk)).order_by('pk')
+                rows[name] = _add_rows(tar, name, queryset, _columns(model))
+                if progress:
+                    progress(i, len(models), f"{model.__name__}: {rows[name]} filas")
+
+        for model in PARTITIONED_MODELS:
+            name = f"archived/{model._meta.model_name}.ndjson"
+            rows[name] = _add_dicts(tar, name, archived_company_rows(model, company.pk, using=db))
+            if progress and rows[name]:
+                progress(len(models), len(models), f"{model.__name__} (archivadas): {rows[name]} filas")
+
+        _add_json(tar, 'rows.json', rows)
+    return rows
+
+
+# --------------------------------------------------------------------
+# Importación
+# --------------------------------------------------------------------
+
+@contextmanager
+def _open_for_reading(path):
+    with open(path, 'rb') as raw:
+        is_zstd = raw.read(4) == ZSTD_MAGIC
+        raw.seek(0)
+        if is_zstd:
+            with _zstandard().ZstdDecompressor().stream_reader(raw) as stream, \
+                    tarfile.open(fileobj=stream, mode='r|') as tar:
+                yield tar
+        else:
+            with tarfile.open(fileobj=raw, mode='r|gz') as tar:
+                yield tar
+
+
+def _read_rows(tar, member):
+    for line in tar.extractfile(member):
+        if line.strip():
+            yield json.loads(line)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _copy_value(value):
+    """Valor en el formato de texto de COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_chunk(connection, model, columns, chunk):
+    qn = connection.ops.quote_name
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+    sql = "COPY {} ({}) FROM STDIN".format(
+        qn(model._meta.db_table), ', '.join(qn(fields[c].column) for c in columns))
+    buffer = io.StringIO()
+    for row in chunk:
+        buffer.write('\t'.join(_copy_value(row.get(c)) for c in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    # wrap_database_errors: los errores del driver llegan como IntegrityError de Django.
+    with connection.cursor() as cursor, connection.wrap_database_errors:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):      # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:                                # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _bulk_create_chunk(db, model, columns, chunk):
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+    model.objects.using(db).bulk_create([
+        model(**{c: fields[c].to_python(row.get(c)) for c in columns}) for row in chunk
+    ])
+
+
+def _load_table(db, model, columns, rows, company_id):
+    """Carga las filas en bloques de LOAD_CHUNK. Devuelve la cantidad cargada."""
+    known = {f.attname for f in model._meta.concrete_fields}
+    columns = [c for c in columns if c in known]
+    connection = connections[db]
+    loaded = 0
+    for chunk in _chunks(rows, LOAD_CHUNK):
+        if 'company_id' in columns:
+            for row in chunk:
+                row['company_id'] = company_id
+        if connection.vendor == 'postgresql':
+            _copy_chunk(connection, model, columns, chunk)
+        else:
+            _bulk_create_chunk(db, model, columns, chunk)
+        loaded += len(chunk)
+    return loaded
+
+
+def _ensure_users(rows, company_id):
+    """
+    Crea (sin contraseña utilizable) los usuarios del respaldo que no existan.
+    Un usuario con la misma PK en otra compañía o un username ya tomado es un conflicto.
+    """
+    control = control_database()
+    created = 0
+    for chunk in _chunks(rows, LOAD_CHUNK):
+        existing = dict(CustomUser.objects.using(control).filter(pk__in=[r['id'] for r in chunk])
+                        .values_list('pk', 'company_id'))
+        users = []
+        for row in chunk:
+            if row['id'] in existing:
+                if existing[row['id']] != company_id:
+                    raise TenantArchiveError(f"El usuario {row['id']} ({row['username']}) ya existe en otra compañía.")
+                continue
+            row['company_id'] = company_id
+            user = CustomUser(**{k: v for k, v in row.items() if k not in USER_EXCLUDED_COLUMNS})
+            user.set_unusable_password()
+            users.append(user)
+        try:
+            with transaction.atomic(using=control):
+                CustomUser.objects.using(control).bulk_create(users)
+        except IntegrityError as e:
+            raise TenantArchiveError(f"Conflicto al crear usuarios (¿username ya existente?): {e}")
+        created += len(users)
+    return created
+
+
+def import_tenant(path, company_id=None, progress=None):
+    """
+    Carga un respaldo de export_tenant() en la compañía `company_id` (por
+    defecto la del respaldo), que debe existir. Las PK se conservan: falla
+    si ya existen en el destino. Devuelve {archivo: filas}.
+    """
+    control = control_database()
+    loaded = {}
+    with _open_for_reading(path) as tar:
+        member = tar.next()
+        if member is None or member.name != 'manifest.json':
+            raise TenantArchiveError("El archivo no es un respaldo de tenant (falta manifest.json).")
+        manifest = json.load(tar.extractfile(member))
+        if manifest.get('version') != ARCHIVE_VERSION:
+            raise TenantArchiveError(f"Versión de respaldo no soportada: {manifest.get('version')}")
+
+        company_id = company_id or manifest['company']
+        if not Company.objects.using(control).filter(pk=company_id).exists():
+            raise TenantArchiveError(f"No existe la compañía {company_id}; créela antes de importar.")
+        db = shard_for_company(company_id) or control
+        if db != control:
+            mirror_control_rows(db, company_id)
+        files = {f['file']: f for f in manifest['files']}
+        models = {model._meta.model_name: model for model, _ in tenant_models()}
+
+        # Los meses archivados se escriben al confirmar la carga (ver ArchiveWriter).
+        writers = {model: ArchiveWriter(model, tag=f"{db}.import{timezone.now():%Y%m%d%H%M%S}")
+                   for model in PARTITIONED_MODELS}
+        try:
+            # Los usuarios (control) se crean en su propia transacción anidada: si falla la
+            # carga del shard se deshacen también. Control confirma primero; si luego fallara
+            # el COMMIT del shard, reimportar omite los usuarios ya creados de la compañía.
+            with transaction.atomic(using=db), transaction.atomic(using=control):
+                for writer in writers.values():
+                    transaction.on_commit(writer.commit, using=db)
+                _load_members(tar, db, company_id, files, models, writers, loaded, progress)
+        except Exception:
+            for writer in writers.values():
+                writer.discard()
+            raise
+    # COPY/bulk_create no emiten señales: contadores de uso desde un conteo real
+    # y caches invalidados a mano.
+    reconcile_company(company_id)
+    bump_tenant_versions(company_id)
+    return loaded
+
+
+def _load_members(tar, db, company_id, files, models, writers, loaded, progress):
+    """Carga los miembros del tar (después del manifest) en `db`, dentro de la transacción de import_tenant()."""
+    control = control_database()
+    expected = None
+    for i, member in enumerate(tar, start=1):
+        if member.name == 'rows.json':
+            expected = json.load(tar.extractfile(member))
+            continue
+        spec = files.get(member.name)
+        if spec is None or spec['model'] == 'company':
+            continue
+        rows = _read_rows(tar, member)
+        if spec.get('archived'):
+            writer = writers[models[spec['model']]]
+            try:
+                loaded[member.name] = restore_archived_rows(writer, rows, company_id)
+            except PartitionError as e:
+                raise TenantArchiveError(str(e))
+            continue
+        if spec['model'] == 'customuser':
+            loaded[member.name] = _ensure_users(rows, company_id)
+            if db != control:
+                mirror_control_rows(db, company_id)
+            continue
+        model = models.get(spec['model'])
+        if model is None:
+            raise TenantArchiveError(f"Modelo desconocido en el respaldo: {spec['model']}")
+        try:
+            loaded[member.name] = _load_table(db, model, spec['columns'], rows, company_id)
+        except IntegrityError as e:
+            raise TenantArchiveError(f"Conflicto al cargar {model.__name__} (¿PK ya existentes?): {e}")
+        if progress:
+            progress(i, len(files), f"{model.__name__}: {loaded[member.name]} filas")
+
+    if expected is not None:
+        for name, count in expected.items():
+            if name in loaded and name != 'users.ndjson' and loaded[name] != count:
+                raise TenantArchiveError(f"{name}: se esperaban {count} filas y se cargaron {loaded[name]}.")
+
+    connection = connections[db]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), list(models.values())):
+            cursor.execute(sql)
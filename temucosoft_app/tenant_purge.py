@@ -0,0 +1,118 @@
+"""
+Eliminación por lotes de todos los datos de un tenant.
+
+Company.delete() arma el árbol completo de CASCADE en memoria y lo borra
+en una sola transacción (y falla por los PROTECT de Sale/Purchase hacia
+Branch). purge_tenant() en cambio recorre las tablas de tenant de hijo a
+padre (TENANT_SCOPES invertido) y en cada una repite
+
+    DELETE FROM tabla WHERE id IN (SELECT id ... WHERE <compañía> LIMIT n)
+
+en su propia transacción corta, con una pausa entre lotes. Al final borra
+los usuarios, los trabajos y la Company con el ORM (ya quedan pocas filas).
+
+Es reanudable: lo ya borrado no se vuelve a leer, así que repetir la
+purga (reintento del trabajo, o volver a correr el comando) continúa
+donde quedó. La compañía se desactiva antes de empezar.
+"""
+import logging
+import time
+
+from django.db import connections, transaction
+
+from .cache_versions import bump_tenant_versions, bump_version
+from .models import Company, CustomUser, Job
+from .tenancy import (
+    control_database, forget_company_shard, shard_for_company, tenant_filter, tenant_models
+)
+from .throttling import forget_company_plan
+from .usage import reconcile_company
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 1000
+PURGE_PAUSE = 0.05
+# Lotes entre reportes de progreso dentro de una misma tabla.
+PROGRESS_EVERY = 10
+
+
+def delete_batch(queryset, batch_size):
+    """Un DELETE ... WHERE pk IN (subconsulta LIMIT n). Devuelve las filas borradas."""
+    model = queryset.model
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    table, pk = qn(model._meta.db_table), qn(model._meta.pk.column)
+
+    subquery, params = queryset.order_by().values('pk')[:batch_size].query.sql_with_params()
+    if connection.vendor == 'mysql':
+        # MySQL no admite LIMIT dentro de IN (...): se envuelve en una tabla derivada.
+        subquery = f"SELECT * FROM ({subquery}) AS purge_batch"
+
+    with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({subquery})", params)
+        return cursor.rowcount
+
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE, on_batch=None):
+    """Borra `queryset` por lotes hasta vaciarlo. Devuelve el total borrado."""
+    total = batches = 0
+    while True:
+        deleted = delete_batch(queryset, batch_size)
+        total += deleted
+        batches += 1
+        if deleted < batch_size:
+            return total
+        if on_batch and batches % PROGRESS_EVERY == 0:
+            on_batch(total)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_tenant(company_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE, progress=None, keep_company=False):
+    """
+    Elimina todos los datos de la compañía. Con keep_company=True conserva
+    la fila Company (desactivada) y sus usuarios. Devuelve {modelo: filas}.
+    """
+    control = control_database()
+    try:
+        company = Company.objects.using(control).get(pk=company_id)
+    except Company.DoesNotExist:
+        return {}
+    db = shard_for_company(company_id) or control
+    if company.is_active:
+        Company.objects.using(control).filter(pk=company_id).update(is_active=False)
+        forget_company_plan(company_id)
+        # update() no emite post_save: el catálogo público debe ocultarla ya.
+        bump_version('catalog', company_id)
+
+    models = list(reversed(tenant_models()))
+    steps = len(models) + (0 if keep_company else 1)
+    deleted = {}
+    for i, (model, scope) in enumerate(models, start=1):
+        name = model.__name__
+        queryset = model.objects.using(db).filter(tenant_filter(scope, company_id))
+        report = (lambda total: progress(i - 1, steps, f"{name}: {total} filas")) if progress else None
+        deleted[name] = delete_in_batches(queryset, batch_size, pause, on_batch=report)
+        if progress:
+            progress(i, steps, f"{name}: {deleted[name]} filas")
+
+    if keep_company:
+        reconcile_company(company_id)
+    else:
+        deleted['Job'] = delete_in_batches(Job.objects.using(control).filter(company_id=company_id),
+                                           batch_size, pause)
+        deleted['CustomUser'] = CustomUser.objects.using(control).filter(company_id=company_id).count()
+        for alias in {db, control}:
+            # En un shard quedan las copias de control (ver tenancy.mirror_control_rows).
+            with transaction.atomic(using=alias):
+                CustomUser.objects.using(alias).filter(company_id=company_id).delete()
+                Company.objects.using(alias).filter(pk=company_id).delete()
+        forget_company_shard(company_id)
+        forget_company_plan(company_id)
+        if progress:
+            progress(steps, steps, f"Compañía {company.name} eliminada")
+
+    # Los DELETE por lotes no emiten señales.
+    bump_tenant_versions(company_id)
+    logger.info(f"Purga de la compañía {company_id}: {sum(deleted.values())} filas")
+    return deleted
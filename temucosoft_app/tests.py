@@ -1,3 +1,1281 @@
-from django.test import TestCase
+"""
+Pruebas de la app. Usan la BD de control y dos shards SQLite:
 
-# Create your tests here.
+    python manage.py test --settings=temucosoft_drf.test_settings
+"""
+import json
+import shutil
+import tarfile
+import tempfile
+import threading
+from pathlib import Path
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connections, router
+from django.core.exceptions import PermissionDenied
+from django.contrib import admin as django_admin
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    Branch, CartItem, Company, CustomUser, Inventory, Job, OutboxEvent, Product, ProductPriceHistory, Purchase, PurchaseItem,
+    Sale, Supplier, TenantUsage,
+)
+from . import admin, forecasting, inventory, jobs, partitions, renderers, tenancy, throttling, warmup
+from .inventory import reconcile_cycle_count
+from .outbox import Dispatcher
+from .profiling import is_profiling_allowed
+from .provisioning import ProvisioningError, provision_users, read_csv, validate_rows
+from .cache_versions import TENANT_NAMESPACES, get_version
+from .tenant_archive import TenantArchiveError, archive_filename, export_tenant, import_tenant
+from .tenant_purge import purge_tenant
+from .usage import reconcile_all
+from .receipts import ReceiptAllocator, allocator, next_receipt_number
+from . import realtime, slowqueries
+from .tenancy import mirror_control_rows, tenant_filter, tenant_models, use_tenant_shard
+
+ALL_DATABASES = {'default', 'shard_a', 'shard_b'}
+
+
+def reset_throttles():
+    """Vacía los buckets por compañía y el cache: los pk se repiten entre pruebas y heredarían el consumo."""
+    throttling._buckets.clear()
+    throttling._plan_cache.clear()
+    throttling._running_reports.clear()
+    cache.clear()
+
+
+def create_tenant(rut, name, shard):
+    """Compañía en `shard` con un usuario, una sucursal, un producto con stock y una venta."""
+    company = Company.objects.create(rut=rut, name=name, shard=shard)
+    user = CustomUser.objects.create(username=f"gerente_{name}", role='gerente', company=company)
+    # Como en una petición (TenantShardMiddleware): Manager.create() no da pista de instancia.
+    with use_tenant_shard(company.pk):
+        branch = Branch.objects.create(company=company, name=f"Casa matriz {name}", address='Temuco')
+        product = Product.objects.create(company=company, sku=f"SKU-{name}", name=f"Producto {name}",
+                                         price=1000, cost=600, category='General')
+        Inventory.objects.create(branch=branch, product=product, stock=10)
+        Sale.objects.create(company=company, branch=branch, user=user, total=1000, payment_method='efectivo')
+    return company
+
+
+# ====================================================================
+# SHARDING POR TENANT (routers.py, tenancy.py, move_tenant)
+# ====================================================================
+
+class TenantShardRouterTests(TestCase):
+    databases = ALL_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company_a = create_tenant('11111111-1', 'A', 'shard_a')
+        cls.company_b = create_tenant('22222222-2', 'B', 'shard_b')
+
+    def test_tenant_rows_are_written_to_the_company_shard(self):
+        for model in (Product, Sale, Branch, Inventory):
+            scope = dict((m, s) for m, s in tenant_models())[model]
+            rows_a = model.objects.using('shard_a').filter(tenant_filter(scope, self.company_a.pk))
+            rows_b = model.objects.using('shard_b').filter(tenant_filter(scope, self.company_a.pk))
+            self.assertEqual(rows_a.count(), 1, model.__name__)
+            self.assertFalse(rows_b.exists(), model.__name__)
+            self.assertFalse(model.objects.using('default').exists(), model.__name__)
+
+    def test_new_instances_are_routed_by_company(self):
+        product = Product(company=self.company_a, sku='NEW-A', name='Nuevo', price=1, cost=1, category='c')
+        self.assertEqual(router.db_for_write(Product, instance=product), 'shard_a')
+        sale = Sale(company_id=self.company_b.pk)
+        self.assertEqual(router.db_for_write(Sale, instance=sale), 'shard_b')
+
+    def test_reads_follow_the_active_tenant_shard(self):
+        with use_tenant_shard(self.company_a.pk):
+            self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['SKU-A'])
+            self.assertEqual(Sale.objects.count(), 1)
+        with use_tenant_shard(self.company_b.pk):
+            self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['SKU-B'])
+
+    def test_control_models_stay_in_the_control_database(self):
+        user = CustomUser.objects.get(username='gerente_A')
+        for model, instance in ((Company, self.company_a), (CustomUser, user), (Job, None), (TenantUsage, None)):
+            self.assertEqual(router.db_for_write(model, instance=instance), 'default', model.__name__)
+            self.assertEqual(router.db_for_read(model), 'default', model.__name__)
+        with use_tenant_shard(self.company_a.pk):
+            self.assertEqual(router.db_for_read(Company), 'default')
+        self.assertEqual(Company.objects.using('default').count(), 2)
+        self.assertEqual(CustomUser.objects.using('default').count(), 2)
+        # Los shards solo guardan la copia espejo de su propia compañía.
+        self.assertEqual(list(Company.objects.using('shard_a').values_list('pk', flat=True)), [self.company_a.pk])
+
+
+class MoveTenantTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        # Los contadores de uso de filas del shard se aplican al confirmar (on_commit).
+        with self.captureOnCommitCallbacks(using='shard_a', execute=True):
+            self.company = create_tenant('11111111-1', 'A', 'shard_a')
+
+    def test_move_tenant_copies_everything_and_leaves_no_rows_in_source(self):
+        expected = {
+            model: model.objects.using('shard_a').filter(tenant_filter(scope, self.company.pk)).count()
+            for model, scope in tenant_models()
+        }
+        with self.captureOnCommitCallbacks(using='shard_a', execute=True), \
+                self.captureOnCommitCallbacks(using='shard_b', execute=True):
+            call_command('move_tenant', self.company.pk, 'shard_b', stdout=StringIO())
+
+        for model, scope in tenant_models():
+            in_source = model.objects.using('shard_a').filter(tenant_filter(scope, self.company.pk))
+            in_target = model.objects.using('shard_b').filter(tenant_filter(scope, self.company.pk))
+            self.assertFalse(in_source.exists(), model.__name__)
+            self.assertEqual(in_target.count(), expected[model], model.__name__)
+
+        self.assertEqual(Company.objects.using('default').get(pk=self.company.pk).shard, 'shard_b')
+        with use_tenant_shard(self.company.pk):
+            self.assertEqual(Product.objects.get(company=self.company).sku, 'SKU-A')
+        # Borrar el origen no descuenta del uso lo que se copió al destino.
+        usage = TenantUsage.objects.get(company=self.company)
+        self.assertEqual((usage.users, usage.products, usage.branches), (1, 1, 1))
+
+    def test_move_tenant_aborts_on_primary_key_collision(self):
+        other = Company.objects.create(rut='22222222-2', name='B', shard='shard_b')
+        product = Product.objects.using('shard_a').get(company=self.company)
+        Product.objects.using('shard_b').create(pk=product.pk, company=other, sku='SKU-B', name='B',
+                                                price=1, cost=1, category='c')
+
+        with self.assertRaises(CommandError):
+            call_command('move_tenant', self.company.pk, 'shard_b', stdout=StringIO())
+        self.assertEqual(Company.objects.get(pk=self.company.pk).shard, 'shard_a')
+        self.assertTrue(Product.objects.using('shard_a').filter(pk=product.pk).exists())
+
+    def test_reconcile_usage_ignores_copies_left_in_the_source_shard(self):
+        # Lo que deja un move_tenant --keep-source: filas del tenant en un shard que no es el suyo.
+        # shard_b se recorre después de shard_a, su conteo no debe pisar el del dueño.
+        mirror_control_rows('shard_b', self.company.pk)
+        Product.objects.using('shard_b').create(company_id=self.company.pk, sku='SKU-OLD', name='Copia',
+                                                price=1, cost=1, category='c')
+        with use_tenant_shard(self.company.pk):
+            Product.objects.create(company=self.company, sku='SKU-A2', name='A2', price=1, cost=1, category='c')
+        TenantUsage.objects.filter(company=self.company).update(products=0, branches=0)
+
+        reconcile_all()
+        usage = TenantUsage.objects.get(company=self.company)
+        self.assertEqual((usage.users, usage.products, usage.branches), (1, 2, 1))
+
+
+# ====================================================================
+# OUTBOX Y FEED DE EVENTOS (outbox.py, /api/events/)
+# ====================================================================
+
+class EventFeedTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+        self.dispatcher = Dispatcher(sinks=[])
+
+    def record(self, **kwargs):
+        return OutboxEvent.objects.using('shard_a').create(
+            company=self.company, event_type='sale.created', aggregate_id=1, **kwargs
+        )
+
+    def feed(self, after):
+        response = self.client.get('/api/events/', {'after': after})
+        self.assertEqual(response.status_code, 200)
+        return [event['id'] for event in response.json()]
+
+    def test_events_appear_once_sequenced(self):
+        first, second = self.record(), self.record()
+        self.assertEqual(self.feed(0), [])
+        self.assertEqual(self.dispatcher.run_once(), (2, 0))
+        self.assertEqual(self.feed(0), [first.pk, second.pk])
+
+    def test_event_committed_late_with_lower_id_is_not_skipped(self):
+        # La venta con el id mayor confirma primero y el consumidor avanza su cursor.
+        later = self.record(pk=11)
+        self.dispatcher.run_once()
+        response = self.client.get('/api/events/', {'after': 0}).json()
+        self.assertEqual([e['id'] for e in response], [later.pk])
+        cursor = response[-1]['seq']
+
+        # Confirma la venta que había tomado el id 10 antes.
+        earlier = self.record(pk=10)
+        self.dispatcher.run_once()
+        self.assertEqual(self.feed(cursor), [earlier.pk])
+
+    def test_sequence_keeps_growing_after_purging_every_event(self):
+        self.record(), self.record()
+        self.dispatcher.run_once()
+        cursor = self.client.get('/api/events/', {'after': 0}).json()[-1]['seq']
+
+        OutboxEvent.objects.using('shard_a').update(created_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(self.dispatcher.purge(7), 2)  # Sin sinks: se purgan los ya numerados.
+
+        new = self.record()
+        self.dispatcher.run_once()
+        self.assertEqual(self.feed(cursor), [new.pk])
+
+    def test_moved_tenant_keeps_its_numbering_next_to_other_tenants(self):
+        other = Company.objects.create(rut='22222222-2', name='B', shard='shard_b')
+        mirror_control_rows('shard_b', other.pk)
+        OutboxEvent.objects.using('shard_b').create(pk=1000, company=other, event_type='sale.created',
+                                                    aggregate_id=1)
+        self.record(), self.record()
+        self.dispatcher.run_once()
+        cursor = self.client.get('/api/events/', {'after': 0}).json()[-1]['seq']
+
+        with self.captureOnCommitCallbacks(using='shard_a', execute=True):
+            call_command('move_tenant', self.company.pk, 'shard_b', stdout=StringIO())
+        new = OutboxEvent.objects.using('shard_b').create(company=self.company, event_type='sale.created',
+                                                          aggregate_id=2)
+        self.dispatcher.run_once()
+        self.assertEqual(self.feed(cursor), [new.pk])
+        seqs = OutboxEvent.objects.using('shard_b').filter(company=other).values_list('feed_seq', flat=True)
+        self.assertEqual(list(seqs), [1])
+
+
+# ====================================================================
+# CONTEO CÍCLICO (inventory.reconcile_cycle_count)
+# ====================================================================
+
+class CycleCountTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.branch = Branch.objects.using('shard_a').get(company=self.company)
+        self.product = Product.objects.using('shard_a').get(company=self.company)
+        self.inventory = Inventory.objects.using('shard_a').get(branch=self.branch, product=self.product)
+
+    def new_product(self, sku):
+        return Product.objects.using('shard_a').create(company=self.company, sku=sku, name=sku,
+                                                       price=1, cost=1, category='c')
+
+    def concurrent_sale(self, quantity=1):
+        """Otro proceso descuenta stock (y sube la versión) justo antes del primer UPDATE."""
+        real = inventory._cas_bulk_update
+        calls = []
+
+        def cas(rows, using):
+            if not calls:
+                Inventory.objects.using(using).filter(pk=self.inventory.pk) \
+                    .update(stock=self.inventory.stock - quantity, version=self.inventory.version + 1)
+            calls.append(rows)
+            return real(rows, using)
+
+        return mock.patch.object(inventory, '_cas_bulk_update', side_effect=cas), calls
+
+    def test_count_without_version_is_retried_after_a_race(self):
+        patch, calls = self.concurrent_sale()
+        with patch:
+            result = reconcile_cycle_count(self.branch, [{'product': self.product.pk, 'stock': 7}])
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((result['updated'], result['conflicts']), (1, []))
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.version), (7, 2))
+
+    def test_count_with_stale_version_is_reported_as_conflict(self):
+        patch, calls = self.concurrent_sale()
+        with patch:
+            result = reconcile_cycle_count(
+                self.branch, [{'product': self.product.pk, 'stock': 7, 'version': 0}],
+            )
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(result['updated'], 0)
+        self.assertEqual(result['conflicts'], [{'product': self.product.pk, 'stock': 9, 'version': 1}])
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.stock, 9)
+
+    def test_rows_created_concurrently_are_updated_not_counted_as_created(self):
+        new, raced = self.new_product('NEW-1'), self.new_product('NEW-2')
+        real = inventory._insert_missing
+
+        def insert(branch_id, stocks, using):
+            Inventory.objects.using(using).create(branch=self.branch, product=raced, stock=3)
+            return real(branch_id, stocks, using)
+
+        with mock.patch.object(inventory, '_insert_missing', side_effect=insert):
+            result = reconcile_cycle_count(self.branch, [
+                {'product': new.pk, 'stock': 4},
+                {'product': raced.pk, 'stock': 5},
+            ])
+
+        self.assertEqual((result['created'], result['updated'], result['conflicts']), (1, 1, []))
+        stocks = dict(Inventory.objects.using('shard_a').filter(product__in=[new, raced])
+                      .values_list('product_id', 'stock'))
+        self.assertEqual(stocks, {new.pk: 4, raced.pk: 5})
+
+
+class AdjustStockTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.inventory = Inventory.objects.using('shard_a').get(branch__company=company)
+        # Otro proceso vende 1 después de que leímos la fila (stock 10, versión 0).
+        Inventory.objects.using('shard_a').filter(pk=self.inventory.pk).update(stock=9, version=1)
+
+    def test_delta_is_retried_on_top_of_the_concurrent_change(self):
+        self.assertEqual(inventory.adjust_stock(self.inventory, delta=-2), (7, 2))
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.version), (7, 2))
+
+    def test_stale_expected_version_is_a_conflict(self):
+        # El cliente vio la versión 0: el UPDATE falla y no se reintenta sobre la 1.
+        with self.assertRaises(inventory.StockConflict) as ctx:
+            inventory.adjust_stock(self.inventory, stock=20, expected_version=0)
+        self.assertEqual(ctx.exception.current, {'stock': 9, 'version': 1})
+        # Releída la fila, la versión que vio el cliente coincide.
+        self.inventory.refresh_from_db()
+        self.assertEqual(inventory.adjust_stock(self.inventory, stock=20, expected_version=1), (20, 2))
+
+    def test_delta_never_leaves_negative_stock(self):
+        with self.assertRaises(inventory.InsufficientStock):
+            inventory.adjust_stock(self.inventory, delta=-10)
+        self.inventory.refresh_from_db()
+        self.assertEqual(self.inventory.stock, 9)
+
+    def test_gives_up_after_max_retries(self):
+        with mock.patch('django.db.models.query.QuerySet.update', return_value=0):
+            with self.assertRaises(inventory.StockConflict):
+                inventory.adjust_stock(self.inventory, delta=1, max_retries=3)
+
+
+# ====================================================================
+# REPORTES (reports.py, /api/reports/)
+# ====================================================================
+
+class ValuationReportTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        reset_throttles()
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+
+    def test_valuation_by_branch(self):
+        branch = Branch.objects.using('shard_a').get(company=self.company)
+        response = self.client.get('/api/reports/valuation/', {'branch': branch.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totals']['units'], 10)
+
+    def test_non_numeric_branch_is_rejected(self):
+        for url in ('/api/reports/valuation/', '/api/reports/valuation/history/'):
+            response = self.client.get(url, {'branch': 'abc'})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('branch', response.json())
+
+    def test_impossible_or_malformed_dates_are_rejected(self):
+        cases = [
+            ('/api/reports/valuation/', 'date', '2024-02-30'),
+            ('/api/reports/valuation/history/', 'date_from', '2024-02-30'),
+            ('/api/reports/valuation/history/', 'date_from', 'abc'),
+            ('/api/reports/valuation/history/', 'date_to', '2024-13-01'),
+        ]
+        for url, name, value in cases:
+            response = self.client.get(url, {name: value})
+            self.assertEqual(response.status_code, 400, (url, name, value))
+            self.assertIn(name, response.json())
+
+    def test_sales_and_margin_reject_invalid_bounds(self):
+        for url in ('/api/reports/sales/', '/api/reports/margin/'):
+            for name, value in (('date_from', '2024-02-30'), ('date_from', 'abc'), ('date_to', '2024-02-30T10:00')):
+                response = self.client.get(url, {name: value})
+                self.assertEqual(response.status_code, 400, (url, name, value))
+                self.assertIn(name, response.json())
+        response = self.client.get('/api/reports/margin/', {'date_from': '2024-02-01', 'date_to': '2024-02-29T23:00'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_empty_date_reads_current_inventory(self):
+        response = self.client.get('/api/reports/valuation/', {'date': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['totals']['units'], 10)
+
+
+class SupplierReportTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        reset_throttles()
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        user = CustomUser.objects.get(username='gerente_A')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        with use_tenant_shard(self.company.pk):
+            branch = Branch.objects.get(company=self.company)
+            self.product = Product.objects.get(company=self.company)
+            self.big = Supplier.objects.create(company=self.company, name='Distribuidora Sur', rut='76086428-5')
+            self.small = Supplier.objects.create(company=self.company, name='Almacén Norte', rut='96790240-3')
+            for supplier, day, quantity, unit_cost in (
+                (self.big, date(2024, 1, 10), 10, 100),
+                (self.big, date(2024, 2, 10), 10, 120),
+                (self.big, date(2024, 3, 10), 10, 150),
+                (self.small, date(2024, 2, 15), 5, 110),
+                (self.small, date(2024, 2, 20), 5, 90),
+            ):
+                purchase = Purchase.objects.create(company=self.company, supplier=supplier, branch=branch,
+                                                   user=user, date=day)
+                PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=quantity,
+                                            unit_cost=unit_cost)
+
+    def get(self, **params):
+        response = self.client.get('/api/reports/suppliers/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_suppliers_ranked_by_spend_with_purchase_frequency(self):
+        report = self.get()
+        rows = [(r['supplier_name'], r['spend_rank'], r['purchases'], Decimal(r['spend']), r['avg_days_between'])
+                for r in report['suppliers']]
+        self.assertEqual(rows, [
+            ('Distribuidora Sur', 1, 3, Decimal('3700'), 30.0),   # 10-ene a 10-mar: 60 días
+            ('Almacén Norte', 2, 2, Decimal('1000'), 5.0),
+        ])
+        self.assertEqual(Decimal(report['totals']['spend']), Decimal('4700'))
+        self.assertEqual(report['suppliers'][0]['spend_share_pct'], 78.72)
+
+    def test_cost_trend_compares_with_previous_and_first_month(self):
+        trend = [(r['month'][:7], Decimal(r['avg_unit_cost']), r['change_pct'], r['change_since_first_pct'])
+                 for r in self.get()['cost_trend']]
+        self.assertEqual(trend, [
+            ('2024-01', Decimal('100'), None, 0),
+            ('2024-02', Decimal('110'), 10, 10),      # (1200 + 550 + 450) / 20
+            ('2024-03', Decimal('150'), 36.36, 50),
+        ])
+
+    def test_cost_variance_per_supplier_and_product(self):
+        variance = {r['supplier_name']: r for r in self.get()['cost_variance']}
+        small = variance['Almacén Norte']
+        self.assertEqual((small['lines'], Decimal(small['min_unit_cost']), Decimal(small['max_unit_cost'])),
+                         (2, Decimal('90'), Decimal('110')))
+        self.assertEqual(Decimal(small['stddev_unit_cost']), Decimal('10'))
+        self.assertEqual(small['cv_pct'], 10)
+        self.assertAlmostEqual(float(variance['Distribuidora Sur']['stddev_unit_cost']), 20.5480, places=3)
+
+    def test_filters_narrow_the_report(self):
+        report = self.get(date_from='2024-02-01', date_to='2024-02-29', supplier=self.big.pk)
+        self.assertEqual([(r['supplier_name'], r['purchases']) for r in report['suppliers']],
+                         [('Distribuidora Sur', 1)])
+        self.assertEqual(report['cost_variance'], [])
+
+    def test_invalid_dates_are_rejected(self):
+        for name, value in (('date_from', '2024-02-30'), ('date_to', 'abc')):
+            response = self.client.get('/api/reports/suppliers/', {name: value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn(name, response.json())
+
+
+class ArchivedMonthsTests(TestCase):
+    """Lectura de meses archivados (partitions.ArchiveWriter / archived_company_rows) en los reportes."""
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        reset_throttles()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(partitions, 'ARCHIVE_DIR', Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+        with use_tenant_shard(self.company.pk):
+            self.branch = Branch.objects.get(company=self.company)
+            self.product = Product.objects.get(company=self.company)
+            self.user_id = Sale.objects.get(company=self.company).user_id
+        # Marzo 2020 archivado desde dos shards: una venta propia y una de otra compañía.
+        month = date(2020, 3, 1)
+        sale = {'id': 9001, 'company_id': self.company.pk, 'branch_id': self.branch.pk, 'user_id': self.user_id,
+                'total': '500.00', 'payment_method': 'efectivo', 'receipt_number': None,
+                'created_at': '2020-03-05T12:00:00+00:00'}
+        foreign = dict(sale, id=9002, company_id=self.company.pk + 100)
+        item = {'id': 9101, 'sale_id': 9001, 'order_id': None, 'product_id': self.product.pk, 'quantity': 2,
+                'price': '250.00', 'created_at': '2020-03-05T12:00:00+00:00'}
+        for tag, sales, items in (('shard_a', [sale], [item]), ('shard_b', [foreign], [dict(item, id=9102, sale_id=9002)])):
+            for model, rows in ((Sale, sales), (CartItem, items)):
+                writer = partitions.ArchiveWriter(model, tag=tag)
+                writer.write(month, rows)
+                writer.commit()
+
+    def test_archived_rows_are_filtered_by_company(self):
+        self.assertEqual([r['id'] for r in partitions.archived_company_rows(Sale, self.company.pk)], [9001])
+        with use_tenant_shard(self.company.pk):
+            items = list(partitions.archived_company_rows(CartItem, self.company.pk))
+        self.assertEqual([r['id'] for r in items], [9101])
+
+    def test_sales_and_margin_reports_include_archived_months(self):
+        params = {'date_from': '2020-03-01', 'date_to': '2020-03-31'}
+        sales = self.client.get('/api/reports/sales/', params).json()
+        self.assertEqual([Decimal(r['total']) for r in sales], [Decimal('500')])
+
+        margin = self.client.get('/api/reports/margin/', dict(params, group='product')).json()
+        self.assertEqual([(r['product_id'], r['units'], Decimal(r['revenue']), Decimal(r['cost'])) for r in margin['rows']],
+                         [(self.product.pk, 2, Decimal('500'), Decimal('1200'))])   # costo actual: sin historial
+
+    def test_without_date_from_archives_are_not_read(self):
+        margin = self.client.get('/api/reports/margin/').json()
+        self.assertEqual(margin['rows'], [])
+
+
+# ====================================================================
+# PRECIOS AS-OF (pricing.py, /api/products/prices-as-of/)
+# ====================================================================
+
+class BatchPricesAsOfTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        reset_throttles()
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.product = Product.objects.using('shard_a').get(company=self.company)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+
+    def post(self, **payload):
+        response = self.client.post('/api/products/prices-as-of/', {'at': '2000-01-01T00:00:00Z', **payload},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_impossible_datetime_in_price_as_of_is_rejected(self):
+        for at in ('2024-02-30T10:00', 'abc'):
+            response = self.client.get(f'/api/products/{self.product.pk}/price-as-of/', {'at': at})
+            self.assertEqual(response.status_code, 400, at)
+            self.assertIn('at', response.json())
+
+    def test_unknown_skus_and_ids_are_reported_missing(self):
+        ProductPriceHistory.objects.using('shard_a').create(
+            company=self.company, product=self.product, price=900, cost=500, valid_from='1999-01-01T00:00:00Z',
+        )
+        data = self.post(skus=['SKU-A', 'NO-EXISTE'])
+        self.assertEqual([r['sku'] for r in data['results']], ['SKU-A'])
+        self.assertEqual(data['missing'], ['NO-EXISTE'])
+        self.assertEqual(self.post(products=[self.product.pk, 999])['missing'], [999])
+
+    def test_products_without_price_at_that_date_are_missing(self):
+        self.assertEqual(self.post(skus=['SKU-A'])['missing'], ['SKU-A'])
+
+
+# ====================================================================
+# NUMERACIÓN DE BOLETAS (receipts.py)
+# ====================================================================
+
+@override_settings(RECEIPT_BLOCK_SIZE=3)
+class ReceiptNumberConcurrencyTests(TransactionTestCase):
+    """Hilos reales contra la BD: bloques chicos para forzar muchas reservas concurrentes."""
+    databases = ALL_DATABASES
+    THREADS = 50
+    PER_THREAD = 4
+
+    def setUp(self):
+        company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.branch = Branch.objects.using('shard_a').get(company=company)
+        allocator.reset()
+
+    def run_threads(self, allocate):
+        barrier = threading.Barrier(self.THREADS)
+        numbers, errors = [], []
+
+        def worker():
+            try:
+                barrier.wait()
+                numbers.extend(allocate() for _ in range(self.PER_THREAD))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return numbers
+
+    def test_threads_of_one_process_get_unique_numbers(self):
+        numbers = self.run_threads(lambda: next_receipt_number(self.branch.pk, using='shard_a'))
+        self.assertEqual(len(numbers), self.THREADS * self.PER_THREAD)
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_separate_allocators_get_unique_numbers(self):
+        # Un asignador por hilo: como workers distintos que reservan bloques a la vez.
+        local = threading.local()
+
+        def allocate():
+            if not hasattr(local, 'allocator'):
+                local.allocator = ReceiptAllocator()
+            return local.allocator.next(self.branch.pk, using='shard_a')
+
+        numbers = self.run_threads(allocate)
+        self.assertEqual(len(set(numbers)), self.THREADS * self.PER_THREAD)
+        self.assertEqual(min(numbers), 1)
+
+
+# ====================================================================
+# CATÁLOGO PÚBLICO (catalog.py, shop/products/)
+# ====================================================================
+
+class CatalogPageCacheTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+
+    def cache_keys_for(self, *queries):
+        from . import views
+        with mock.patch.object(views, 'page_cache_key', wraps=views.page_cache_key) as key:
+            for query in queries:
+                response = self.client.get('/shop/products/', {'company': self.company.pk, **query})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Producto A')
+        return [c.args for c in key.call_args_list]
+
+    def test_invalid_cursor_and_unknown_category_share_the_first_page_entry(self):
+        keys = self.cache_keys_for({}, {'after': 'basura'}, {'category': 'No existe'},
+                                   {'after': '!!', 'category': 'Otra'})
+        self.assertEqual(set(keys), {(self.company.pk, 'list', None, None)})
+
+    def test_existing_category_is_part_of_the_key(self):
+        keys = self.cache_keys_for({'category': 'General'})
+        self.assertEqual(keys, [(self.company.pk, 'list', 'General', None)])
+
+
+# ====================================================================
+# CONSULTAS LENTAS (slowqueries.py)
+# ====================================================================
+
+CAS_UPDATE_SQL = (
+    'WITH v(id, stock, version) AS (VALUES (%s, %s, %s)) '
+    'UPDATE "temucosoft_app_inventory" SET stock = v.stock, version = "temucosoft_app_inventory".version + 1 '
+    'FROM v WHERE "temucosoft_app_inventory".id = v.id RETURNING "temucosoft_app_inventory".id'
+)
+
+
+@override_settings(SLOW_QUERY_EXPLAIN_ANALYZE=True)
+class ExplainGuardTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.inventory = Inventory.objects.using('shard_a').get(branch__company=self.company)
+
+    def executed(self, sql):
+        """Sentencia que explain() enviaría a un PostgreSQL (cursor simulado)."""
+        connection = connections['shard_a']
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchall.return_value = []
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            slowqueries.explain('shard_a', sql, [])
+        # atomic() también usa el cursor (SAVEPOINT); interesa la sentencia EXPLAIN.
+        statements = [c.args[0] for c in cursor.__enter__.return_value.execute.call_args_list]
+        return next(s for s in statements if s.startswith('EXPLAIN'))
+
+    def test_only_plain_selects_are_analyzed(self):
+        self.assertTrue(slowqueries.can_analyze('SELECT id FROM t WHERE updated_at > %s'))
+        for sql in (CAS_UPDATE_SQL, 'SELECT id FROM t FOR UPDATE', 'SELECT * FROM t FOR NO KEY UPDATE',
+                    "SELECT pg_notify('stock', %s)", 'SELECT nextval(%s)', 'UPDATE t SET a = 1'):
+            self.assertFalse(slowqueries.can_analyze(sql), sql)
+        self.assertTrue(self.executed('SELECT 1').startswith('EXPLAIN (ANALYZE, BUFFERS) '))
+        self.assertTrue(self.executed(CAS_UPDATE_SQL).startswith('EXPLAIN WITH'))
+
+    def test_slow_with_update_is_not_executed_again(self):
+        slowqueries.record('shard_a', CAS_UPDATE_SQL, [self.inventory.pk, 99, self.inventory.version], 900, 'test')
+        self.inventory.refresh_from_db()
+        self.assertEqual((self.inventory.stock, self.inventory.version), (10, 0))
+
+
+# ====================================================================
+# COLA DE TRABAJOS (jobs.py)
+# ====================================================================
+
+@jobs.register_job('tests.ok')
+def _job_ok(ctx, value=None):
+    ctx.set_progress(50, 'mitad')
+    return {'value': value}
+
+
+@jobs.register_job('tests.fail')
+def _job_fail(ctx):
+    raise RuntimeError('falló')
+
+
+class JobQueueTests(TestCase):
+
+    def test_claim_takes_highest_priority_first_and_counts_the_attempt(self):
+        low = jobs.enqueue('tests.ok', priority=0)
+        high = jobs.enqueue('tests.ok', priority=5)
+        later = jobs.enqueue('tests.ok', priority=9)
+        Job.objects.filter(pk=later.pk).update(run_after=timezone.now() + timedelta(hours=1))
+
+        claimed = jobs.claim_next('w1')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts, claimed.locked_by),
+                         (high.pk, 'en_proceso', 1, 'w1'))
+        self.assertEqual(jobs.claim_next('w2').pk, low.pk)
+        self.assertIsNone(jobs.claim_next('w3'))
+
+    def test_run_job_completes_and_heartbeats_through_progress(self):
+        jobs.enqueue('tests.ok', {'value': 7})
+        job = jobs.claim_next('w1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(jobs.JobContext, 'set_progress', autospec=True,
+                               side_effect=jobs.JobContext.set_progress) as progress:
+            job = jobs.run_job(job)
+        progress.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.progress, job.locked_by), ('completado', {'value': 7}, 100, ''))
+
+    def test_failure_is_retried_with_backoff_until_max_attempts(self):
+        job = jobs.enqueue('tests.fail', max_attempts=2)
+        before = timezone.now()
+        with self.assertLogs('temucosoft_app.jobs', 'ERROR'):
+            job = jobs.run_job(jobs.claim_next('w1'))
+        self.assertEqual((job.status, job.attempts, job.error), ('pendiente', 1, 'falló'))
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=10))
+        self.assertIsNone(jobs.claim_next('w1'))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs('temucosoft_app.jobs', 'ERROR'):
+            job = jobs.run_job(jobs.claim_next('w1'))
+        self.assertEqual((job.status, job.attempts), ('fallido', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stale_jobs_count_as_an_attempt(self):
+        once = jobs.enqueue('tests.ok', max_attempts=1)
+        retry = jobs.enqueue('tests.ok', max_attempts=3)
+        alive = jobs.enqueue('tests.ok', max_attempts=1)
+        for job in (once, retry, alive):
+            jobs.claim_next('muerto')
+        old = timezone.now() - timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        Job.objects.filter(pk__in=[once.pk, retry.pk]).update(locked_at=old)
+
+        self.assertEqual(jobs.requeue_stale(), (1, 1))
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {once.pk: 'fallido', retry.pk: 'pendiente', alive.pk: 'en_proceso'})
+
+    def test_heartbeat_keeps_a_long_job_locked(self):
+        jobs.enqueue('tests.ok')
+        job = jobs.claim_next('w1')
+        old = timezone.now() - timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        Job.objects.filter(pk=job.pk).update(locked_at=old)
+
+        # Un latido, en el hilo de la prueba para ver su transacción.
+        heartbeat = jobs.Heartbeat(job)
+        heartbeat.stopped.wait = mock.Mock(side_effect=[False, True])
+        with mock.patch.object(jobs, 'connections'):
+            heartbeat.run()
+        self.assertEqual(jobs.requeue_stale(), (0, 0))
+
+
+# ====================================================================
+# ADMIN (admin.py)
+# ====================================================================
+
+class TenantScopedAdminTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.other = create_tenant('22222222-2', 'B', 'shard_a')
+        self.staff = CustomUser.objects.get(username='gerente_A')
+        self.staff.is_staff = True
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.staff
+
+    def choices(self, model_admin, model, field):
+        with use_tenant_shard(self.company.pk):
+            formfield = model_admin.formfield_for_foreignkey(model._meta.get_field(field), self.request)
+            return set(formfield.queryset.values_list('company_id' if field != 'company' else 'pk', flat=True))
+
+    def test_foreign_key_choices_are_limited_to_the_company(self):
+        inventory_admin = django_admin.site._registry[Inventory]
+        purchase_admin = django_admin.site._registry[Purchase]
+        self.assertEqual(self.choices(inventory_admin, Inventory, 'product'), {self.company.pk})
+        self.assertEqual(self.choices(purchase_admin, Purchase, 'user'), {self.company.pk})
+        self.assertEqual(self.choices(purchase_admin, Purchase, 'company'), {self.company.pk})
+
+    def test_superuser_sees_every_company(self):
+        self.staff.is_superuser = True
+        inventory_admin = django_admin.site._registry[Inventory]
+        self.assertEqual(self.choices(inventory_admin, Inventory, 'product'), {self.company.pk, self.other.pk})
+
+    def test_saving_another_companys_object_is_denied(self):
+        product_admin = django_admin.site._registry[Product]
+        with use_tenant_shard(self.other.pk):
+            foreign = Product.objects.get(company=self.other)
+        with self.assertRaises(PermissionDenied):
+            product_admin.save_model(self.request, foreign, None, True)
+
+        inventory_admin = django_admin.site._registry[Inventory]
+        with use_tenant_shard(self.company.pk):
+            own = Inventory.objects.get(branch__company=self.company)
+            self.assertTrue(inventory_admin.is_owned(own, self.company.pk))
+            self.assertFalse(inventory_admin.is_owned(own, self.other.pk))
+
+    def test_estimated_count_sums_partitions(self):
+        connection = connections['default']
+        if connection.vendor != 'postgresql':
+            self.skipTest("reltuples solo existe en PostgreSQL")
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE est_part (id int, m int) PARTITION BY RANGE (m)")
+            cursor.execute("CREATE TABLE est_part_1 PARTITION OF est_part FOR VALUES FROM (1) TO (2)")
+            cursor.execute("CREATE TABLE est_part_d PARTITION OF est_part DEFAULT")
+            cursor.execute("INSERT INTO est_part SELECT g, 1 + g % 2 FROM generate_series(1, 1000) g")
+            cursor.execute("ANALYZE est_part")
+        queryset = mock.Mock(db='default', query=mock.Mock(where=None))
+        queryset.model._meta.db_table = 'est_part'
+        self.assertEqual(admin.estimated_count(queryset), 1000)
+
+
+# ====================================================================
+# CANAL PUSH DE STOCK (realtime.py)
+# ====================================================================
+
+class NotifyBackendTests(TestCase):
+
+    def setUp(self):
+        self.backend = realtime.PostgresNotifyBackend()
+        self.backend.hub = realtime.StockHub()
+
+    def test_large_message_is_split_and_reassembled(self):
+        items = [{'product_id': pk, 'stock': 100, 'reorder_point': 5} for pk in range(1000)]
+        message = {'event': 'stock', 'data': {'branch': 7, 'items': items}}
+        sent = []
+        with mock.patch.object(realtime, 'connections') as conns:
+            cursor = conns.__getitem__.return_value.cursor.return_value.__enter__.return_value
+            cursor.execute.side_effect = lambda sql, params: sent.append(params[1])
+            self.backend.publish(7, message)
+
+        self.assertGreater(len(sent), 1)
+        self.assertTrue(all(len(part.encode()) < 8000 for part in sent))
+        subscription = self.backend.hub.subscribe_thread(7)
+        for part in sent[:-1]:
+            self.backend._handle(part)
+        self.assertIsNone(subscription.get(0))
+        self.backend._handle(sent[-1])
+        self.assertEqual(subscription.get(0), message)
+
+    def test_listener_reconnects_after_connection_error(self):
+        calls = []
+
+        def listen_once():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            self.backend.stopped.set()
+
+        self.backend._listen_once = listen_once
+        self.backend.stopped.wait = mock.Mock()
+        with self.assertLogs('temucosoft_app.realtime', 'ERROR'):
+            self.backend._listen()
+        self.assertEqual(len(calls), 2)
+        self.backend.stopped.wait.assert_called_once_with(2)
+
+
+# ====================================================================
+# THROTTLING POR PLAN (throttling.py, cache_backends.py)
+# ====================================================================
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        reset_throttles()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(throttling, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_refills_at_its_rate(self):
+        bucket = throttling.TokenBucket(3, 1)
+        self.assertEqual([bucket.consume()[0] for _ in range(4)], [True, True, True, False])
+        self.assertEqual(bucket.consume(), (False, 1))
+        self.clock.now += 1
+        self.assertEqual(bucket.consume(), (True, 0))
+
+    def test_sync_shares_the_window_between_processes(self):
+        # Dos workers con su propio bucket y el mismo cache compartido.
+        first, second = throttling.TokenBucket(10, 10 / 60), throttling.TokenBucket(10, 10 / 60)
+        for _ in range(6):
+            first.consume()
+        first.sync('throttle:1', 60)
+        second.sync('throttle:1', 60)
+        self.assertEqual(second.tokens, 4)
+
+        for _ in range(4):
+            self.assertTrue(second.consume()[0])
+        second.sync('throttle:1', 60)
+        allowed, wait = second.consume()
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 60 - self.clock.now % 60)   # hasta el fin de la ventana
+
+        first.sync('throttle:1', 60)
+        self.assertFalse(first.consume()[0])
+        self.clock.now += 60
+        self.assertTrue(first.consume()[0])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'temucosoft_app.cache_backends.DatabaseCache',
+                                       'LOCATION': 'tests_cache'}})
+class DatabaseCacheIncrTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        self.cache = caches['default']
+
+    def expires(self, key):
+        with connections[self.cache_db].cursor() as cursor:
+            cursor.execute("SELECT expires FROM tests_cache WHERE cache_key = %s",
+                           [self.cache.make_and_validate_key(key)])
+            return cursor.fetchone()[0]
+
+    @property
+    def cache_db(self):
+        return router.db_for_write(self.cache.cache_model_class)
+
+    def test_incr_keeps_the_expiry(self):
+        self.cache.add('window', 0, 10)
+        before = self.expires('window')
+        self.assertEqual(self.cache.incr('window', 5), 5)
+        self.assertEqual(self.cache.decr('window'), 4)
+        self.assertEqual(self.cache.get('window'), 4)
+        self.assertEqual(self.expires('window'), before)
+
+    def test_incr_of_missing_or_expired_key_fails(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('old', 1, 10)
+        with mock.patch('temucosoft_app.cache_backends.timezone.now',
+                        return_value=timezone.now() + timedelta(seconds=30)):
+            with self.assertRaises(ValueError):
+                self.cache.incr('old')
+
+
+# ====================================================================
+# RESPALDO Y PURGA DE TENANTS (tenant_archive.py, tenant_purge.py)
+# ====================================================================
+
+class TenantArchiveTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.path = Path(tempfile.mkdtemp()) / archive_filename(self.company.pk)
+        self.addCleanup(shutil.rmtree, self.path.parent)
+
+    def tenant_rows(self):
+        return {
+            model.__name__: model.objects.using('shard_a').filter(tenant_filter(scope, self.company.pk)).count()
+            for model, scope in tenant_models()
+        }
+
+    def test_export_purge_import_round_trip_invalidates_caches(self):
+        before = self.tenant_rows()
+        export_tenant(self.company.pk, self.path)
+        versions = {ns: get_version(ns, self.company.pk) for ns in TENANT_NAMESPACES}
+
+        purge_tenant(self.company.pk, pause=0, keep_company=True)
+        self.assertFalse(any(self.tenant_rows().values()))
+        self.assertFalse(Company.objects.get(pk=self.company.pk).is_active)
+        purged = {ns: get_version(ns, self.company.pk) for ns in TENANT_NAMESPACES}
+        self.assertTrue(all(purged[ns] > versions[ns] for ns in TENANT_NAMESPACES))
+
+        with self.captureOnCommitCallbacks(using='shard_a', execute=True):
+            import_tenant(self.path)
+        self.assertEqual(self.tenant_rows(), before)
+        self.assertTrue(all(get_version(ns, self.company.pk) > purged[ns] for ns in TENANT_NAMESPACES))
+        usage = TenantUsage.objects.get(company=self.company)
+        self.assertEqual((usage.users, usage.products, usage.branches), (1, 1, 1))
+
+    def purge_and_recreate(self):
+        export_tenant(self.company.pk, self.path)
+        purge_tenant(self.company.pk, pause=0)
+        Company.objects.create(pk=self.company.pk, rut=self.company.rut, name='A', shard='shard_a')
+
+    def test_import_recreates_users_of_a_purged_company(self):
+        before = self.tenant_rows()
+        self.purge_and_recreate()
+        import_tenant(self.path)
+        self.assertEqual(self.tenant_rows(), before)
+        user = CustomUser.objects.get(username='gerente_A')
+        self.assertEqual(user.company_id, self.company.pk)
+        self.assertFalse(user.has_usable_password())
+
+    def test_import_rejects_users_of_another_company(self):
+        user_id = CustomUser.objects.get(username='gerente_A').pk
+        self.purge_and_recreate()
+        other = Company.objects.create(rut='22222222-2', name='B', shard='shard_b')
+        CustomUser.objects.create(pk=user_id, username='otro', company=other)
+        with self.assertRaisesMessage(TenantArchiveError, 'otra compañía'):
+            import_tenant(self.path)
+
+        CustomUser.objects.filter(pk=user_id).delete()
+        CustomUser.objects.create(pk=user_id + 100, username='gerente_A', company=other)
+        with self.assertRaisesMessage(TenantArchiveError, 'username'):
+            import_tenant(self.path)
+        self.assertFalse(any(self.tenant_rows().values()))
+
+    def test_failed_shard_load_does_not_leave_users(self):
+        self.purge_and_recreate()
+        # Una PK ocupada en el shard hace fallar la carga después de crear los usuarios.
+        other = Company.objects.create(rut='22222222-2', name='B', shard='shard_a')
+        product_id = json.loads(self.exported_member('product.ndjson'))['id']
+        Product.objects.using('shard_a').create(pk=product_id, company_id=other.pk, sku='X', name='X',
+                                                price=1, cost=1, category='c')
+        with self.assertRaises(TenantArchiveError):
+            import_tenant(self.path)
+        self.assertFalse(CustomUser.objects.filter(company_id=self.company.pk).exists())
+
+    def exported_member(self, name):
+        with tarfile.open(self.path, 'r:gz') as tar:
+            return tar.extractfile(name).readline()
+
+
+# ====================================================================
+# ALTA MASIVA DE USUARIOS (provisioning.py)
+# ====================================================================
+
+class ProvisioningTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        self.company = create_tenant('11111111-1', 'A', 'shard_a')
+        self.creator = CustomUser.objects.create(username='admin_A', role='admin_cliente', company=self.company)
+
+    def test_validation_reports_every_bad_row(self):
+        rows = read_csv(
+            "username,email,password,role,rut\n"
+            "vendedor1,v1@temuco.cl,Temuco.2026!x,vendedor,\n"
+            "vendedor2,no-es-email,Temuco.2026!x,super_admin,12.345.678-0\n"
+            "gerente_A,g@temuco.cl,Temuco.2026!x,gerente,\n"
+            "vendedor1,v3@temuco.cl,Temuco.2026!x,vendedor,\n"
+        )
+        with self.assertRaises(ProvisioningError) as ctx:
+            validate_rows(self.creator, rows)
+        errors = {e['row']: set(e['errors']) for e in ctx.exception.errors}
+        self.assertEqual(errors, {2: {'username'}, 3: {'email', 'role', 'rut'}, 4: {'username'}, 5: {'username'}})
+
+        with self.assertRaises(ProvisioningError):
+            read_csv("username,email\nx,x@temuco.cl\n")
+
+    def test_provision_hashes_in_a_process_pool(self):
+        rows = read_csv(
+            "username,email,password,role\n"
+            "vendedor1,v1@temuco.cl,Temuco.2026!x,vendedor\n"
+            "vendedor2,v2@temuco.cl,Temuco.2026!y,vendedor\n"
+        )
+        result = provision_users(self.creator, rows, processes=2)
+        self.assertEqual(result['created'], 2)
+        user = CustomUser.objects.get(username='vendedor2')
+        self.assertEqual(user.company_id, self.company.pk)
+        self.assertTrue(user.check_password('Temuco.2026!y'))
+        self.assertTrue(CustomUser.objects.using('shard_a').filter(username='vendedor2').exists())
+        self.assertEqual(TenantUsage.objects.get(company=self.company).users, 4)
+
+
+# ====================================================================
+# PERFILADO BAJO DEMANDA (profiling.py)
+# ====================================================================
+
+class ProfilingPermissionTests(TestCase):
+    databases = ALL_DATABASES
+
+    def test_bad_tokens_do_not_break_the_request(self):
+        self.assertEqual(is_profiling_allowed(RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer x')),
+                         (False, None))
+        # Con usuario inactivo o borrado JWTAuthentication lanza AuthenticationFailed, no InvalidToken.
+        user = get_user_model().objects.create(username='root', is_active=False)
+        token = AccessToken.for_user(user)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(is_profiling_allowed(request), (False, None))
+        user.delete()
+        self.assertEqual(is_profiling_allowed(request), (False, None))
+
+
+# ====================================================================
+# CAMPOS A PEDIDO (?fields= / ?exclude=, views.SparseFieldsetMixin)
+# ====================================================================
+
+class SparseFieldsetTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        create_tenant('11111111-1', 'A', 'shard_a')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+
+    def test_fields_and_exclude_trim_the_payload(self):
+        rows = self.client.get('/api/products/', {'fields': 'id,sku,price', 'exclude': 'price'}).json()
+        self.assertEqual(set(rows[0]), {'id', 'sku'})
+
+    def test_unknown_names_are_reported_under_their_parameter(self):
+        response = self.client.get('/api/products/', {'exclude': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'exclude'})
+
+        response = self.client.get('/api/products/', {'fields': 'sku,nada', 'exclude': 'nope'})
+        self.assertEqual(response.json(), {'fields': 'Campos no válidos: nada.',
+                                           'exclude': 'Campos no válidos: nope.'})
+
+
+# ====================================================================
+# PUNTOS DE REORDEN (forecasting.py)
+# ====================================================================
+
+class ForecastingTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        try:
+            self.np = forecasting._numpy()
+        except forecasting.ForecastError:
+            self.skipTest("numpy no está instalado")
+
+    def test_forecasts_and_safety_stock(self):
+        demand = self.np.array([[2, 2, 2, 2], [0, 4, 0, 4]], dtype=self.np.float32)
+        ma = forecasting.ForecastOptions(window=2)
+        ses = forecasting.ForecastOptions(method='ses', alpha=0.5)
+        self.assertEqual(forecasting.forecast_daily(self.np, demand, ma).tolist(), [2, 2])
+        self.assertEqual(forecasting.forecast_daily(self.np, demand, ses).tolist(), [2, 2.5])
+
+        # Sin variación no hay stock de seguridad; sigma 2 con z(0.95) = 1.645: 8 + 1.645 * 2 * 2 -> 15.
+        options = forecasting.ForecastOptions(window=4, lead_time=4, service_level=0.95)
+        self.assertEqual(forecasting.reorder_points(self.np, demand, options).tolist(), [8, 15])
+        options.min_reorder_point = 10
+        self.assertEqual(forecasting.reorder_points(self.np, demand, options).tolist(), [10, 15])
+
+        with self.assertRaises(forecasting.ForecastError):
+            forecasting.forecast_daily(self.np, demand, forecasting.ForecastOptions(method='arima'))
+
+    def test_recompute_company_reads_pos_sales(self):
+        company = create_tenant('11111111-1', 'A', 'shard_a')
+        sale = Sale.objects.using('shard_a').get(company=company)
+        product = Product.objects.using('shard_a').get(company=company)
+        for days_ago in (0, 3):
+            CartItem.objects.using('shard_a').create(sale=sale, product=product, quantity=7, price=1000,
+                                                     created_at=timezone.now() - timedelta(days=days_ago))
+        # 14 unidades en 7 días con z = 0: 2 por día x 7 días de reposición.
+        options = forecasting.ForecastOptions(history_days=6, window=7, service_level=0.5)
+        with use_tenant_shard(company.pk):
+            stats = forecasting.recompute_company(company.pk, forecasting.ForecastOptions(
+                **dict(vars(options), dry_run=True)))
+            self.assertEqual((stats['pairs'], stats['updated']), (1, 1))
+            self.assertEqual(Inventory.objects.get().reorder_point, 5)   # dry_run: sin cambios
+
+            forecasting.recompute_company(company.pk, options)
+            self.assertEqual(Inventory.objects.get().reorder_point, 14)
+
+
+# ====================================================================
+# FORMATOS COMPACTOS PARA POS (renderers.py)
+# ====================================================================
+
+class CompactRendererTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        create_tenant('11111111-1', 'A', 'shard_a')
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.get(username='gerente_A'))
+
+    def test_columnar_layout_round_trip(self):
+        rows = [{'id': 1, 'sku': 'A'}, {'id': 2, 'sku': 'B'}]
+        columnar = renderers.to_columnar(rows)
+        self.assertEqual(columnar, {'columns': ['id', 'sku'], 'rows': [[1, 'A'], [2, 'B']]})
+        self.assertEqual(renderers.from_columnar(columnar), rows)
+
+        page = {'next': None, 'results': rows}
+        self.assertEqual(renderers.from_columnar(renderers.to_columnar(page)), page)
+        # Filas con claves distintas no se pueden compactar: quedan como están.
+        mixed = [{'id': 1}, {'sku': 'B'}]
+        self.assertIs(renderers.to_columnar(mixed), mixed)
+
+        body = renderers.ColumnarJSONRenderer().render(rows)
+        self.assertEqual(renderers.ColumnarJSONParser().parse(BytesIO(body)), rows)
+
+    def test_api_serves_the_same_data_in_every_format(self):
+        expected = self.client.get('/api/products/').json()
+        columnar = self.client.get('/api/products/', {'format': 'columnar'})
+        self.assertEqual(columnar['Content-Type'], 'application/vnd.temucosoft.columnar+json')
+        self.assertEqual(renderers.from_columnar(columnar.json()), expected)
+
+        if not renderers.MessagePackRenderer.available():
+            self.skipTest("msgpack no está instalado")
+        import msgpack
+        packed = self.client.get('/api/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(packed['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content, raw=False), expected)
+
+        with self.assertRaises(ParseError):
+            renderers.MessagePackParser().parse(BytesIO(b'\xc1'))
+
+    def test_msgpack_is_not_offered_without_the_package(self):
+        with mock.patch.object(renderers, '_msgpack', return_value=None):
+            response = self.client.get('/api/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 406)
+
+
+# ====================================================================
+# PRECALENTAMIENTO (warmup.py)
+# ====================================================================
+
+class WarmUpTests(TestCase):
+    databases = ALL_DATABASES
+
+    def setUp(self):
+        reset_throttles()
+        tenancy._shard_cache.clear()
+
+    def test_code_stages_build_their_tables(self):
+        timings = warmup.warm_up(stages=warmup.CODE_STAGES)
+        self.assertEqual(list(timings), list(warmup.CODE_STAGES))
+        self.assertGreater(timings['urls'][0], 0)
+        self.assertGreater(timings['serializers'][0], 0)
+
+    def test_caches_stage_primes_the_busiest_active_tenants(self):
+        big, small = create_tenant('11111111-1', 'A', 'shard_a'), create_tenant('22222222-2', 'B', 'shard_b')
+        TenantUsage.objects.filter(company=big).update(products=50)
+        tenancy._shard_cache.clear()
+
+        self.assertEqual(warmup.warm_caches(tenants=1), 1)
+        self.assertIn(big.pk, tenancy._shard_cache)
+        self.assertIn(big.pk, throttling._plan_cache)
+        self.assertNotIn(small.pk, tenancy._shard_cache)
+
+        Company.objects.filter(pk=big.pk).update(is_active=False)
+        tenancy._shard_cache.clear()
+        self.assertEqual(warmup.warm_caches(tenants=1), 1)
+        self.assertEqual(set(tenancy._shard_cache), {small.pk})
+
+    def test_failing_stage_does_not_stop_the_others(self):
+        with mock.patch.dict(warmup.STAGES, urls=mock.Mock(side_effect=RuntimeError('boom'))), \
+                self.assertLogs('temucosoft_app.warmup', 'WARNING'):
+            timings = warmup.warm_up(stages=('urls', 'serializers'))
+        self.assertIsNone(timings['urls'][0])
+        self.assertGreater(timings['serializers'][0], 0)
@@ -0,0 +1,238 @@
+"""
+Throttling por tenant según el plan de Subscription (Básico/Estándar/Premium).
+
+- PlanRateThrottle: token bucket por compañía en memoria del proceso.
+- ReportConcurrencyThrottle: máximo de reportes simultáneos por compañía.
+
+Lo compartido entre procesos vive en el cache de Django (settings.CACHES,
+tabla de BD o Redis; nunca LocMemCache con varios workers):
+- El plan de cada compañía: cada proceso lo reutiliza TENANT_PLAN_LOCAL_TTL
+  segundos sin consultar el cache.
+- Con TENANT_THROTTLE_SYNC_INTERVAL > 0 cada proceso publica su consumo en
+  una ventana del cache y recorta su bucket a lo que queda del límite del
+  plan en esa ventana (o rechaza hasta el fin de la ventana si no queda).
+  Entre sincronizaciones varios workers pueden gastar ese mismo resto, así
+  que el límite se puede exceder en lo consumido durante un intervalo.
+- Con TENANT_THROTTLE_SHARED_CONCURRENCY (por defecto solo con Redis) los
+  reportes en curso se cuentan en el cache: incr() atómico que conserva el
+  TTL en Redis y en cache_backends.DatabaseCache, aunque en la BD cuesta
+  varias idas con bloqueo de fila por reporte.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_PLAN_RATES = {
+    'basico': {'requests': '60/min', 'reports': 1},
+    'estandar': {'requests': '300/min', 'reports': 3},
+    'premium': {'requests': '1200/min', 'reports': 8},
+    'sin_plan': {'requests': '30/min', 'reports': 1},
+}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+PLAN_CACHE_TTL = getattr(settings, 'TENANT_PLAN_CACHE_TTL', 300)
+PLAN_LOCAL_TTL = getattr(settings, 'TENANT_PLAN_LOCAL_TTL', 10)
+SYNC_INTERVAL = getattr(settings, 'TENANT_THROTTLE_SYNC_INTERVAL', 0)
+SHARED_CONCURRENCY = getattr(settings, 'TENANT_THROTTLE_SHARED_CONCURRENCY', False)
+
+_lock = threading.Lock()
+_plan_cache = {}
+_buckets = {}
+_running_reports = {}
+
+
+def plan_rates():
+    return getattr(settings, 'TENANT_THROTTLE_RATES', DEFAULT_PLAN_RATES)
+
+
+def parse_rate(rate):
+    """'300/min' -> (300, 60)."""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+# --------------------------------------------------------------------
+# Plan por compañía (cache en memoria + cache compartido)
+# --------------------------------------------------------------------
+
+def plan_for_company(company_id):
+    now = time.monotonic()
+    cached = _plan_cache.get(company_id)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    key = f"tenant_plan:{company_id}"
+    plan = cache.get(key)
+    if plan is None:
+        from .models import Company
+        plan = Company.objects.filter(pk=company_id).values_list('plan__name', flat=True).first()
+        plan = plan or 'sin_plan'
+        cache.set(key, plan, PLAN_CACHE_TTL)
+    _plan_cache[company_id] = (plan, now + PLAN_LOCAL_TTL)
+    return plan
+
+
+def forget_company_plan(company_id):
+    """Los demás procesos ven el cambio al vencer su copia local (TENANT_PLAN_LOCAL_TTL)."""
+    _plan_cache.pop(company_id, None)
+    cache.delete(f"tenant_plan:{company_id}")
+
+
+# --------------------------------------------------------------------
+# Token bucket
+# --------------------------------------------------------------------
+
+class TokenBucket:
+    """Bucket con capacidad `capacity` que se rellena a `rate` tokens/segundo."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.consumed_since_sync = 0
+        self.synced_at = self.updated
+        # Ventana global agotada (sync): se rechaza hasta que termine.
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, n=1):
+        """Devuelve (permitido, segundos de espera sugeridos)."""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False, self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= n:
+                self.tokens -= n
+                self.consumed_since_sync += n
+                return True, 0
+            return False, (n - self.tokens) / self.rate
+
+    def sync(self, key, period):
+        """
+        Publica el consumo local en el cache compartido y deja en el bucket
+        local a lo más lo que queda de la capacidad en la ventana global; si
+        no queda nada, rechaza hasta el fin de la ventana (sin esto cada
+        proceso seguiría rellenando a `rate` y el límite se multiplicaría
+        por el número de procesos).
+        """
+        with self.lock:
+            consumed, self.consumed_since_sync = self.consumed_since_sync, 0
+            self.synced_at = time.monotonic()
+        window = int(time.time() // period)
+        window_key = f"{key}:{window}"
+        cache.add(window_key, 0, period * 2)
+        try:
+            total = cache.incr(window_key, consumed) if consumed else cache.get(window_key, 0)
+        except ValueError:
+            return
+        with self.lock:
+            self.tokens = min(self.tokens, max(0, self.capacity - total))
+            if total >= self.capacity:
+                self.blocked_until = time.monotonic() + (window + 1) * period - time.time()
+
+
+def get_bucket(key, capacity, rate):
+    bucket = _buckets.get(key)
+    if bucket is None or bucket.capacity != capacity:
+        with _lock:
+            bucket = _buckets.get(key)
+            if bucket is None or bucket.capacity != capacity:
+                bucket = _buckets[key] = TokenBucket(capacity, rate)
+    return bucket
+
+
+# --------------------------------------------------------------------
+# Throttles de DRF
+# --------------------------------------------------------------------
+
+def _tenant_of(request):
+    user = request.user
+    if not user or not user.is_authenticated or user.role == 'super_admin':
+        return None
+    return user.company_id
+
+
+class PlanRateThrottle(BaseThrottle):
+    """Limita peticiones/tiempo por compañía según su plan."""
+
+    def allow_request(self, request, view):
+        company_id = _tenant_of(request)
+        if company_id is None:
+            return True
+
+        plan = plan_for_company(company_id)
+        rates = plan_rates()
+        num, period = parse_rate(rates.get(plan, rates['sin_plan'])['requests'])
+        key = f"throttle:{company_id}"
+        bucket = get_bucket(key, num, num / period)
+
+        allowed, self._wait = bucket.consume()
+        if SYNC_INTERVAL and time.monotonic() - bucket.synced_at >= SYNC_INTERVAL:
+            bucket.sync(key, period)
+        return allowed
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class ReportConcurrencyThrottle(BaseThrottle):
+    """
+    Limita los reportes simultáneos por compañía. La vista debe llamar a
+    release_report_slot(request) al terminar (ver ReportViewSet).
+    """
+
+    def allow_request(self, request, view):
+        company_id = _tenant_of(request)
+        if company_id is None:
+            return True
+
+        rates = plan_rates()
+        limit = rates.get(plan_for_company(company_id), rates['sin_plan'])['reports']
+        if not acquire_report_slot(company_id, limit):
+            return False
+        request._report_slot = company_id
+        return True
+
+    def wait(self):
+        return 1
+
+
+def acquire_report_slot(company_id, limit):
+    if SHARED_CONCURRENCY:
+        key = f"running_reports:{company_id}"
+        cache.add(key, 0, 3600)
+        if cache.incr(key) > limit:
+            cache.decr(key)
+            return False
+        return True
+
+    with _lock:
+        running = _running_reports.get(company_id, 0)
+        if running >= limit:
+            return False
+        _running_reports[company_id] = running + 1
+        return True
+
+
+def release_report_slot(request):
+    company_id = getattr(request, '_report_slot', None)
+    if company_id is None:
+        return
+    request._report_slot = None
+    if SHARED_CONCURRENCY:
+        try:
+            cache.decr(f"running_reports:{company_id}")
+        except ValueError:
+            pass  # La clave expiró o el cache se vació.
+        return
+    with _lock:
+        _running_reports[company_id] = max(0, _running_reports.get(company_id, 1) - 1)
@@ -0,0 +1,138 @@
+"""
+Contadores de uso por compañía (TenantUsage): usuarios, productos y sucursales.
+
+Las señales de post_save/post_delete suman o restan 1 con un UPDATE
+... SET n = n + 1 (F()), así que leer el uso para un límite de plan o el
+dashboard es una sola fila. Productos y sucursales viven en el shard del
+tenant y TenantUsage en la BD de control: esos incrementos se aplican al
+confirmar la transacción del shard.
+
+Las operaciones masivas (bulk_create, UPDATE/DELETE directos) no emiten
+señales: deben llamar a increment() con la cantidad o dejar que
+`manage.py reconcile_usage` (programado periódicamente) corrija la
+diferencia con un COUNT real.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Branch, Company, CustomUser, Product, TenantUsage
+from .tenancy import control_database, shard_for_company, sharding_enabled, tenant_shards
+
+COUNTERS = ('users', 'products', 'branches')
+
+
+class PlanLimitExceeded(Exception):
+    pass
+
+
+def increment(company_id, counter, delta=1):
+    """Suma `delta` al contador; si la fila no existe la crea con un conteo real."""
+    if not company_id or not delta:
+        return
+    updated = TenantUsage.objects.using(control_database()).filter(company_id=company_id) \
+        .update(**{counter: F(counter) + delta})
+    if not updated:
+        reconcile_company(company_id)
+
+
+def get_usage(company_id):
+    """Uso actual de la compañía (una fila)."""
+    usage = TenantUsage.objects.using(control_database()).filter(company_id=company_id).first()
+    return usage or reconcile_company(company_id)
+
+
+def usage_summary(company):
+    usage = get_usage(company.pk)
+    plan = company.plan
+    return {
+        'users': usage.users,
+        'max_users': plan.max_users if plan else None,
+        'products': usage.products,
+        'branches': usage.branches,
+    }
+
+
+def check_user_limit(company, count=1):
+    """
+    Bloquea la fila de uso hasta el fin de la transacción en curso y valida
+    que queden `count` cupos de usuario; el alta posterior suma el contador.
+    """
+    if company.plan is None:
+        return
+    control = control_database()
+    get_usage(company.pk)
+    usage = TenantUsage.objects.using(control).select_for_update().get(company_id=company.pk)
+    if usage.users + count > company.plan.max_users:
+        raise PlanLimitExceeded(
+            f"El plan {company.plan} permite {company.plan.max_users} usuarios y la compañía ya tiene {usage.users}"
+            + (f"; se intentan agregar {count}." if count > 1 else ".")
+        )
+
+
+# --------------------------------------------------------------------
+# Reconciliación
+# --------------------------------------------------------------------
+
+def count_usage(company_id):
+    db = shard_for_company(company_id) or control_database()
+    return {
+        'users': CustomUser.objects.using(control_database()).filter(company_id=company_id).count(),
+        'products': Product.objects.using(db).filter(company_id=company_id).count(),
+        'branches': Branch.objects.using(db).filter(company_id=company_id).count(),
+    }
+
+
+def reconcile_company(company_id, counts=None):
+    """Reemplaza los contadores por un conteo real. Devuelve la fila."""
+    counts = counts or count_usage(company_id)
+    control = control_database()
+    values = dict(counts, reconciled_at=timezone.now())
+    try:
+        with transaction.atomic(using=control):
+            usage, _ = TenantUsage.objects.using(control).update_or_create(company_id=company_id, defaults=values)
+    except IntegrityError:
+        # Otro proceso creó la fila al mismo tiempo.
+        TenantUsage.objects.using(control).filter(company_id=company_id).update(**values)
+        usage = TenantUsage.objects.using(control).get(company_id=company_id)
+    return usage
+
+
+def reconcile_all():
+    """
+    Recalcula todas las compañías con un GROUP BY por tabla y shard.
+    Devuelve [(company_id, antes, después)] de las que tenían diferencias.
+    """
+    control = control_database()
+    # Solo cuenta el shard dueño (como shard_for_company): un move_tenant
+    # --keep-source deja copias de las filas en el origen.
+    owners = {
+        pk: (shard if sharding_enabled() else None) or control
+        for pk, shard in Company.objects.using(control).values_list('pk', 'shard')
+    }
+    counts = {pk: dict.fromkeys(COUNTERS, 0) for pk in owners}
+
+    def add(rows, counter, shard=None):
+        for company_id, n in rows:
+            if company_id in counts and shard in (None, owners[company_id]):
+                counts[company_id][counter] = n
+
+    add(CustomUser.objects.using(control).filter(company__isnull=False)
+        .values_list('company_id').annotate(n=Count('id')).order_by(), 'users')
+    for shard in tenant_shards():
+        add(Product.objects.using(shard).values_list('company_id').annotate(n=Count('id')).order_by(),
+            'products', shard)
+        add(Branch.objects.using(shard).values_list('company_id').annotate(n=Count('id')).order_by(),
+            'branches', shard)
+
+    current = {
+        row['company_id']: row
+        for row in TenantUsage.objects.using(control).values('company_id', *COUNTERS)
+    }
+    drift = []
+    for company_id, values in counts.items():
+        before = current.get(company_id)
+        if before is None or any(before[c] != values[c] for c in COUNTERS):
+            reconcile_company(company_id, values)
+            drift.append((company_id, before and {c: before[c] for c in COUNTERS}, values))
+    return drift
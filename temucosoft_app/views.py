@@ -1,8 +1,16 @@
+import asyncio
 import logging
-from django.urls import reverse_lazy
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse, reverse_lazy
 from django.shortcuts import get_object_or_404, render, redirect
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib import messages
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -10,21 +18,55 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from rest_framework import viewsets, mixins, status, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import AllowAny, SAFE_METHODS
 
 # Models
 from .models import (
     CustomUser, Company, Subscription, Product, Branch, Supplier,
-    Inventory, Purchase, PurchaseItem, Sale, CartItem, Order
+    Inventory, Purchase, Sale, CartItem, Order, Job, OutboxEvent, StockTransfer,
+    SlowQuery
 )
 
 # Serializers
 from .serializers import (
     CustomUserCreateSerializer, CustomUserDetailSerializer, CompanySerializer,
     SubscriptionSerializer, ProductSerializer, BranchSerializer, SupplierSerializer,
-    InventorySerializer, SaleCreateSerializer, PurchaseCreateSerializer
+    InventorySerializer, SaleCreateSerializer, PurchaseCreateSerializer, JobSerializer,
+    OutboxEventSerializer, InventoryAdjustSerializer, CycleCountSerializer,
+    StockTransferSerializer, transfer_event_payload, RepricingSerializer, PricesAsOfSerializer, ReportDatesSerializer, sale_event_payload,
+    purchase_event_payload
 )
 
+# Reportes y trabajos en segundo plano
+from .inventory import (
+    receive_purchase_items, notify_stock_on_commit, apply_stock_delta,
+    adjust_stock, reconcile_cycle_count, transfer_stock, StockConflict, InsufficientStock
+)
+from .jobs import RESULT_DIR, enqueue
+from .receipts import next_receipt_number
+from .pricing import reprice, price_change_context, history_as_of, prices_as_of
+from .reports import (
+    stock_report_queryset, sales_report_queryset, archived_sales_rows,
+    valuation_report, valuation_snapshot_report, valuation_history, margin_report, supplier_report,
+    parse_bound, MARGIN_GROUPS
+)
+from .outbox import record_event
+from .cache_versions import bump_version
+from .catalog import (
+    CATALOG_CACHE_TTL, catalog_categories, catalog_page, catalog_version, decode_cursor, page_cache_key
+)
+from .realtime import hub, get_backend, format_sse
+from .tenancy import (
+    activate_tenant_shard, deactivate_tenant_shard, tenant_db, shard_for_company, control_database, use_tenant_shard
+)
+from .throttling import PlanRateThrottle, ReportConcurrencyThrottle, release_report_slot
+from .provisioning import ProvisioningError, read_csv, save_upload, validate_rows
+from .profiling import list_profiles, load_profile, profile_file
+from .slowqueries import summarize, top_slow_queries
+from .tenant_archive import TenantArchiveError, check_compression
+from .usage import PlanLimitExceeded, check_user_limit, usage_summary
+
 # Permissions
 from .permissions import (
     IsSuperAdmin, IsAdminCliente, IsAdminOrGerente, IsVendedor,
@@ -37,11 +79,135 @@ from .forms import AdminClienteCreationForm, SessionLoginForm
 # Logging
 logger = logging.getLogger(__name__)
 
+# ====================================================================
+# SPARSE FIELDSETS (?fields= / ?exclude=)
+# ====================================================================
+
+class SparseFieldsetMixin:
+    """
+    Recorta los campos del serializer según ?fields=a,b o ?exclude=c y
+    proyecta las mismas columnas en SQL con .only(), de modo que las
+    columnas no pedidas (p. ej. Product.description) no salen de la BD.
+    """
+    fields_param = 'fields'
+    exclude_param = 'exclude'
+    sparse_actions = ('list', 'retrieve')
+
+    def _parse_param(self, name):
+        raw = self.request.query_params.get(name, '')
+        return [f.strip() for f in raw.split(',') if f.strip()]
+
+    def get_sparse_fieldset(self, available):
+        """Devuelve el conjunto de campos a conservar o None si no hay recorte."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        if getattr(self, 'action', None) not in self.sparse_actions:
+            return None
+
+        requested = self._parse_param(self.fields_param)
+        excluded = self._parse_param(self.exclude_param)
+        if not requested and not excluded:
+            return None
+
+        errors = {}
+        for param, names in ((self.fields_param, requested), (self.exclude_param, excluded)):
+            invalid = [f for f in names if f not in available]
+            if invalid:
+                errors[param] = f"Campos no válidos: {', '.join(invalid)}."
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        keep = set(requested) if requested else set(available)
+        return keep - set(excluded)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        target = getattr(serializer, 'child', serializer)
+        keep = self.get_sparse_fieldset(target.fields.keys())
+        if keep is not None:
+            for name in list(target.fields.keys()):
+                if name not in keep:
+                    target.fields.pop(name)
+        return serializer
+
+    def get_projection(self, model):
+        """
+        Traduce los campos visibles del serializer a rutas para .only() y
+        select_related(). Devuelve (None, None) si algún campo no se puede
+        proyectar (source='*', métodos, propiedades, relaciones inversas).
+        """
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        keep = self.get_sparse_fieldset(serializer.fields.keys())
+        if keep is None:
+            return None, None
+
+        only, related = {model._meta.pk.name}, set()
+        for name, field in serializer.fields.items():
+            if name not in keep or field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+                return None, None
+
+            current, path = model, []
+            last = len(field.source_attrs) - 1
+            for i, attr in enumerate(field.source_attrs):
+                try:
+                    model_field = current._meta.get_field(attr)
+                except Exception:
+                    return None, None
+                if not model_field.concrete or model_field.many_to_many:
+                    return None, None
+                path.append(attr)
+                if model_field.is_relation and i < last:
+                    only.add('__'.join(path))
+                    related.add('__'.join(path))
+                    current = model_field.related_model
+            only.add('__'.join(path))
+        return only, related
+
+    def project_queryset(self, queryset):
+        only, related = self.get_projection(queryset.model)
+        if only is None:
+            return queryset
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*only)
+
+    def filter_queryset(self, queryset):
+        return self.project_queryset(super().filter_queryset(queryset))
+
+
 # ====================================================================
 # BASE MULTI-TENANT
 # ====================================================================
 
-class BaseCompanyViewSet(viewsets.ModelViewSet):
+class TenantShardMixin:
+    """
+    Fija el shard del tenant tras la autenticación de DRF (JWT incluido),
+    para que las consultas sin pista de instancia vayan a su BD.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if user.is_authenticated and user.company_id:
+            self._shard_token = activate_tenant_shard(user.company_id)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            self._shard_token = None
+            # Los querysets perezosos de Response(data) se evalúan al renderizar.
+            if getattr(response, 'is_rendered', True):
+                deactivate_tenant_shard(token)
+            else:
+                response.add_post_render_callback(lambda r: deactivate_tenant_shard(token))
+        return response
+
+
+class BaseCompanyViewSet(TenantShardMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """Clase base que implementa el filtrado por compañía."""
 
     def get_queryset(self):
@@ -67,7 +233,7 @@ class BaseCompanyViewSet(viewsets.ModelViewSet):
 # 1. GESTIÓN DE USUARIOS Y COMPAÑÍAS
 # ====================================================================
 
-class UserViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.CreateModelMixin):
+class UserViewSet(SparseFieldsetMixin, viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.CreateModelMixin):
     queryset = CustomUser.objects.all()
 
     def get_serializer_class(self):
@@ -76,7 +242,7 @@ class UserViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.Cre
         return CustomUserDetailSerializer
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ['create', 'bulk']:
             return [IsSuperAdminOrAdminCliente()]
         if self.action == 'me':
             return [IsAuthenticatedAndActive()]
@@ -105,13 +271,47 @@ class UserViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.Cre
                     "company": "Solo puede crear usuarios en su Compañía."
                 })
 
-        serializer.save()
+        with transaction.atomic(using=control_database()):
+            if target_company:
+                try:
+                    check_user_limit(target_company)
+                except PlanLimitExceeded as e:
+                    raise serializers.ValidationError({"company": str(e)})
+            serializer.save()
 
     @action(detail=False, methods=['get'])
     def me(self, request):
         serializer = CustomUserDetailSerializer(request.user)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Alta masiva desde un CSV (multipart `file` o texto en `csv`) con
+        columnas username, email, password, role, rut y company. Valida todo
+        el archivo en la petición y crea los usuarios en segundo plano;
+        con `dry_run` solo valida.
+        """
+        upload = request.FILES.get('file')
+        try:
+            content = upload.read().decode('utf-8-sig') if upload else request.data.get('csv', '')
+        except UnicodeDecodeError:
+            raise serializers.ValidationError({"file": "El archivo debe estar en UTF-8."})
+        if not content:
+            raise serializers.ValidationError({"file": "Debe adjuntar el CSV en 'file' o 'csv'."})
+        try:
+            rows = validate_rows(request.user, read_csv(content))
+        except ProvisioningError as e:
+            return Response({"errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        if str(request.data.get('dry_run', '')).lower() in ('1', 'true'):
+            return Response({"valid": len(rows), "dry_run": True})
+        # Las contraseñas van en un archivo 0600 que el trabajo borra, no en Job.payload.
+        path = save_upload(content, RESULT_DIR / 'uploads')
+        job = enqueue('users.bulk_provision', {'user_id': request.user.pk, 'path': path},
+                      user=request.user, max_attempts=1)
+        return job_accepted_response(request, job)
+
 
 class CompanyViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin):
     queryset = Company.objects.all()
@@ -138,6 +338,56 @@ class CompanyViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.Crea
 
         return Response({"status": "success", "plan": plan.name})
 
+    @action(detail=True, methods=['get'])
+    def usage(self, request, pk=None):
+        """Usuarios, productos y sucursales usados frente al límite del plan (lectura O(1))."""
+        company = self.get_object()
+        if request.user.role != 'super_admin' and company.pk != request.user.company_id:
+            raise PermissionDenied("Solo puede consultar su propia compañía.")
+        return Response(usage_summary(company))
+
+    @action(detail=True, methods=['post'], permission_classes=[IsSuperAdminOrAdminCliente])
+    def export(self, request, pk=None):
+        """
+        Respaldo completo del tenant (tar de NDJSON) como trabajo en segundo
+        plano; el archivo se descarga en /api/jobs/{id}/download/.
+        Los admin_cliente solo exportan su compañía y con plan Premium.
+        """
+        company = self.get_object()
+        user = request.user
+        if user.role != 'super_admin':
+            if company.pk != user.company_id:
+                raise PermissionDenied("Solo puede exportar su propia compañía.")
+            if company.plan is None or company.plan.name != 'premium':
+                raise PermissionDenied("La exportación completa está disponible en el plan Premium.")
+        compression = request.data.get('compression', 'gz')
+        try:
+            check_compression(compression)
+        except TenantArchiveError as e:
+            raise serializers.ValidationError({"compression": str(e)})
+        job = enqueue('tenants.export', {'company_id': company.pk, 'compression': compression},
+                      user=user, company=company)
+        return job_accepted_response(request, job)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsSuperAdmin])
+    def purge(self, request, pk=None):
+        """
+        Elimina la compañía y todos sus datos por lotes en segundo plano.
+        Requiere {"confirm": "<rut de la compañía>"}; con "keep_company": true
+        conserva la Company (desactivada) y sus usuarios.
+        """
+        company = self.get_object()
+        if request.data.get('confirm') != company.rut:
+            raise serializers.ValidationError({"confirm": "Debe indicar el RUT de la compañía para confirmar."})
+        Company.objects.filter(pk=company.pk).update(is_active=False)
+        # update() no emite post_save: ocultarla ya del catálogo público.
+        bump_version('catalog', company.pk)
+        # Sin company: el Job no debe borrarse junto con los de la compañía.
+        job = enqueue('tenants.purge', {'company_id': company.pk,
+                                        'keep_company': bool(request.data.get('keep_company'))},
+                      user=request.user, company=None)
+        return job_accepted_response(request, job)
+
 
 # ====================================================================
 # 2. INVENTARIO Y PROVEEDORES
@@ -151,12 +401,86 @@ class ProductViewSet(BaseCompanyViewSet):
     def list(self, request, *args, **kwargs):
         try:
             if not request.user.is_authenticated:
-                return Response(ProductSerializer(Product.objects.all(), many=True).data)
+                queryset = self.project_queryset(Product.objects.all())
+                return Response(self.get_serializer(queryset, many=True).data)
             return super().list(request, *args, **kwargs)
+        except serializers.ValidationError:
+            raise
         except Exception as e:
             logger.error(f"Error en ProductViewSet.list: {str(e)}", exc_info=True)
             return Response({"error": str(e)}, status=500)
 
+    def perform_create(self, serializer):
+        with price_change_context(self.request.user, source='api'):
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with price_change_context(self.request.user, source='api'):
+            super().perform_update(serializer)
+
+    @action(detail=True, methods=['get'], url_path='price-as-of')
+    def price_as_of(self, request, pk=None):
+        """Precio y costo vigentes del producto en ?at=<fecha-hora ISO>."""
+        product = self.get_object()
+        try:
+            at = parse_datetime(request.query_params.get('at', ''))
+        except ValueError:
+            # Bien formada pero inexistente (2024-02-30T10:00).
+            at = None
+        if at is None:
+            raise serializers.ValidationError({"at": "Formato esperado: fecha-hora ISO 8601."})
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        entry = history_as_of(product.pk, at)
+        if entry is None:
+            raise Http404("Sin precio registrado para esa fecha.")
+        return Response({'product': product.pk, 'sku': product.sku, 'at': at,
+                         'price': entry.price, 'cost': entry.cost, 'valid_from': entry.valid_from})
+
+    @action(detail=False, methods=['post'], url_path='prices-as-of', url_name='prices-as-of')
+    def batch_prices_as_of(self, request):
+        """
+        Precios vigentes en `at` para una lista de SKUs o ids, en una sola consulta.
+        `missing` lista, con el mismo identificador pedido, los productos que no
+        existen en la compañía y los que no tenían precio en esa fecha.
+        """
+        if not request.user.company:
+            raise serializers.ValidationError(
+                "Debe estar asociado a una Compañía para realizar esta acción."
+            )
+        serializer = PricesAsOfSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        products = Product.objects.filter(company=request.user.company)
+        if 'skus' in data:
+            requested, products = data['skus'], products.filter(sku__in=data['skus'])
+        else:
+            requested, products = data['products'], products.filter(pk__in=data['products'])
+        skus = dict(products.values_list('pk', 'sku'))
+        prices = prices_as_of(request.user.company, data['at'], skus)
+        priced = {skus[pk] if 'skus' in data else pk for pk in prices}
+        return Response({
+            'at': data['at'],
+            'results': [{'product': pk, 'sku': skus[pk], **values} for pk, values in prices.items()],
+            'missing': sorted(set(requested) - priced),
+        })
+
+    @action(detail=False, methods=['post'])
+    def reprice(self, request):
+        """
+        Cambio masivo de precios/costos por reglas, un UPDATE por regla.
+        Con "dry_run": true devuelve el antes/después sin guardar.
+        """
+        if not request.user.company:
+            raise serializers.ValidationError(
+                "Debe estar asociado a una Compañía para realizar esta acción."
+            )
+        serializer = RepricingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = reprice(request.user.company, serializer.validated_data['rules'],
+                         user=request.user, dry_run=serializer.validated_data['dry_run'])
+        return Response(result)
+
 
 class BranchViewSet(BaseCompanyViewSet):
     queryset = Branch.objects.all()
@@ -180,6 +504,70 @@ class SupplierViewSet(BaseCompanyViewSet):
     permission_classes = [IsAdminOrGerente]
 
 
+class InventoryViewSet(TenantShardMixin, viewsets.GenericViewSet):
+    """
+    Ajustes manuales de stock con control de concurrencia optimista.
+    Si el cliente envía `version` y la fila cambió, se responde 409 con el
+    stock y versión actuales para que vuelva a decidir.
+    """
+    queryset = Inventory.objects.select_related('branch')
+    permission_classes = [IsAdminOrGerente]
+
+    def get_branch(self, branch_id):
+        user = self.request.user
+        branches = Branch.objects.all()
+        if user.role != 'super_admin':
+            branches = branches.filter(company=user.company)
+        return get_object_or_404(branches, pk=branch_id)
+
+    @action(detail=False, methods=['post'])
+    def adjust(self, request):
+        serializer = InventoryAdjustSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        branch = self.get_branch(data['branch'])
+        inventory = Inventory.objects.filter(branch=branch, product_id=data['product']) \
+            .only('id', 'stock', 'version').first()
+        if inventory is None:
+            raise Http404("No existe inventario para ese producto en la sucursal.")
+
+        try:
+            with transaction.atomic(using=tenant_db()):
+                stock, version = adjust_stock(
+                    inventory, delta=data.get('delta'), stock=data.get('stock'),
+                    expected_version=data.get('version'),
+                )
+                notify_stock_on_commit(
+                    inventory._state.db, branch.company_id, branch.pk, [data['product']],
+                    'adjust', {'branch': branch.pk, 'product': data['product']},
+                )
+        except StockConflict as e:
+            return Response({"error": str(e), "current": e.current}, status=status.HTTP_409_CONFLICT)
+        except InsufficientStock as e:
+            raise serializers.ValidationError({"stock": str(e)})
+
+        return Response({"branch": branch.pk, "product": data['product'], "stock": stock, "version": version})
+
+    @action(detail=False, methods=['post'], url_path='cycle-count')
+    def cycle_count(self, request):
+        """Conteo cíclico: fija el stock contado de muchos productos en pocas sentencias."""
+        serializer = CycleCountSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        branch = self.get_branch(data['branch'])
+        product_ids = {c['product'] for c in data['counts']}
+        if Product.objects.filter(company_id=branch.company_id, pk__in=product_ids).count() != len(product_ids):
+            raise serializers.ValidationError({"counts": "Hay productos que no pertenecen a la compañía."})
+
+        with transaction.atomic(using=tenant_db()):
+            result = reconcile_cycle_count(branch, data['counts'])
+
+        code = status.HTTP_409_CONFLICT if result['conflicts'] and not result['updated'] else status.HTTP_200_OK
+        return Response(result, status=code)
+
+
 # ====================================================================
 # 3. COMPRAS Y VENTAS
 # ====================================================================
@@ -189,34 +577,77 @@ class PurchaseViewSet(BaseCompanyViewSet):
     serializer_class = PurchaseCreateSerializer
     permission_classes = [IsGerente]
 
-    @transaction.atomic
     def perform_create(self, serializer):
         user = self.request.user
         items_data = self.request.data.get('items', [])
+        serializer.validated_data.pop('items', None)
 
-        purchase = serializer.save(user=user, company=user.company, total=0)
-        total = 0
-
-        for item in items_data:
-            product = get_object_or_404(Product, id=item['product'])
+        with transaction.atomic(using=tenant_db()):
+            purchase = serializer.save(user=user, company=user.company, total=0)
+            receive_purchase_items(purchase, items_data)
+            record_event('purchase.created', purchase, purchase_event_payload(purchase))
 
-            PurchaseItem.objects.create(
-                purchase=purchase,
-                product=product,
-                quantity=item['quantity'],
-                unit_cost=item['unit_cost']
+    @action(detail=False, methods=['post'], url_path='bulk-receive')
+    def bulk_receive(self, request):
+        """Valida una lista de compras y las registra como trabajo en segundo plano."""
+        if not request.user.company:
+            raise serializers.ValidationError(
+                "Debe estar asociado a una Compañía para realizar esta acción."
             )
+        serializer = PurchaseCreateSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        purchases = [
+            {
+                'supplier': data['supplier'].pk,
+                'branch': data['branch'].pk,
+                'date': data.get('date', timezone.localdate()).isoformat(),
+                'items': [
+                    {
+                        'product': item['product'].pk,
+                        'quantity': item['quantity'],
+                        'unit_cost': str(item['unit_cost']),
+                    }
+                    for item in data['items']
+                ],
+            }
+            for data in serializer.validated_data
+        ]
+        # Sin reintentos: un reintento parcial duplicaría las compras ya registradas.
+        job = enqueue('purchases.bulk_receive', {'user_id': request.user.pk, 'purchases': purchases},
+                      user=request.user, max_attempts=1)
+        return job_accepted_response(request, job)
+
+
+class StockTransferViewSet(BaseCompanyViewSet):
+    """Traspasos de stock entre sucursales: POST /api/transfers/ con {from_branch, to_branch, lines}."""
+    queryset = StockTransfer.objects.prefetch_related('items')
+    serializer_class = StockTransferSerializer
+    permission_classes = [IsAdminOrGerente]
+    http_method_names = ['get', 'post', 'head', 'options']
 
-            total += item['quantity'] * item['unit_cost']
+    def perform_create(self, serializer):
+        user = self.request.user
+        data = serializer.validated_data
+        if not user.company or data['from_branch'].company_id != user.company_id:
+            raise serializers.ValidationError("Las sucursales deben pertenecer a su Compañía.")
 
-            inventory, created = Inventory.objects.get_or_create(
-                branch=purchase.branch, product=product, defaults={'stock': 0}
-            )
-            inventory.stock += item['quantity']
-            inventory.save()
+        lines = {line['product']: line['quantity'] for line in data.pop('lines')}
+        known = Product.objects.filter(company=user.company, pk__in=lines).count()
+        if known != len(lines):
+            raise serializers.ValidationError({"lines": "Hay productos que no pertenecen a la compañía."})
 
-        purchase.total = total
-        purchase.save()
+        try:
+            with transaction.atomic(using=tenant_db()):
+                transfer = serializer.save(user=user, company=user.company)
+                transfer_stock(transfer, lines)
+                record_event('transfer.created', transfer, transfer_event_payload(transfer, lines))
+        except InsufficientStock as e:
+            raise serializers.ValidationError({"stock": [
+                f"Producto {s['product']}: stock {s['stock']}, solicitado {s['requested']}." for s in e.args[0]
+            ]})
+        except StockConflict as e:
+            raise serializers.ValidationError({"stock": str(e)})
 
 
 class SaleViewSet(BaseCompanyViewSet):
@@ -224,12 +655,24 @@ class SaleViewSet(BaseCompanyViewSet):
     serializer_class = SaleCreateSerializer
     permission_classes = [IsVendedor]
 
-    @transaction.atomic
     def perform_create(self, serializer):
+        # El número se toma antes de la transacción de la venta (ver receipts.py).
+        receipt_number = next_receipt_number(serializer.validated_data['branch'].pk, using=tenant_db())
+        with transaction.atomic(using=tenant_db()):
+            sale = self.create_sale(serializer, receipt_number)
+            payload = sale_event_payload(sale)
+            record_event('sale.created', sale, payload)
+            notify_stock_on_commit(
+                sale._state.db, sale.company_id, sale.branch_id, {item['product'] for item in payload['items']},
+                'sale', {k: payload[k] for k in ('id', 'branch', 'total', 'payment_method', 'created_at')},
+            )
+
+    def create_sale(self, serializer, receipt_number=None):
         user = self.request.user
         items_data = self.request.data.get('items', [])
+        serializer.validated_data.pop('items', None)
 
-        sale = serializer.save(user=user, company=user.company, total=0)
+        sale = serializer.save(user=user, company=user.company, total=0, receipt_number=receipt_number)
         total = 0
 
         for item in items_data:
@@ -242,27 +685,28 @@ class SaleViewSet(BaseCompanyViewSet):
             except Inventory.DoesNotExist:
                 raise serializers.ValidationError({"stock": f"No existe inventario para {product.name}."})
 
-            if inventory.stock < qty:
+            # Descuento condicional en SQL: una venta concurrente no puede dejarlo negativo.
+            if not apply_stock_delta(inventory.pk, -qty, using=inventory._state.db):
+                inventory.refresh_from_db(fields=['stock'])
                 raise serializers.ValidationError({"stock": f"Stock insuficiente ({inventory.stock})."})
 
-            inventory.stock -= qty
-            inventory.save()
-
             CartItem.objects.create(
-                sale=sale, product=product, quantity=qty, price=product.price
+                sale=sale, product=product, quantity=qty, price=product.price,
+                created_at=sale.created_at
             )
 
             total += qty * product.price
 
         sale.total = total
         sale.save()
+        return sale
 
 
 # ====================================================================
 # 4. CARRITO (E-commerce)
 # ====================================================================
 
-class CartViewSet(viewsets.GenericViewSet):
+class CartViewSet(TenantShardMixin, viewsets.GenericViewSet):
     queryset = Order.objects.all()
     permission_classes = [IsAuthenticatedAndActive]
 
@@ -279,16 +723,68 @@ class CartViewSet(viewsets.GenericViewSet):
 # 5. REPORTES
 # ====================================================================
 
-class ReportViewSet(viewsets.GenericViewSet):
+def job_accepted_response(request, job):
+    """Respuesta 202 estándar para un trabajo encolado."""
+    return Response({
+        "status": "accepted",
+        "job": job.pk,
+        "url": request.build_absolute_uri(reverse('job-detail', args=[job.pk])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def validate_id_params(params, *names):
+    """400 (no 500 del ORM) si un filtro por id de la query string no es numérico."""
+    for name in names:
+        if params.get(name) and not params[name].isdigit():
+            raise serializers.ValidationError({name: "Debe ser un id numérico."})
+
+
+def validate_report_dates(params):
+    """Fechas (YYYY-MM-DD) de la query string ya validadas; None si no vienen."""
+    serializer = ReportDatesSerializer(data=params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def validate_date_bounds(params):
+    """400 si ?date_from / ?date_to (fecha o fecha-hora ISO 8601) no son fechas válidas."""
+    for name, end in (('date_from', False), ('date_to', True)):
+        try:
+            parse_bound(params.get(name), end)
+        except ValueError:
+            raise serializers.ValidationError({name: "Formato esperado: YYYY-MM-DD o fecha-hora ISO 8601."})
+
+
+class ReportViewSet(TenantShardMixin, viewsets.GenericViewSet):
     queryset = Inventory.objects.all()
     permission_classes = [IsAdminOrGerente]
+    throttle_classes = [PlanRateThrottle, ReportConcurrencyThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # El cupo de reporte concurrente se libera después de renderizar.
+        if getattr(response, 'is_rendered', True):
+            release_report_slot(request)
+        else:
+            response.add_post_render_callback(lambda r: release_report_slot(request))
+        return response
+
+    def enqueue_export(self, request, job_name):
+        """Con ?async=1 el reporte se genera como CSV en un trabajo en segundo plano."""
+        if request.query_params.get('async') not in ('1', 'true'):
+            return None
+        params = {k: v for k, v in request.query_params.items() if k != 'async'}
+        job = enqueue(job_name, {'company_id': request.user.company_id, 'params': params},
+                      user=request.user)
+        return job_accepted_response(request, job)
 
     @action(detail=False, methods=['get'])
     def stock(self, request):
         try:
-            data = Inventory.objects.filter(branch__company=request.user.company) \
-                .values('branch__name', 'product__sku', 'product__name', 'stock', 'reorder_point') \
-                .order_by('branch__name', 'product__name')
+            accepted = self.enqueue_export(request, 'reports.stock')
+            if accepted:
+                return accepted
+            data = stock_report_queryset(request.user.company, request.query_params)
             return Response(data)
         except Exception as e:
             logger.error(f"Error en ReportViewSet.stock: {str(e)}", exc_info=True)
@@ -296,18 +792,15 @@ class ReportViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=['get'])
     def sales(self, request):
+        validate_date_bounds(request.query_params)
         try:
-            qs = Sale.objects.filter(company=request.user.company)
-
-            if request.query_params.get('date_from'):
-                qs = qs.filter(created_at__gte=request.query_params['date_from'])
-            if request.query_params.get('date_to'):
-                qs = qs.filter(created_at__lte=request.query_params['date_to'])
-            if request.query_params.get('branch'):
-                qs = qs.filter(branch_id=request.query_params['branch'])
-
-            data = qs.values('branch__name', 'total', 'created_at', 'user__username', 'payment_method') \
-                     .order_by('-created_at')
+            accepted = self.enqueue_export(request, 'reports.sales')
+            if accepted:
+                return accepted
+            data = sales_report_queryset(request.user.company, request.query_params)
+            archived = archived_sales_rows(request.user.company, request.query_params)
+            if archived:
+                data = list(data) + archived
 
             return Response(data)
         except Exception as e:
@@ -315,6 +808,257 @@ class ReportViewSet(viewsets.GenericViewSet):
             return Response({"error": str(e)}, status=500)
 
 
+    @action(detail=False, methods=['get'])
+    def valuation(self, request):
+        """
+        Valor de inventario a costo/precio y margen potencial por sucursal y categoría.
+        ?date=YYYY-MM-DD lee la foto diaria guardada en vez del inventario actual.
+        """
+        validate_id_params(request.query_params, 'branch')
+        branch = request.query_params.get('branch')
+        day = validate_report_dates(request.query_params).get('date')
+        if day:
+            return Response(valuation_snapshot_report(request.user.company, day, branch))
+        return Response(valuation_report(request.user.company, request.query_params))
+
+    @action(detail=False, methods=['get'])
+    def margin(self, request):
+        """
+        Margen histórico de ventas con el costo vigente a la fecha de cada
+        venta (?date_from, ?date_to, ?branch, ?group=category|product|branch|day).
+        """
+        if request.query_params.get('group', 'category') not in MARGIN_GROUPS:
+            raise serializers.ValidationError({"group": f"Valores posibles: {', '.join(MARGIN_GROUPS)}."})
+        validate_date_bounds(request.query_params)
+        return Response(margin_report(request.user.company, request.query_params))
+
+    @action(detail=False, methods=['get'])
+    def suppliers(self, request):
+        """
+        Gasto, frecuencia de compra, tendencia del costo unitario por producto
+        y dispersión de costos por proveedor (?date_from, ?date_to, ?branch, ?supplier).
+        """
+        params = request.query_params
+        validate_report_dates(params)
+        validate_id_params(params, 'branch', 'supplier')
+        return Response(supplier_report(request.user.company, params))
+
+    @action(detail=False, methods=['get'], url_path='valuation/history')
+    def valuation_history(self, request):
+        """Totales diarios de las fotos de valorización (?date_from, ?date_to, ?branch)."""
+        params = request.query_params
+        validate_id_params(params, 'branch')
+        dates = validate_report_dates(params)
+        date_from, date_to = dates.get('date_from'), dates.get('date_to')
+        return Response(valuation_history(request.user.company, date_from, date_to, params.get('branch')))
+
+
+# ====================================================================
+# 5.1 FEED DE EVENTOS (OUTBOX)
+# ====================================================================
+
+class EventViewSet(TenantShardMixin, viewsets.GenericViewSet, mixins.ListModelMixin):
+    """
+    Feed incremental de eventos de la compañía: GET /api/events/?after=<seq>&limit=<n>.
+    Los consumidores guardan el último `seq` recibido en vez de re-escanear ventas.
+    `seq` lo asigna el dispatcher a eventos ya confirmados y en orden creciente
+    (ver outbox.py), así que un evento nunca aparece detrás de un cursor ya
+    entregado; los eventos aparecen en el feed tras el siguiente ciclo de
+    `manage.py dispatch_outbox`.
+    """
+    queryset = OutboxEvent.objects.all()
+    serializer_class = OutboxEventSerializer
+    permission_classes = [IsAdminOrGerente]
+    max_limit = 1000
+
+    def get_queryset(self):
+        user = self.request.user
+        try:
+            after = int(self.request.query_params.get('after', 0))
+            limit = min(int(self.request.query_params.get('limit', 100)), self.max_limit)
+        except ValueError:
+            raise serializers.ValidationError("'after' y 'limit' deben ser enteros.")
+        return self.queryset.filter(company_id=user.company_id, feed_seq__gt=after) \
+            .order_by('feed_seq')[:limit]
+
+
+# ====================================================================
+# 5.2 TRABAJOS EN SEGUNDO PLANO
+# ====================================================================
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado, progreso y descarga de resultados de trabajos (/api/jobs/{id}/)."""
+    queryset = Job.objects.all().order_by('-created_at')
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticatedAndActive]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'super_admin':
+            return self.queryset.all()
+        if user.company:
+            return self.queryset.filter(company=user.company)
+        return self.queryset.filter(user=user)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'completado' or not job.result_file:
+            raise Http404("El trabajo no tiene un archivo de resultado disponible.")
+        try:
+            return FileResponse(open(job.result_file, 'rb'), as_attachment=True)
+        except FileNotFoundError:
+            raise Http404("El archivo de resultado ya no existe.")
+
+
+# ====================================================================
+# 5.3 CANAL PUSH DE STOCK (SSE)
+# ====================================================================
+
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_WSGI_MAX_SECONDS = getattr(settings, 'STREAM_WSGI_MAX_SECONDS', 20)
+
+
+def _authorize_stream(request, branch_id):
+    """Usuario de sesión o JWT (header o ?token=, EventSource no envía headers) con acceso a la sucursal."""
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+    user = request.user if request.user.is_authenticated else None
+    if user is None:
+        auth = JWTAuthentication()
+        try:
+            token = request.GET.get('token')
+            if token:
+                user = auth.get_user(auth.get_validated_token(token))
+            else:
+                result = auth.authenticate(request)
+                user = result[0] if result else None
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            user = None
+
+    if user is None or not user.is_active:
+        return None, 401
+    if user.role == 'super_admin':
+        return user, None
+    if user.role not in ('admin_cliente', 'gerente', 'vendedor') or not user.company_id:
+        return None, 403
+
+    db = shard_for_company(user.company_id) or control_database()
+    if not Branch.objects.using(db).filter(pk=branch_id, company_id=user.company_id).exists():
+        return None, 404
+    return user, None
+
+
+async def branch_stream_view(request, branch_id):
+    """
+    GET /api/branches/<id>/stream/: eventos SSE `stock` y `sale`/`purchase` de la sucursal.
+
+    Se sirve desde el proceso ASGI (gunicorn_stream.conf.py), donde cada
+    suscriptor inactivo solo ocupa su cola. Bajo WSGI un iterador asíncrono
+    se consume completo antes de enviar nada, así que ahí se usa un
+    generador síncrono que ocupa el worker y cierra tras
+    STREAM_WSGI_MAX_SECONDS; EventSource reconecta solo (`retry`).
+    """
+    user, error = await sync_to_async(_authorize_stream)(request, branch_id)
+    if error:
+        return JsonResponse({"error": "No autorizado para esta sucursal."}, status=error)
+
+    get_backend().listen()
+
+    if not isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_bounded_stream(branch_id), content_type='text/event-stream')
+    else:
+        async def events():
+            subscription = hub.subscribe(branch_id)
+            try:
+                yield "retry: 3000\n\n"
+                while True:
+                    try:
+                        message = await subscription.get(STREAM_HEARTBEAT_SECONDS)
+                        yield format_sse(message)
+                    except asyncio.TimeoutError:
+                        yield ": keep-alive\n\n"
+            finally:
+                subscription.close()
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _bounded_stream(branch_id):
+    """Respaldo WSGI: eventos durante a lo más STREAM_WSGI_MAX_SECONDS (menos que el timeout de gunicorn)."""
+    subscription = hub.subscribe_thread(branch_id)
+    deadline = time.monotonic() + STREAM_WSGI_MAX_SECONDS
+    try:
+        yield "retry: 1000\n\n"
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = subscription.get(min(STREAM_HEARTBEAT_SECONDS, remaining))
+            yield format_sse(message) if message else ": keep-alive\n\n"
+    finally:
+        subscription.close()
+
+
+# ====================================================================
+# 5.4 PERFILADO BAJO DEMANDA (super_admin)
+# ====================================================================
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Perfiles capturados con `X-Profile: 1|cprofile` (ver profiling.py).
+    GET /api/profiles/, /api/profiles/{id}/ y /api/profiles/{id}/download/?fmt=speedscope|collapsed|pstats
+    """
+    permission_classes = [IsSuperAdmin]
+
+    def list(self, request):
+        return Response(list_profiles())
+
+    def retrieve(self, request, pk=None):
+        meta = load_profile(pk)
+        if meta is None:
+            raise Http404("Perfil no encontrado.")
+        return Response(meta)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        meta = load_profile(pk)
+        if meta is None:
+            raise Http404("Perfil no encontrado.")
+        # ?format= lo reserva DRF para elegir el renderer.
+        fmt = request.query_params.get('fmt', meta['formats'][0])
+        path = profile_file(pk, fmt)
+        if path is None:
+            raise Http404(f"Formato no disponible; use uno de: {', '.join(meta['formats'])}.")
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+class SlowQueryViewSet(viewsets.ViewSet):
+    """
+    Consultas lentas agregadas por huella (ver slowqueries.py).
+    GET /api/slow-queries/?order=total|count|max|recent&limit=n y /api/slow-queries/{fingerprint}/ (con plan).
+    """
+    permission_classes = [IsSuperAdmin]
+
+    def list(self, request):
+        order = request.query_params.get('order', 'total')
+        if order not in ('total', 'count', 'max', 'recent'):
+            raise serializers.ValidationError({"order": "Use total, count, max o recent."})
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), 500)
+        except ValueError:
+            raise serializers.ValidationError({"limit": "Debe ser un entero."})
+        return Response([summarize(entry) for entry in top_slow_queries(order, limit)])
+
+    def retrieve(self, request, pk=None):
+        entry = SlowQuery.objects.using(control_database()).filter(fingerprint=pk).first()
+        if entry is None:
+            raise Http404("Consulta no encontrada.")
+        return Response(summarize(entry, include_plan=True))
+
+
 # ====================================================================
 # 6. VISTAS DE TEMPLATE (UI)
 # ====================================================================
@@ -336,15 +1080,96 @@ def logout_view(request):
 
 @login_required(login_url=reverse_lazy('login'))
 def dashboard_view(request):
-    return render(request, 'temucosoft_app/dashboard.html')
+    context = {}
+    company = getattr(request.user, 'company', None)
+    if company is not None:
+        context['usage'] = usage_summary(company)
+    return render(request, 'temucosoft_app/dashboard.html', context)
+
+
+def _shop_company_id(request):
+    """Tienda del catálogo: ?company=<id> o la compañía del usuario de sesión."""
+    company_id = request.GET.get('company', '')
+    if company_id.isdigit():
+        return int(company_id)
+    if request.user.is_authenticated:
+        return getattr(request.user, 'company_id', None)
+    return None
+
+
+def _cached_shop_page(request, key, build):
+    """
+    HTML completo desde el cache para visitantes anónimos (sin consultar las
+    tablas del catálogo); los usuarios con sesión ven datos internos y
+    siempre se renderizan.
+    """
+    anonymous = not request.user.is_authenticated
+    if anonymous:
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+    response = build()
+    if anonymous and response.status_code == 200 and not messages.get_messages(request):
+        cache.set(key, response.content, CATALOG_CACHE_TTL)
+    return response
+
+
+def _shop_company(company_id):
+    company = Company.objects.filter(pk=company_id, is_active=True).first()
+    if company is None:
+        raise Http404("Tienda no encontrada.")
+    return company
 
 
 def catalogo_list_view(request):
-    return render(request, 'temucosoft_app/catalogo.html')
+    company_id = _shop_company_id(request)
+    if company_id is None:
+        stores = Company.objects.filter(is_active=True).order_by('name')
+        return render(request, 'temucosoft_app/catalogo.html', {'stores': stores})
+
+    # Parámetros normalizados antes de armar la clave: un cursor inválido es la
+    # primera página y una categoría inexistente equivale a no filtrar.
+    cursor = decode_cursor(request.GET.get('after'))
+    category = request.GET.get('category') or None
+    if category:
+        with use_tenant_shard(company_id):
+            if category not in catalog_categories(company_id):
+                category = None
+
+    def build():
+        company = _shop_company(company_id)
+        with use_tenant_shard(company_id):
+            page = catalog_page(company_id, category, cursor)
+            categories = catalog_categories(company_id)
+        return render(request, 'temucosoft_app/catalogo.html', {
+            'company': company,
+            'products': page['products'],
+            'next_cursor': page['next_cursor'],
+            'is_first_page': cursor is None,
+            'categories': categories,
+            'category': category,
+            'catalog_version': catalog_version(company_id),
+            'cache_ttl': CATALOG_CACHE_TTL,
+        })
+
+    return _cached_shop_page(request, page_cache_key(company_id, 'list', category, cursor), build)
 
 
 def product_detail_view(request, pk):
-    return render(request, 'temucosoft_app/product_detail.html')
+    company_id = _shop_company_id(request)
+    if company_id is None:
+        raise Http404("Tienda no encontrada.")
+
+    def build():
+        company = _shop_company(company_id)
+        context = {'company': company, 'catalog_version': catalog_version(company_id), 'cache_ttl': CATALOG_CACHE_TTL}
+        with use_tenant_shard(company_id):
+            context['product'] = get_object_or_404(Product, pk=pk, company_id=company_id)
+            if getattr(request.user, 'role', None) in ('gerente', 'vendedor') and request.user.company_id == company_id:
+                context['stock'] = Inventory.objects.filter(product_id=pk).select_related('branch').order_by('branch__name')
+        return render(request, 'temucosoft_app/product_detail.html', context)
+
+    return _cached_shop_page(request, page_cache_key(company_id, 'product', pk), build)
 
 
 def cart_view(request):
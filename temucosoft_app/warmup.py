@@ -0,0 +1,143 @@
+"""
+Precalentamiento de procesos al arrancar (después de cada deploy).
+
+Sin esto, la primera petición de cada worker paga la resolución de URLs,
+la compilación de plantillas, la construcción de los campos de los
+serializers, la conexión a cada BD y un cache vacío. Las etapas:
+
+- Código (sin BD): 'urls', 'templates', 'serializers'. Corren en
+  TemucosoftAppConfig.ready() si WARMUP_ON_STARTUP es True; con
+  preload_app (gunicorn.conf.py) se hacen una vez en el master y los
+  workers heredan el resultado al hacer fork.
+- Por proceso: 'connections' (una conexión a cada alias; sirve con
+  CONN_MAX_AGE > 0) y 'caches' (shard y plan de las compañías con más
+  productos y la primera página de su catálogo). Corren en el hook
+  post_fork de gunicorn (gunicorn.conf.py): las conexiones no se pueden
+  compartir entre procesos, y el shard y el plan de cada compañía se
+  recuerdan en memoria de cada worker. El HTML del catálogo va al cache
+  compartido (settings.CACHES), así que solo el primer worker lo genera.
+
+`manage.py warmup` corre todas las etapas; con --bench compara el tiempo
+de arranque y de las primeras peticiones de un proceso frío y uno
+precalentado.
+"""
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CODE_STAGES = ('urls', 'templates', 'serializers')
+PROCESS_STAGES = ('connections', 'caches')
+WARMUP_TENANTS = getattr(settings, 'WARMUP_TENANTS', 10)
+
+
+def warm_urls():
+    """Importa las vistas y arma los patrones del resolver (y sus reverse)."""
+    from django.urls import get_resolver
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018 - construye las tablas de reverse()
+    return len(resolver.url_patterns)
+
+
+def warm_templates():
+    """Compila todas las plantillas de la app en el cached loader."""
+    from django.template import engines
+    from django.template.loader import get_template
+
+    names = set()
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for path in directory.rglob('*.html'):
+                names.add(path.relative_to(directory).as_posix())
+    compiled = 0
+    for name in sorted(names):
+        try:
+            get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.warning(f"Warm-up: no se pudo compilar {name}: {e}")
+    return compiled
+
+
+def warm_serializers():
+    """Construye los campos de cada serializer (introspección de modelos incluida)."""
+    from rest_framework import serializers as drf_serializers
+    from rest_framework.settings import api_settings
+
+    from . import serializers
+
+    built = 0
+    for value in vars(serializers).values():
+        if isinstance(value, type) and issubclass(value, drf_serializers.Serializer) \
+                and value.__module__ == serializers.__name__:
+            value().fields  # noqa: B018
+            built += 1
+    # Renderers, parsers y throttles configurados (se importan en la primera petición).
+    for classes in (api_settings.DEFAULT_RENDERER_CLASSES, api_settings.DEFAULT_PARSER_CLASSES,
+                    api_settings.DEFAULT_THROTTLE_CLASSES):
+        list(classes)
+    return built
+
+
+def warm_connections():
+    """Abre una conexión a cada BD configurada (control y shards)."""
+    from django.db import connections
+
+    opened = 0
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+            opened += 1
+        except Exception as e:
+            logger.warning(f"Warm-up: no se pudo conectar a '{alias}': {e}")
+    return opened
+
+
+def warm_caches(tenants=WARMUP_TENANTS):
+    """Shard, plan y primera página del catálogo de las compañías con más productos."""
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+
+    from .models import TenantUsage
+    from .tenancy import control_database, shard_for_company
+    from .throttling import plan_for_company
+    from .views import catalogo_list_view
+
+    company_ids = list(
+        TenantUsage.objects.using(control_database()).filter(company__is_active=True)
+        .order_by('-products').values_list('company_id', flat=True)[:tenants]
+    )
+    factory = RequestFactory()
+    for company_id in company_ids:
+        shard_for_company(company_id)
+        plan_for_company(company_id)
+        request = factory.get('/shop/products/', {'company': company_id})
+        request.user = AnonymousUser()
+        catalogo_list_view(request)
+    return len(company_ids)
+
+
+STAGES = {
+    'urls': warm_urls,
+    'templates': warm_templates,
+    'serializers': warm_serializers,
+    'connections': warm_connections,
+    'caches': warm_caches,
+}
+
+
+def warm_up(stages=CODE_STAGES + PROCESS_STAGES, tenants=WARMUP_TENANTS):
+    """Corre las etapas indicadas. Devuelve {etapa: (resultado, ms)}; un error no detiene las demás."""
+    timings = {}
+    for stage in stages:
+        start = time.perf_counter()
+        try:
+            result = warm_caches(tenants) if stage == 'caches' else STAGES[stage]()
+        except Exception as e:
+            logger.warning(f"Warm-up: falló la etapa '{stage}': {e}", exc_info=True)
+            result = None
+        timings[stage] = (result, (time.perf_counter() - start) * 1000)
+    logger.info("Warm-up: " + ', '.join(f"{s} {ms:.0f} ms" for s, (_, ms) in timings.items()))
+    return timings
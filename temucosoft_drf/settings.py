@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,10 +58,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'temucosoft_app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'temucosoft_app.middleware.TenantShardMiddleware',
+    'temucosoft_app.profiling.ProfilerMiddleware',
+    'temucosoft_app.slowqueries.QueryContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,8 +76,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'temucosoft_app' / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Plantillas compiladas una vez por proceso (en DEBUG se recargan al editarlas).
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -99,9 +110,90 @@ DATABASES = {
         'PASSWORD': '1234', # ¡MUY IMPORTANTE!
         'HOST': '172.31.72.50',  # IP Privada de la EC2-DB (ej: 172.31.72.50)
         'PORT': '5432',
+        # Conexiones persistentes por worker (las abre el warm-up en post_fork).
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Sharding por tenant (temucosoft_app.routers.TenantShardRouter)
+# CONTROL_DATABASE guarda Subscription/Company/CustomUser/Job; cada alias de
+# TENANT_SHARDS guarda los datos de las compañías cuyo Company.shard lo indique.
+# Para agregar un shard: definirlo en DATABASES, sumarlo a TENANT_SHARDS,
+# ejecutar `migrate --database=<alias>` y mover tenants con `move_tenant`.
+
+CONTROL_DATABASE = 'default'
+TENANT_SHARDS = ['default']
+DATABASE_ROUTERS = ['temucosoft_app.routers.TenantShardRouter']
+
+# Cache compartido por todos los procesos (workers de gunicorn, run_workers y
+# el proceso ASGI). Lo usan el throttling por plan, las versiones de
+# invalidación (cache_versions.py), el catálogo público y los reportes: un
+# cache por proceso (LocMemCache) multiplicaría los límites por el número de
+# workers y dejaría datos viejos en los demás procesos.
+# Por defecto es una tabla en la BD de control (`manage.py createcachetable`
+# en cada deploy; incr() atómico, ver cache_backends.py). Con REDIS_URL se
+# usa Redis (`pip install redis`), que evita una consulta por lectura.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'temucosoft_app.cache_backends.DatabaseCache',
+            'LOCATION': 'temucosoft_cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
     }
+
+# Django REST Framework
+# PlanRateThrottle aplica a todas las vistas de la API; ReportViewSet suma
+# ReportConcurrencyThrottle (ver temucosoft_app/throttling.py).
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'temucosoft_app.throttling.PlanRateThrottle',
+    ],
+    # Formatos compactos para los POS (Accept o ?format=msgpack / ?format=columnar).
+    # MessagePack requiere `pip install msgpack`; sin él se omite en la negociación.
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'temucosoft_app.renderers.MessagePackRenderer',
+        'temucosoft_app.renderers.ColumnarJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'temucosoft_app.renderers.MessagePackParser',
+        'temucosoft_app.renderers.ColumnarJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'temucosoft_app.renderers.CompactContentNegotiation',
 }
 
+# Límites por plan: peticiones por período y reportes simultáneos.
+TENANT_THROTTLE_RATES = {
+    'basico': {'requests': '60/min', 'reports': 1},
+    'estandar': {'requests': '300/min', 'reports': 3},
+    'premium': {'requests': '1200/min', 'reports': 8},
+    'sin_plan': {'requests': '30/min', 'reports': 1},
+}
+TENANT_PLAN_CACHE_TTL = 300
+# Segundos que cada proceso reutiliza el plan sin consultar el cache compartido
+# (demora máxima en aplicar un cambio de plan hecho desde otro proceso).
+TENANT_PLAN_LOCAL_TTL = 10
+# Segundos entre sincronizaciones de los buckets con el cache compartido (0 = solo local).
+TENANT_THROTTLE_SYNC_INTERVAL = 1
+# Reportes simultáneos contados en el cache compartido (entre todos los workers).
+# Con Redis es un INCR/DECR por reporte; con DatabaseCache serían varias idas a
+# la BD con bloqueo de fila, así que sin Redis cada proceso cuenta los suyos.
+TENANT_THROTTLE_SHARED_CONCURRENCY = bool(os.environ.get('REDIS_URL'))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,3 +238,61 @@ STATIC_ROOT = BASE_DIR / "staticfiles"  # Ejemplo: /var/www/html/TemucoSoftSA/st
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Trabajos en segundo plano (manage.py run_workers)
+JOBS_RESULT_DIR = BASE_DIR / 'var' / 'jobs'
+# Un trabajo en curso renueva locked_at cada JOBS_HEARTBEAT_INTERVAL segundos;
+# sin latido por JOBS_LOCK_TIMEOUT su worker se da por muerto.
+JOBS_HEARTBEAT_INTERVAL = 30
+JOBS_LOCK_TIMEOUT = 5 * 60
+JOBS_WORKER_PROCESSES = 1
+JOBS_WORKER_THREADS = 2
+
+# Particionado mensual y archivado (manage.py partitions)
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_RETENTION_MONTHS = 24
+ARCHIVE_DIR = BASE_DIR / 'var' / 'archive'
+
+# Outbox transaccional (manage.py dispatch_outbox)
+OUTBOX_SINKS = [
+    {'class': 'temucosoft_app.outbox.FileSink', 'options': {'path': BASE_DIR / 'var' / 'outbox' / 'events.ndjson'}},
+    # {'class': 'temucosoft_app.outbox.WebhookSink', 'options': {'url': 'http://127.0.0.1:9000/events/'}},
+]
+
+# Canal push de stock (SSE). /api/branches/<id>/stream/ se sirve desde el
+# proceso ASGI de gunicorn_stream.conf.py y las ventas se publican en los
+# workers WSGI: el backend debe repartir entre procesos (LISTEN/NOTIFY).
+# LocalBackend solo sirve con un único proceso (runserver).
+REALTIME_BACKEND = {'class': 'temucosoft_app.realtime.PostgresNotifyBackend'}
+# Bajo WSGI (sin el proceso ASGI) cada conexión SSE ocupa un worker y se
+# cierra tras estos segundos; debe ser menor que el timeout de gunicorn.
+STREAM_WSGI_MAX_SECONDS = 20
+
+# Perfilado bajo demanda (header X-Profile, solo super_admin)
+PROFILER_DIR = BASE_DIR / 'var' / 'profiles'
+PROFILER_MAX_ENTRIES = 50
+PROFILER_SAMPLE_INTERVAL = 0.005
+
+# Captura de consultas lentas (manage.py slow_queries). None desactiva la captura.
+SLOW_QUERY_THRESHOLD_MS = 500
+SLOW_QUERY_EXPLAIN_ANALYZE = False
+SLOW_QUERY_SAMPLES = 200
+
+# Reporte de valorización de inventario (manage.py snapshot_valuation)
+VALUATION_CACHE_TTL = 60 * 60
+
+# Reporte de proveedores (/api/reports/suppliers/), invalidado al registrar compras
+SUPPLIER_REPORT_CACHE_TTL = 60 * 60
+
+# Números de boleta que cada proceso reserva por sucursal (receipts.py)
+RECEIPT_BLOCK_SIZE = 50
+
+# Catálogo público (catalog.py): productos por página y TTL del HTML y fragmentos cacheados
+CATALOG_PAGE_SIZE = 24
+CATALOG_CACHE_TTL = 15 * 60
+
+# Warm-up al arrancar (warmup.py): gunicorn.conf.py activa TEMUCOSOFT_WARMUP
+# para el master; WARMUP_TENANTS son las compañías cuyo catálogo se precarga.
+WARMUP_ON_STARTUP = os.environ.get('TEMUCOSOFT_WARMUP') == '1'
+WARMUP_TENANTS = 10
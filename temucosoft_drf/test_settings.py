@@ -0,0 +1,40 @@
+"""
+Settings para las pruebas: `python manage.py test --settings=temucosoft_drf.test_settings`.
+
+SQLite local (sin el PostgreSQL de producción) con la BD de control
+('default') y dos shards de tenant, para probar el enrutamiento de
+TenantShardRouter y move_tenant.
+"""
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+
+TEST_DB_DIR = Path(tempfile.gettempdir())
+
+
+def _sqlite(alias):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_DB_DIR / f'temucosoft_{alias}.sqlite3',
+        # En archivo y no en memoria: las pruebas con hilos necesitan los bloqueos normales
+        # de SQLite (espera de `timeout` segundos) y no los de tabla del cache compartido.
+        'TEST': {'NAME': TEST_DB_DIR / f'test_temucosoft_{alias}.sqlite3'},
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 30},
+    }
+
+
+DATABASES = {
+    'default': _sqlite('default'),
+    'shard_a': _sqlite('shard_a'),
+    'shard_b': _sqlite('shard_b'),
+}
+CONTROL_DATABASE = 'default'
+TENANT_SHARDS = ['shard_a', 'shard_b']
+
+# Un solo proceso: cache en memoria, aislado por ejecución.
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+REALTIME_BACKEND = {'class': 'temucosoft_app.realtime.LocalBackend'}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -10,7 +10,9 @@ from rest_framework.routers import DefaultRouter
 from temucosoft_app.views import (
     UserViewSet, CompanyViewSet, ProductViewSet, BranchViewSet, 
     SupplierViewSet, PurchaseViewSet, SaleViewSet, ReportViewSet,  # 👈 Added ReportViewSet
-    CartViewSet # 👈 Added CartViewSet for checkout/add
+    CartViewSet, # 👈 Added CartViewSet for checkout/add
+    JobViewSet, EventViewSet, InventoryViewSet, StockTransferViewSet, ProfileViewSet,
+    SlowQueryViewSet
 )
 
 # Importa las vistas de templates (para login, dashboard, etc.)
@@ -27,13 +29,19 @@ router.register(r'companies', CompanyViewSet, basename='company')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'branches', BranchViewSet, basename='branch')
 router.register(r'suppliers', SupplierViewSet, basename='supplier')
+router.register(r'inventory', InventoryViewSet, basename='inventory')
 router.register(r'purchases', PurchaseViewSet, basename='purchase')
 router.register(r'sales', SaleViewSet, basename='sale')
+router.register(r'transfers', StockTransferViewSet, basename='transfer')
 router.register(r'reports', ReportViewSet, basename='report') # 👈 New: Reportes API
 
 # Nota: CartViewSet (para /api/cart/add/ y /api/cart/checkout/) se puede registrar aquí o 
 #       manejar como una acción separada, pero lo registramos para simplicidad.
 router.register(r'cart', CartViewSet, basename='cart') # 👈 New: Cart/Checkout API
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'events', EventViewSet, basename='event')
+router.register(r'profiles', ProfileViewSet, basename='profile')
+router.register(r'slow-queries', SlowQueryViewSet, basename='slow-query')
 
 
 urlpatterns = [
@@ -50,6 +58,8 @@ urlpatterns = [
     # =======================================================
     # 3. API Endpoints
     # =======================================================
+    # GET /api/branches/<id>/stream/ (Server-Sent Events de stock y ventas)
+    path('api/branches/<int:branch_id>/stream/', template_views.branch_stream_view, name='branch_stream'),
     path('api/', include(router.urls)), 
     
     # =======================================================